@@ -35,6 +35,7 @@
 
 #include <dlfcn.h>
 #include <stdbool.h>
+#include <pthread.h>
 #include <Python.h>
 
 #include "clixon_beh.h"
@@ -96,6 +97,20 @@ struct clixon_beh_plugin {
     const struct clixon_beh_api *api;
     void *cb_data;
 
+    /* Index of the namespace in the namespace table, -1 if none. */
+    int ns_index;
+
+    /*
+     * The xpaths this plugin provides state data for, with the
+     * namespace prefixes removed.  If there are none, the plugin is
+     * called based on its namespace.
+     */
+    char **state_prefixes;
+    unsigned int nr_state_prefixes;
+
+    /* Can statedata run in parallel with other plugins? */
+    bool thread_safe;
+
     struct clixon_beh_module *module;
 };
 
@@ -120,8 +135,21 @@ struct clixon_beh_trans {
     cxobj *new_xml;
     void *data;
 
-    /* Trees in the td that are changed, indexed by namespace. */
-    struct cvec *changed_trees;
+    /*
+     * Trees in the td that are changed, indexed by the namespace
+     * index.  Each entry is a cvec of sub-transactions, or NULL if
+     * nothing in that namespace changed.
+     */
+    cvec **changed_trees;
+    unsigned int nr_changed_trees;
+
+    /*
+     * The plugins that have something to do in this transaction, in
+     * plugin order.  This is worked out once in begin, so the other
+     * phases don't have to look at plugins that have nothing to do.
+     */
+    struct clixon_beh_plugin **active;
+    unsigned int nr_active;
 };
 
 void
@@ -149,7 +177,85 @@ clixon_beh_trans_new_xml(struct clixon_beh_trans *t)
 }
 
 static struct clixon_beh_plugin *plugins; /* Registered plugins */
-static cvec *plugin_ns_present; /* Vector of the namespaces registered. */
+
+/*
+ * The namespaces that plugins have registered.  Each namespace gets
+ * a small index number when it is first registered, and this hash
+ * table is used to look that up.  Transactions keep the changed
+ * trees in an array indexed by the number, so finding the changed
+ * trees for a plugin doesn't need a search.
+ */
+#define CLIXON_BEH_NS_HASH_SIZE 64
+struct clixon_beh_ns {
+    struct clixon_beh_ns *next;
+    char *namespace;
+    unsigned int index;
+};
+static struct clixon_beh_ns *ns_hash[CLIXON_BEH_NS_HASH_SIZE];
+static unsigned int ns_count;
+
+static unsigned int
+clixon_beh_ns_hashval(const char *namespace)
+{
+    unsigned int h = 5381;
+
+    while (*namespace)
+	h = h * 33 + (unsigned char) *namespace++;
+    return h % CLIXON_BEH_NS_HASH_SIZE;
+}
+
+static struct clixon_beh_ns *
+clixon_beh_ns_find(const char *namespace)
+{
+    struct clixon_beh_ns *n;
+
+    n = ns_hash[clixon_beh_ns_hashval(namespace)];
+    for (; n; n = n->next) {
+	if (strcmp(n->namespace, namespace) == 0)
+	    return n;
+    }
+    return NULL;
+}
+
+static struct clixon_beh_ns *
+clixon_beh_ns_add(const char *namespace)
+{
+    struct clixon_beh_ns *n;
+    unsigned int h;
+
+    n = clixon_beh_ns_find(namespace);
+    if (n)
+	return n;
+    n = calloc(1, sizeof(*n));
+    if (!n)
+	return NULL;
+    n->namespace = strdup(namespace);
+    if (!n->namespace) {
+	free(n);
+	return NULL;
+    }
+    n->index = ns_count++;
+    h = clixon_beh_ns_hashval(namespace);
+    n->next = ns_hash[h];
+    ns_hash[h] = n;
+    return n;
+}
+
+static void
+clixon_beh_ns_free_all(void)
+{
+    struct clixon_beh_ns *n;
+    unsigned int i;
+
+    for (i = 0; i < CLIXON_BEH_NS_HASH_SIZE; i++) {
+	while ((n = ns_hash[i]) != NULL) {
+	    ns_hash[i] = n->next;
+	    free(n->namespace);
+	    free(n);
+	}
+    }
+    ns_count = 0;
+}
 
 #define clixon_beh_next_plugin(p) \
     (NEXTQ(struct clixon_beh_plugin *, (p)) == plugins ? NULL :	\
@@ -180,8 +286,9 @@ clixon_beh_add_plugin(struct clixon_beh *beh,
 	goto out_err;
     }
 
+    p->ns_index = -1;
     if (namespace) {
-        cg_var *cv = cvec_find_var(plugin_ns_present, namespace);
+	struct clixon_beh_ns *n;
 
 	p->namespace = strdup(namespace);
 	if (!p->namespace) {
@@ -190,20 +297,12 @@ clixon_beh_add_plugin(struct clixon_beh *beh,
 	    goto out_err;
 	}
 
-	if (!cv) {
-            cv = cvec_add(plugin_ns_present, CGV_UINT32);
-            if (!cv) {
-		clixon_err(OE_CFG, 0,
-			   "Unable to allocate plugin namespace info");
-                goto out_err;
-            }
-            if (!cv_name_set(cv, namespace)) {
-		clixon_err(OE_CFG, 0,
-			   "Unable to set plugin namespace info");
-                goto out_err;
-            }
-        }
-        cv_uint32_set(cv, cv_uint32_get(cv) + 1);
+	n = clixon_beh_ns_add(namespace);
+	if (!n) {
+	    clixon_err(OE_CFG, 0, "Unable to allocate plugin namespace info");
+	    goto out_err;
+	}
+	p->ns_index = n->index;
     }
 
     p->beh = beh;
@@ -227,9 +326,111 @@ clixon_beh_add_plugin(struct clixon_beh *beh,
     return retval;
 }
 
+/*
+ * Return a copy of xpath with the namespace prefixes removed from the
+ * node and index names, so "/a:b[a:c='x:y']/a:d" becomes
+ * "/b[c='x:y']/d".  Quoted values are left alone.
+ */
+static char *
+clixon_beh_xpath_trim(const char *xpath)
+{
+    char *rv, *d;
+    const char *e;
+    char quote = 0;
+
+    rv = malloc(strlen(xpath) + 1);
+    if (!rv)
+	return NULL;
+    d = rv;
+    while (*xpath) {
+	if (quote) {
+	    if (*xpath == quote)
+		quote = 0;
+	    *d++ = *xpath++;
+	} else if (*xpath == '\'' || *xpath == '"') {
+	    quote = *xpath;
+	    *d++ = *xpath++;
+	} else if (*xpath == '/' || *xpath == '[') {
+	    *d++ = *xpath++;
+	    /* At the start of a name, skip any prefix. */
+	    e = xpath + strcspn(xpath, "/[]=:'\"");
+	    if (*e == ':')
+		xpath = e + 1;
+	} else {
+	    *d++ = *xpath++;
+	}
+    }
+    *d = '\0';
+    return rv;
+}
+
+/*
+ * See if one of the (trimmed) paths is the start of the other.  The
+ * match has to end on a path element, so "/a" overlaps "/a/b" and
+ * "/a[x='1']" but not "/ab".
+ */
+static bool
+clixon_beh_xpath_overlaps(const char *xpath, const char *prefix)
+{
+    size_t xlen = strlen(xpath), plen = strlen(prefix);
+
+    if (xlen >= plen)
+	return (strncmp(xpath, prefix, plen) == 0 &&
+		(xpath[plen] == '\0' || xpath[plen] == '/' ||
+		 xpath[plen] == '['));
+    return strncmp(prefix, xpath, xlen) == 0 && prefix[xlen] == '/';
+}
+
+int
+clixon_beh_plugin_add_state_prefix(struct clixon_beh_plugin *p,
+				   const char *prefix)
+{
+    char *path, **prefixes;
+    size_t len;
+
+    /* Allow a plain top-level node name, too. */
+    if (*prefix == '/') {
+	path = clixon_beh_xpath_trim(prefix);
+    } else if (clixon_beh_asprintf(&path, "/%s", prefix) >= 0) {
+	char *tmp = path;
+
+	path = clixon_beh_xpath_trim(tmp);
+	free(tmp);
+    } else {
+	path = NULL;
+    }
+    if (!path) {
+	clixon_err(OE_CFG, 0, "Unable to allocate plugin state prefix");
+	return -1;
+    }
+    len = strlen(path);
+    if (len > 1 && path[len - 1] == '/')
+	path[len - 1] = '\0';
+
+    prefixes = realloc(p->state_prefixes,
+		       (p->nr_state_prefixes + 1) * sizeof(char *));
+    if (!prefixes) {
+	free(path);
+	clixon_err(OE_CFG, 0, "Unable to allocate plugin state prefix");
+	return -1;
+    }
+    prefixes[p->nr_state_prefixes++] = path;
+    p->state_prefixes = prefixes;
+    return 0;
+}
+
+void
+clixon_beh_plugin_set_thread_safe(struct clixon_beh_plugin *p,
+				  bool thread_safe)
+{
+    p->thread_safe = thread_safe;
+}
+
 void
 clixon_beh_del_plugin(struct clixon_beh_plugin *p)
 {
+    unsigned int i;
+
     DELQ(p, plugins, struct clixon_beh_plugin *);
     if (p->api && p->api->exit)
 	p->api->exit(p);
@@ -237,6 +438,10 @@ clixon_beh_del_plugin(struct clixon_beh_plugin *p)
 	free(p->name);
     if (p->namespace)
 	free(p->namespace);
+    for (i = 0; i < p->nr_state_prefixes; i++)
+	free(p->state_prefixes[i]);
+    if (p->state_prefixes)
+	free(p->state_prefixes);
 
     if (p->module) {
 	p->module->refcount--;
@@ -284,28 +489,18 @@ xml_nsxml_fetch(cxobj *x)
 }
 
 static int
-nss_add_ns(cvec *nss, struct clixon_beh_trans *bt, const char *ns)
+nss_add_ns(struct clixon_beh_trans *obt, struct clixon_beh_trans *bt,
+	   struct clixon_beh_ns *n)
 {
     cg_var *var;
     cvec *xnvec;
 
-    var = cvec_find_var(nss, ns);
-    if (!var) {
+    xnvec = obt->changed_trees[n->index];
+    if (!xnvec) {
         xnvec = cvec_new(0);
         if (!xnvec)
             return -1;
-        var = cvec_add(nss, CGV_VOID);
-        if (!var) {
-            cvec_free(xnvec);
-            return -1;
-        }
-        if (!cv_name_set(var, ns)) {
-            cvec_free(xnvec);
-            return -1;
-        }
-        cv_void_set(var, xnvec);
-    } else {
-        xnvec = cv_void_get(var);
+        obt->changed_trees[n->index] = xnvec;
     }
     var = cvec_add(xnvec, CGV_VOID);
     if (!var)
@@ -315,6 +510,38 @@ nss_add_ns(cvec *nss, struct clixon_beh_trans *bt, const char *ns)
     return 0;
 }
 
+static void clixon_beh_trans_free(struct clixon_beh_trans *bt);
+
+static void
+bt_free_changed_trees(struct clixon_beh_trans *bt)
+{
+    unsigned int i;
+
+    if (!bt->changed_trees)
+	return;
+    for (i = 0; i < bt->nr_changed_trees; i++) {
+	cvec *vec2 = bt->changed_trees[i];
+	cg_var *var2 = NULL;
+
+	if (!vec2)
+	    continue;
+	while ((var2 = cvec_each(vec2, var2)) != NULL) {
+	    struct clixon_beh_trans *bt2 = cv_void_get(var2);
+	    /*
+	     * Sub-transactions all have pointers into the main
+	     * transaction, so there is no need to free anything
+	     * unless we called xml_diff on it, and then just the
+	     * parts it allocated.
+	     */
+	    clixon_beh_trans_free(bt2);
+	}
+	cvec_free(vec2);
+    }
+    free(bt->changed_trees);
+    bt->changed_trees = NULL;
+    bt->nr_changed_trees = 0;
+}
+
 static void
 clixon_beh_trans_free(struct clixon_beh_trans *bt)
 {
@@ -328,42 +555,26 @@ clixon_beh_trans_free(struct clixon_beh_trans *bt)
     if (bt->tcvec)
         free(bt->tcvec);
 #endif
-    if (bt->changed_trees) {
-        cg_var *var = NULL;
-
-        while ((var = cvec_each(bt->changed_trees, var)) != NULL) {
-            cvec *vec2 = cv_void_get(var);
-            cg_var *var2 = NULL;
-
-            while ((var2 = cvec_each(vec2, var2)) != NULL) {
-                struct clixon_beh_trans *bt2 = cv_void_get(var2);
-                /*
-                 * Sub-transactions all have pointers into the main
-                 * transaction, so there is no need to free anything
-                 * unless we called xml_diff on it, and then just the
-                 * parts it allocated.
-                 */
-                clixon_beh_trans_free(bt2);
-            }
-            cvec_free(vec2);
-        }
-        cvec_free(bt->changed_trees);
-    }
+    bt_free_changed_trees(bt);
+    if (bt->active)
+	free(bt->active);
     free(bt);
 }
 
-static cvec *
+static int
 bt_find_changed_namespaces(struct clixon_beh_trans *obt)
 {
-    cvec  *nss;
     cxobj *xnorig = NULL, *xnnew = NULL;
     char  *ns;
     char  *ns2;
+    struct clixon_beh_ns *n = NULL;
     struct clixon_beh_trans *bt = NULL;
 
-    nss = cvec_new(0);
-    if (!nss)
-        return NULL;
+    /* Always allocate at least one so NULL means failure. */
+    obt->changed_trees = calloc(ns_count ? ns_count : 1, sizeof(cvec *));
+    if (!obt->changed_trees)
+        return -1;
+    obt->nr_changed_trees = ns_count;
 
     if (obt->orig_xml)
 	xnorig = xml_child_each(obt->orig_xml, NULL, CX_ELMNT);
@@ -373,7 +584,7 @@ bt_find_changed_namespaces(struct clixon_beh_trans *obt)
         if (xnorig && xml_flag(xnorig, XML_FLAG_DEL)) {
             ns = xml_nsxml_fetch(xnorig);
             if (ns) {
-		if (cvec_find_var(plugin_ns_present, ns)) {
+		if ((n = clixon_beh_ns_find(ns)) != NULL) {
 		    if ((bt = calloc(1, sizeof(*bt))) == NULL)
 			goto fail;
 		    bt->orig_xml = xnorig;
@@ -389,7 +600,7 @@ bt_find_changed_namespaces(struct clixon_beh_trans *obt)
         } else if (xnnew && xml_flag(xnnew, XML_FLAG_ADD)) {
             ns = xml_nsxml_fetch(xnnew);
             if (ns) {
-		if (cvec_find_var(plugin_ns_present, ns)) {
+		if ((n = clixon_beh_ns_find(ns)) != NULL) {
 		    if ((bt = calloc(1, sizeof(*bt))) == NULL)
 			goto fail;
 		    bt->new_xml = xnnew;
@@ -417,7 +628,7 @@ bt_find_changed_namespaces(struct clixon_beh_trans *obt)
 			clixon_err(OE_XML, EINVAL, "xnorig/xnnew ns mismatch");
 			goto fail;
 		    }
-		    if (cvec_find_var(plugin_ns_present, ns)) {
+		    if ((n = clixon_beh_ns_find(ns)) != NULL) {
 			if ((bt = calloc(1, sizeof(*bt))) == NULL)
 			    goto fail;
 			bt->orig_xml = xnorig;
@@ -443,18 +654,18 @@ bt_find_changed_namespaces(struct clixon_beh_trans *obt)
                 xnnew = xml_child_each(obt->new_xml, xnnew, CX_ELMNT);
         }
         if (bt) {
-            if (nss_add_ns(nss, bt, ns) < 0)
+            if (nss_add_ns(obt, bt, n) < 0)
                 goto fail;
             bt = NULL;
         }
     }
 
-    return nss;
+    return 0;
  fail:
     if (bt)
         clixon_beh_trans_free(bt);
-    cvec_free(nss);
-    return NULL;
+    bt_free_changed_trees(obt);
+    return -1;
 }
 
 static int
@@ -468,12 +679,13 @@ clixon_beh_trans_call_one(struct clixon_beh_plugin *p,
 	return 0;
 
     if (p->namespace) {
-        cg_var *cv = cvec_find_var(bt->changed_trees, p->namespace);
-        cvec *vec;
+        cg_var *cv = NULL;
+        cvec *vec = NULL;
 
-        if (cv) {
-            vec = cv_void_get(cv);
-            cv = NULL;
+        /* A plugin added after the transaction started won't be there. */
+        if ((unsigned int) p->ns_index < bt->nr_changed_trees)
+            vec = bt->changed_trees[p->ns_index];
+        if (vec) {
             while ((cv = cvec_each(vec, cv)) != NULL) {
                 bt = cv_void_get(cv);
                 retval = fn(p, bt);
@@ -487,10 +699,49 @@ clixon_beh_trans_call_one(struct clixon_beh_plugin *p,
     return retval;
 }
 
+/*
+ * A plugin has something to do in a transaction if it gets
+ * everything (no namespace) or something in its namespace changed.
+ */
+static bool
+clixon_beh_plugin_active(struct clixon_beh_plugin *p,
+			 struct clixon_beh_trans *bt)
+{
+    if (!p->api)
+	return false;
+    if (!p->namespace)
+	return true;
+    return ((unsigned int) p->ns_index < bt->nr_changed_trees &&
+	    bt->changed_trees[p->ns_index]);
+}
+
+static int
+bt_find_active_plugins(struct clixon_beh_trans *bt)
+{
+    struct clixon_beh_plugin *p;
+    unsigned int count = 0;
+
+    clixon_beh_for_each_plugin(p)
+	count++;
+    /* Always allocate at least one so NULL means failure. */
+    bt->active = calloc(count ? count : 1, sizeof(*bt->active));
+    if (!bt->active)
+	return -1;
+    clixon_beh_for_each_plugin(p) {
+	if (clixon_beh_plugin_active(p, bt))
+	    bt->active[bt->nr_active++] = p;
+    }
+    return 0;
+}
+
+#define clixon_beh_for_each_active_plugin(bt, i, p) \
+    for ((i) = 0; (i) < (bt)->nr_active && ((p) = (bt)->active[i]); (i)++)
+
 static int
 clixon_beh_begin(clixon_handle h, transaction_data td)
 {
     int rv = 0;
+    unsigned int i;
     struct clixon_beh_plugin *p;
     struct clixon_beh_trans *bt;
 
@@ -501,14 +752,18 @@ clixon_beh_begin(clixon_handle h, transaction_data td)
     }
     bt->orig_xml = transaction_src(td);
     bt->new_xml = transaction_target(td);
-    bt->changed_trees = bt_find_changed_namespaces(bt);
-    if (!bt->changed_trees) {
+    if (bt_find_changed_namespaces(bt) < 0) {
 	free(bt);
 	return -1;
     }
+    if (bt_find_active_plugins(bt) < 0) {
+	clixon_err(OE_XML, 0, "Out of memory");
+	clixon_beh_trans_free(bt);
+	return -1;
+    }
     transaction_arg_set(td, bt);
 
-    clixon_beh_for_each_plugin(p) {
+    clixon_beh_for_each_active_plugin(bt, i, p) {
 	if (p->api)
 	    rv = clixon_beh_trans_call_one(p, p->api->begin, bt);
 	if (rv < 0)
@@ -522,10 +777,11 @@ static int
 clixon_beh_end(clixon_handle h, transaction_data td)
 {
     int rv = 0;
+    unsigned int i;
     struct clixon_beh_plugin *p;
     struct clixon_beh_trans *bt = transaction_arg(td);
 
-    clixon_beh_for_each_plugin(p) {
+    clixon_beh_for_each_active_plugin(bt, i, p) {
 	if (p->api)
 	    rv = clixon_beh_trans_call_one(p, p->api->end, bt);
 	if (rv < 0)
@@ -540,10 +796,11 @@ static int
 clixon_beh_validate(clixon_handle h, transaction_data td)
 {
     int rv = 0;
+    unsigned int i;
     struct clixon_beh_plugin *p;
     struct clixon_beh_trans *bt = transaction_arg(td);
 
-    clixon_beh_for_each_plugin(p) {
+    clixon_beh_for_each_active_plugin(bt, i, p) {
 	if (p->api)
 	    rv = clixon_beh_trans_call_one(p, p->api->validate, bt);
 	if (rv < 0)
@@ -557,10 +814,11 @@ static int
 clixon_beh_complete(clixon_handle h, transaction_data td)
 {
     int rv = 0;
+    unsigned int i;
     struct clixon_beh_plugin *p;
     struct clixon_beh_trans *bt = transaction_arg(td);
 
-    clixon_beh_for_each_plugin(p) {
+    clixon_beh_for_each_active_plugin(bt, i, p) {
 	if (p->api)
 	    rv = clixon_beh_trans_call_one(p, p->api->complete, bt);
 	if (rv < 0)
@@ -574,10 +832,11 @@ static int
 clixon_beh_commit(clixon_handle h, transaction_data td)
 {
     int rv = 0;
+    unsigned int i;
     struct clixon_beh_plugin *p;
     struct clixon_beh_trans *bt = transaction_arg(td);
 
-    clixon_beh_for_each_plugin(p) {
+    clixon_beh_for_each_active_plugin(bt, i, p) {
 	if (p->api)
 	    rv = clixon_beh_trans_call_one(p, p->api->commit, bt);
 	if (rv < 0)
@@ -591,10 +850,11 @@ static int
 clixon_beh_commit_done(clixon_handle h, transaction_data td)
 {
     int rv = 0;
+    unsigned int i;
     struct clixon_beh_plugin *p;
     struct clixon_beh_trans *bt = transaction_arg(td);
 
-    clixon_beh_for_each_plugin(p) {
+    clixon_beh_for_each_active_plugin(bt, i, p) {
 	if (p->api)
 	    rv = clixon_beh_trans_call_one(p, p->api->commit_done, bt);
 	if (rv < 0)
@@ -608,10 +868,11 @@ static int
 clixon_beh_revert(clixon_handle h, transaction_data td)
 {
     int rv = 0;
+    unsigned int i;
     struct clixon_beh_plugin *p;
     struct clixon_beh_trans *bt = transaction_arg(td);
 
-    clixon_beh_for_each_plugin(p) {
+    clixon_beh_for_each_active_plugin(bt, i, p) {
 	if (p->api)
 	    rv = clixon_beh_trans_call_one(p, p->api->revert, bt);
 	if (rv < 0)
@@ -625,13 +886,14 @@ static int
 clixon_beh_abort(clixon_handle h, transaction_data td)
 {
     int rv = 0;
+    unsigned int i;
     struct clixon_beh_plugin *p;
     struct clixon_beh_trans *bt = transaction_arg(td);
 
     if (!bt)
 	return 0;
 
-    clixon_beh_for_each_plugin(p) {
+    clixon_beh_for_each_active_plugin(bt, i, p) {
 	if (p->api)
 	    rv = clixon_beh_trans_call_one(p, p->api->abort, bt);
 	if (rv < 0)
@@ -654,44 +916,199 @@ clixon_beh_find_namespace(cvec *nsc, char *ns)
     return false;
 }
 
+/*
+ * Decide if plugin p should be asked for state data for xpath, and
+ * return the path to pass it in callpath.  Everything gets called
+ * for "/".  Otherwise a plugin with a namespace is only called if
+ * its namespace is in nsc.  The prefixes are stripped from txpath,
+ * so the names alone may match another module's nodes.  Plugins
+ * that have state prefixes are also only called if the path
+ * overlaps one of them, and get the trimmed path (txpath).
+ */
+static bool
+clixon_beh_state_wanted(struct clixon_beh_plugin *p, cvec *nsc,
+			char *xpath, char *txpath, char **callpath)
+{
+    unsigned int i;
+
+    *callpath = xpath;
+    if (strcmp(xpath, "/") == 0)
+	return true;
+    if (p->namespace && !clixon_beh_find_namespace(nsc, p->namespace))
+	return false;
+    if (p->nr_state_prefixes) {
+	for (i = 0; i < p->nr_state_prefixes; i++) {
+	    if (clixon_beh_xpath_overlaps(txpath, p->state_prefixes[i])) {
+		*callpath = txpath;
+		return true;
+	    }
+	}
+	return false;
+    }
+    return true;
+}
+
+/*
+ * One plugin's part of a state data request.  When running in
+ * parallel, each plugin writes into its own xtop and they are merged
+ * into the real one in plugin order at the end.
+ */
+struct clixon_beh_state_job {
+    struct clixon_beh_plugin *p;
+    clixon_beh_statedata_cb fn;
+    cvec *nsc;
+    char *xpath;
+    cxobj *xtop;
+    int rv;
+    pthread_t thread;
+    bool threaded;
+};
+
+static void *
+clixon_beh_state_thread(void *arg)
+{
+    struct clixon_beh_state_job *job = arg;
+
+    job->rv = job->fn(job->p, job->nsc, job->xpath, job->xtop);
+    return NULL;
+}
+
+/* Move all the children of from to the end of xtop. */
 static int
-clixon_beh_statedata(clixon_handle h, cvec *nsc, char *xpath, cxobj *xtop)
+clixon_beh_state_merge(cxobj *xtop, cxobj *from)
 {
-    int rv = 0;
-    struct clixon_beh_plugin *p = plugins;
+    cxobj *c;
 
-    clixon_beh_for_each_plugin(p) {
-	rv = 0;
-	if (p->api && p->api->statedata &&
-		(!p->namespace || clixon_beh_find_namespace(nsc, p->namespace)
-		 || strcmp(xpath, "/") == 0))
-	    rv = p->api->statedata(p, nsc, xpath, xtop);
-	if (rv < 0)
-	    break;
+    while ((c = xml_child_i(from, 0)) != NULL) {
+	if (xml_addsub(xtop, c) < 0)
+	    return -1;
     }
-
-    return rv;
+    return 0;
 }
 
+/*
+ * Call the statedata (or system_only) function of every plugin that
+ * wants xpath.  If more than one of them is thread safe, those are
+ * run at the same time in their own threads, so the time taken is
+ * the longest of them instead of the sum.  The GIL is released while
+ * waiting so python plugins can run.  Plugins that aren't thread
+ * safe are run afterwards in this thread, and the results are added
+ * to xtop in plugin order, the same as when run serially.
+ */
 static int
-clixon_beh_system_only(clixon_handle h, cvec *nsc, char *xpath, cxobj *xtop)
+clixon_beh_state_call(cvec *nsc, char *xpath, cxobj *xtop, bool system_only)
 {
     int rv = 0;
-    struct clixon_beh_plugin *p = plugins;
+    struct clixon_beh_plugin *p;
+    struct clixon_beh_state_job *jobs = NULL;
+    unsigned int i, nr_jobs = 0, nr_thread_safe = 0;
+    char *txpath, *callpath;
+    clixon_beh_statedata_cb fn;
+    PyThreadState *ts = NULL;
+
+    txpath = clixon_beh_xpath_trim(xpath);
+    if (!txpath) {
+	clixon_err(OE_XML, 0, "Out of memory");
+	return -1;
+    }
+    clixon_beh_for_each_plugin(p)
+	nr_jobs++;
+    jobs = calloc(nr_jobs ? nr_jobs : 1, sizeof(*jobs));
+    if (!jobs) {
+	clixon_err(OE_XML, 0, "Out of memory");
+	free(txpath);
+	return -1;
+    }
 
+    nr_jobs = 0;
     clixon_beh_for_each_plugin(p) {
-	rv = 0;
-	if (p->api && p->api->system_only &&
-		(!p->namespace || clixon_beh_find_namespace(nsc, p->namespace)
-		 || strcmp(xpath, "/") == 0))
-	    rv = p->api->system_only(p, nsc, xpath, xtop);
-	if (rv < 0)
+	if (!p->api)
+	    continue;
+	fn = system_only ? p->api->system_only : p->api->statedata;
+	if (!fn || !clixon_beh_state_wanted(p, nsc, xpath, txpath, &callpath))
+	    continue;
+	jobs[nr_jobs].p = p;
+	jobs[nr_jobs].fn = fn;
+	jobs[nr_jobs].nsc = nsc;
+	jobs[nr_jobs].xpath = callpath;
+	jobs[nr_jobs].xtop = xtop;
+	if (p->thread_safe)
+	    nr_thread_safe++;
+	nr_jobs++;
+    }
+
+    if (nr_thread_safe < 2) {
+	/* Nothing to gain from threads, just call them in order. */
+	for (i = 0; i < nr_jobs; i++) {
+	    rv = jobs[i].fn(jobs[i].p, nsc, jobs[i].xpath, xtop);
+	    if (rv < 0)
+		break;
+	}
+	goto out;
+    }
+
+    for (i = 0; i < nr_jobs; i++) {
+	jobs[i].xtop = xml_new("top", NULL, CX_ELMNT);
+	if (!jobs[i].xtop) {
+	    clixon_err(OE_XML, 0, "Out of memory");
+	    rv = -1;
+	    goto out;
+	}
+    }
+
+    if (python_initialized)
+	ts = PyEval_SaveThread();
+    for (i = 0; i < nr_jobs; i++) {
+	if (!jobs[i].p->thread_safe)
+	    continue;
+	/* If the thread can't be started it is just run below. */
+	jobs[i].threaded = pthread_create(&jobs[i].thread, NULL,
+					  clixon_beh_state_thread,
+					  &jobs[i]) == 0;
+    }
+    for (i = 0; i < nr_jobs; i++) {
+	if (jobs[i].threaded)
+	    pthread_join(jobs[i].thread, NULL);
+    }
+    if (ts)
+	PyEval_RestoreThread(ts);
+
+    for (i = 0; i < nr_jobs; i++) {
+	if (!jobs[i].threaded)
+	    clixon_beh_state_thread(&jobs[i]);
+	if (jobs[i].rv < 0) {
+	    rv = jobs[i].rv;
+	    break;
+	}
+	if (clixon_beh_state_merge(xtop, jobs[i].xtop) < 0) {
+	    rv = -1;
 	    break;
+	}
+    }
+
+ out:
+    for (i = 0; i < nr_jobs; i++) {
+	if (jobs[i].xtop && jobs[i].xtop != xtop)
+	    xml_free(jobs[i].xtop);
     }
+    free(jobs);
+    free(txpath);
 
     return rv;
 }
 
+static int
+clixon_beh_statedata(clixon_handle h, cvec *nsc, char *xpath, cxobj *xtop)
+{
+    return clixon_beh_state_call(nsc, xpath, xtop, false);
+}
+
+static int
+clixon_beh_system_only(clixon_handle h, cvec *nsc, char *xpath, cxobj *xtop)
+{
+    return clixon_beh_state_call(nsc, xpath, xtop, true);
+}
+
 static int
 clixon_beh_exit(clixon_handle h)
 {
@@ -735,8 +1152,7 @@ clixon_beh_exit(clixon_handle h)
 
     if (beh)
 	free(beh);
-    if (plugin_ns_present)
-	cvec_free(plugin_ns_present);
+    clixon_beh_ns_free_all();
     return 0;
 }
 
@@ -1151,12 +1567,6 @@ clixon_plugin_init(clixon_handle h) {
     }
     beh->h = h;
 
-    plugin_ns_present = cvec_new(0);
-    if (!plugin_ns_present) {
-	clixon_err(OE_CFG, 0, "Can't allocate plugin_ns_present");
-	goto out_err;
-    }
-
     cfgdir = clicon_option_str(h, "CLICON_CONFIGDIR");
     if (!cfgdir) {
 	clixon_err(OE_CFG, 0, "CLICON_CONFIGDIR not set");
@@ -1210,8 +1620,8 @@ clixon_plugin_init(clixon_handle h) {
     rapi = &api;
 
  out_err:
-    if (!rapi && plugin_ns_present)
-	cvec_free(plugin_ns_present);
+    if (!rapi)
+	clixon_beh_ns_free_all();
     if (xconfig)
         xml_free(xconfig);
     if (yspec)
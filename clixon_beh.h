@@ -38,6 +38,7 @@
 
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdbool.h>
 #include <stdint.h>
 #include <inttypes.h>
 #include <string.h>
@@ -102,6 +103,27 @@ int clixon_beh_add_plugin(struct clixon_beh *h,
 			  struct clixon_beh_plugin **p);
 void clixon_beh_del_plugin(struct clixon_beh_plugin *p);
 
+/*
+ * Declare an xpath (like "/interfaces-state") or top-level node name
+ * that the plugin provides state data for.  A plugin that declares
+ * any is only called for state data when the requested xpath overlaps
+ * one of them (or is "/"), and gets the xpath with the namespace
+ * prefixes removed.
+ */
+int clixon_beh_plugin_add_state_prefix(struct clixon_beh_plugin *p,
+				       const char *prefix);
+
+/*
+ * Mark the plugin's statedata and system_only functions as safe to
+ * call in their own thread at the same time as other plugins.  When
+ * more than one plugin that wants a get is thread safe, they are
+ * run in parallel.  They must not use clixon functions that aren't
+ * thread safe, like the XML parser, except with the python GIL held
+ * (python plugins handle this automatically).
+ */
+void clixon_beh_plugin_set_thread_safe(struct clixon_beh_plugin *p,
+				       bool thread_safe);
+
 void *clixon_beh_plugin_get_cb_data(struct clixon_beh_plugin *p);
 
 #define CLIXON_BEH_NAMESPACE "http://mvista.com/clixon-beh/config"
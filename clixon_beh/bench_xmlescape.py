@@ -0,0 +1,112 @@
+#
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (C) 2024 MontaVista Software, LLC <source@mvista.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Alternatively, the contents of this file may be used under the terms of
+# the GNU General Public License Version 3 or later (the "GPL"),
+# in which case the provisions of the GPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of the GPL, and not to allow others to
+# use your version of this file under the terms of Apache License version 2,
+# indicate your decision by deleting the provisions above and replace them with
+# the notice and other provisions required by the GPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the Apache License version 2 or the GPL.
+#
+# ***** END LICENSE BLOCK *****
+#
+
+"""Micro-benchmark for xmlescape().  This compares the xmlescape() in
+transaction_framework.py against the old version that always did the
+chained replaces and against a single-pass str.translate().
+
+transaction_framework needs the clixon_beh C module to import, so
+the function is pulled out of the source file instead of importing
+it.  That way this runs with a plain python3 from the source tree:
+
+    python3 clixon_beh/bench_xmlescape.py
+
+This is not installed.
+
+"""
+
+import ast
+import os
+import timeit
+
+def load_xmlescape():
+    fname = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "transaction_framework.py")
+    with open(fname) as f:
+        tree = ast.parse(f.read(), fname)
+        pass
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == "xmlescape":
+            ns = {}
+            exec(compile(ast.Module(body=[node], type_ignores=[]),
+                         fname, "exec"), ns)
+            return ns["xmlescape"]
+        pass
+    raise Exception("xmlescape not found in " + fname)
+
+def xmlescape_replace(xmlstr):
+    xmlstr = xmlstr.replace("&", "&amp;")
+    xmlstr = xmlstr.replace("<", "&lt;")
+    xmlstr = xmlstr.replace(">", "&gt;")
+    xmlstr = xmlstr.replace("\"", "&quot;")
+    xmlstr = xmlstr.replace("'", "&apos;")
+    return xmlstr
+
+xmltable = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;",
+                          "\"": "&quot;", "'": "&apos;"})
+
+def xmlescape_translate(xmlstr):
+    return xmlstr.translate(xmltable)
+
+values = [
+    "12345678",
+    "fe80::1/64",
+    "true",
+    "Uplink to the distribution switch, rack 4",
+    "a<b&c'd",
+]
+
+def bench(fn, v, number, repeat):
+    t = min(timeit.repeat(lambda : fn(v), number=number, repeat=repeat))
+    return t / number * 1e9
+
+def main(number=500000, repeat=5):
+    fns = [("current", load_xmlescape()),
+           ("replace", xmlescape_replace),
+           ("translate", xmlescape_translate)]
+    for (name, fn) in fns:
+        for v in values:
+            if fn(v) != xmlescape_replace(v):
+                raise Exception(name + " gives the wrong result for " + v)
+            pass
+        pass
+    print("ns per call, best of %d x %d calls" % (repeat, number))
+    print("%-44s" % "value" + "".join("%12s" % name for (name, fn) in fns))
+    for v in values:
+        print("%-44s" % repr(v) +
+              "".join("%12.0f" % bench(fn, v, number, repeat)
+                      for (name, fn) in fns))
+        pass
+    return
+
+if __name__ == "__main__":
+    main()
+    pass
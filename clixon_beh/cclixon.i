@@ -52,6 +52,11 @@ struct xmlobj {
     unsigned int refcount;
     struct xmlobj *orig_ref;
     cxobj *xml;
+    /*
+     * Set in orig_ref if the tree was created by new_xml_tree(), it
+     * belongs to us and can be added to.
+     */
+    bool writable;
 };
 
 static struct xmlobj *
@@ -70,12 +75,17 @@ xmlobj_new(struct xmlobj *orig_ref, cxobj *xml)
     return rv;
 }
 
+/*
+ * Drop a reference to the tree.  Only trees from new_xml_tree()
+ * belong to us, the others belong to clixon and are never freed here.
+ */
 static void
 free_xmlobj(struct xmlobj *x)
 {
     x->orig_ref->refcount--;
     if (x->orig_ref->refcount == 0) {
-	xml_free(x->orig_ref->xml);
+	if (x->orig_ref->writable)
+	    xml_free(x->orig_ref->xml);
 	if (x != x->orig_ref)
 	    free(x->orig_ref);
 	free(x);
@@ -85,6 +95,220 @@ free_xmlobj(struct xmlobj *x)
     }
 }
 
+/*
+ * Create an owned python object for a child xmlobj.  These are used
+ * for every child in a validate, so python frees them when it's done
+ * with them, which drops the reference to the tree.
+ */
+static PyObject *
+xmlobj_child_pyobj(struct xmlobj *orig_ref, cxobj *xml)
+{
+    struct xmlobj *x;
+
+    x = xmlobj_new(orig_ref, xml);
+    if (!x) {
+	PyErr_Format(PyExc_RuntimeError, "Unable to allocate xmlobj");
+	return NULL;
+    }
+    return SWIG_NewPointerObj(SWIG_as_voidptr(x), SWIGTYPE_p_xmlobj,
+			      SWIG_POINTER_OWN);
+}
+
+/*
+ * Add an element named name to parent (which may be NULL), with an
+ * xmlns attribute if ns is set and a body if body is set.  Sets a
+ * python exception and returns NULL on failure.
+ */
+static cxobj *
+xmlobj_add_elem(cxobj *parent, const char *name, const char *ns,
+		const char *body)
+{
+    cxobj *c, *b;
+
+    c = xml_new(name, parent, CX_ELMNT);
+    if (!c)
+	goto out_err;
+    if (ns && !xml_add_attr(c, "xmlns", ns, NULL, NULL))
+	goto out_err;
+    if (body) {
+	b = xml_new("body", c, CX_BODY);
+	if (!b || xml_value_set(b, body) < 0)
+	    goto out_err;
+    }
+    return c;
+
+ out_err:
+    PyErr_Format(PyExc_RuntimeError, "Unable to add xml element %s", name);
+    if (c) {
+	if (parent)
+	    xml_purge(c);
+	else
+	    xml_free(c);
+    }
+    return NULL;
+}
+
+/*
+ * Return an owned python object for a new element in a tree created
+ * by new_xml_tree().  These are freed when python is done with them,
+ * and the tree is freed when the last one goes away.
+ */
+static PyObject *
+xmlobj_built_pyobj(struct xmlobj *orig_ref, cxobj *xml)
+{
+    struct xmlobj *x;
+
+    x = xmlobj_new(orig_ref, xml);
+    if (!x) {
+	PyErr_Format(PyExc_RuntimeError, "Unable to allocate xmlobj");
+	return NULL;
+    }
+    return SWIG_NewPointerObj(SWIG_as_voidptr(x), SWIGTYPE_p_xmlobj,
+			      SWIG_POINTER_OWN);
+}
+
+/*
+ * Add the xml in the nested tuple form to parent.  The form is
+ * (name, content) or (name, content, namespace), where content is
+ * None for an empty element, a string for the body, or a list of
+ * the same kind of tuples for the children.
+ */
+static int
+xmlobj_add_tuple(cxobj *parent, PyObject *t)
+{
+    PyObject *content, *nso;
+    const char *name, *ns = NULL, *body = NULL;
+    Py_ssize_t i;
+    cxobj *c;
+
+    if (!PyTuple_Check(t) ||
+	    (PyTuple_GET_SIZE(t) != 2 && PyTuple_GET_SIZE(t) != 3)) {
+	PyErr_Format(PyExc_TypeError,
+		     "xml tuple must be (name, content[, namespace])");
+	return -1;
+    }
+    name = PyUnicode_AsUTF8(PyTuple_GET_ITEM(t, 0));
+    if (!name)
+	return -1;
+    if (PyTuple_GET_SIZE(t) == 3) {
+	nso = PyTuple_GET_ITEM(t, 2);
+	if (nso != Py_None) {
+	    ns = PyUnicode_AsUTF8(nso);
+	    if (!ns)
+		return -1;
+	}
+    }
+    content = PyTuple_GET_ITEM(t, 1);
+    if (PyUnicode_Check(content)) {
+	body = PyUnicode_AsUTF8(content);
+	if (!body)
+	    return -1;
+    } else if (content != Py_None && !PyList_Check(content)) {
+	PyErr_Format(PyExc_TypeError, "content of xml element %s must be "
+		     "None, a string, or a list", name);
+	return -1;
+    }
+    c = xmlobj_add_elem(parent, name, ns, body);
+    if (!c)
+	return -1;
+    if (PyList_Check(content)) {
+	for (i = 0; i < PyList_GET_SIZE(content); i++) {
+	    if (xmlobj_add_tuple(c, PyList_GET_ITEM(content, i)) < 0)
+		return -1;
+	}
+    }
+    return 0;
+}
+
+#define XMLOBJ_CHANGE_FLAGS (XML_FLAG_ADD | XML_FLAG_DEL | XML_FLAG_CHANGE)
+
+/*
+ * Append a (path, flags, xmlobj) tuple to list for every element
+ * child of xml that has the add, del, or change flag set, then
+ * descend into the ones with the change flag.  Children without
+ * any of those flags are skipped without creating any python
+ * objects for them.
+ */
+static int
+xmlobj_add_changes(PyObject *list, struct xmlobj *orig_ref, cxobj *xml,
+		   PyObject *prefix)
+{
+    PyObject *o, *path, *t;
+    cxobj *c = NULL;
+    int flags, rv;
+
+    while ((c = xml_child_each(xml, c, CX_ELMNT)) != NULL) {
+	flags = xml_flag(c, 0xffff);
+	if (!(flags & XMLOBJ_CHANGE_FLAGS))
+	    continue;
+	if (prefix)
+	    path = PyUnicode_FromFormat("%U/%s", prefix, xml_name(c));
+	else
+	    path = PyUnicode_FromString(xml_name(c));
+	if (!path)
+	    return -1;
+	o = xmlobj_child_pyobj(orig_ref, c);
+	if (!o) {
+	    Py_DECREF(path);
+	    return -1;
+	}
+	/* O takes a new reference to path, N steals the one to o. */
+	t = Py_BuildValue("(OiN)", path, flags, o);
+	if (!t || PyList_Append(list, t) < 0) {
+	    Py_XDECREF(t);
+	    Py_DECREF(path);
+	    return -1;
+	}
+	Py_DECREF(t);
+	rv = 0;
+	if (flags & XML_FLAG_CHANGE)
+	    rv = xmlobj_add_changes(list, orig_ref, c, path);
+	Py_DECREF(path);
+	if (rv < 0)
+	    return -1;
+    }
+    return 0;
+}
+
+/*
+ * Add an (op, origxmlobj, newxmlobj) tuple to list.  A NULL child
+ * becomes None.
+ */
+static int
+xmlobj_add_changed_pair(PyObject *list, const char *op,
+			struct xmlobj *oref, cxobj *oc,
+			struct xmlobj *nref, cxobj *nc)
+{
+    PyObject *o, *n, *t;
+
+    if (oc) {
+	o = xmlobj_child_pyobj(oref, oc);
+	if (!o)
+	    return -1;
+    } else {
+	Py_INCREF(Py_None);
+	o = Py_None;
+    }
+    if (nc) {
+	n = xmlobj_child_pyobj(nref, nc);
+	if (!n) {
+	    Py_DECREF(o);
+	    return -1;
+	}
+    } else {
+	Py_INCREF(Py_None);
+	n = Py_None;
+    }
+    /* N steals the references to o and n, even on failure. */
+    t = Py_BuildValue("(sNN)", op, o, n);
+    if (!t || PyList_Append(list, t) < 0) {
+	Py_XDECREF(t);
+	return -1;
+    }
+    Py_DECREF(t);
+    return 0;
+}
+
 struct yangobj {
     struct yang_stmt *yang;
 };
@@ -256,45 +480,113 @@ pyclixon_beh_reset(struct clixon_beh_plugin *p, const char *cb)
     return pyclixon_call_rv_int(bp->handler, "reset", args, true);
 }
 
+/*
+ * Get the class name of the handler for error reports.
+ */
+static const char *
+process_state_classname(struct plugin *bp)
+{
+    PyObject *t = PyObject_GetAttrString(bp->handler, "__class__");
+    PyObject *c = PyObject_GetAttrString(t, "__name__");
+
+    return PyUnicode_AsUTF8(c);
+}
+
+/*
+ * Add one returned state item to xtop.  It may be a string of xml,
+ * an xmlobj created with new_xml_tree(), or a list of xml in the
+ * nested tuple form (see xmlobj_add_tuple()).  The last two don't
+ * have to be converted to and from a string.
+ */
+static int
+process_state_item(struct plugin *bp, const char *name,
+		   PyObject *o, int i, cxobj *xtop)
+{
+    const char *xmlstr;
+    struct xmlobj *x;
+    cxobj *c;
+    Py_ssize_t j;
+
+    if (PyList_Check(o)) {
+	for (j = 0; j < PyList_GET_SIZE(o); j++) {
+	    if (xmlobj_add_tuple(xtop, PyList_GET_ITEM(o, j)) < 0) {
+		PyErr_Print();
+		clixon_err(OE_PLUGIN, 0,
+			   "pyclixon_beh:callback: Invalid xml tuple "
+			   "returned from %s of class %s.",
+			   name, process_state_classname(bp));
+		return -1;
+	    }
+	}
+	return 0;
+    }
+    /* SWIG converts None to a NULL pointer, so check for that. */
+    if (o != Py_None &&
+	    SWIG_IsOK(SWIG_ConvertPtr(o, (void **) &x, SWIGTYPE_p_xmlobj, 0))) {
+	c = xml_dup(x->xml);
+	if (!c || xml_addsub(xtop, c) < 0) {
+	    if (c)
+		xml_free(c);
+	    clixon_err(OE_PLUGIN, 0,
+		       "pyclixon_beh:callback: Could not add returned "
+		       "xmlobj from %s.", name);
+	    return -1;
+	}
+	return 0;
+    }
+    xmlstr = PyUnicode_AsUTF8AndSize(o, NULL);
+    if (!xmlstr) {
+	if (i >= 0)
+	    clixon_err(OE_PLUGIN, 0,
+		       "pyclixon_beh:callback: Could not convert string "
+		       "return %d of method %s to a string.", i, name);
+	else
+	    clixon_err(OE_PLUGIN, 0,
+		       "pyclixon_beh:callback: Could not convert string "
+		       "return of method %s to a string.", name);
+	return -1;
+    }
+    if (clixon_xml_parse_string(xmlstr, YB_NONE, NULL, &xtop, NULL) < 0) {
+	if (i >= 0)
+	    clixon_err(OE_PLUGIN, 0,
+		       "pyclixon_beh:callback: Could not parse "
+		       "returned XML string %d from %s.", i, name);
+	else
+	    clixon_err(OE_PLUGIN, 0, "pyclixon_beh:callback: Could not parse "
+		       "returned XML string from %s.", name);
+	return -1;
+    }
+    return 0;
+}
+
 static int
 process_state_return(struct plugin *bp, const char *name,
 		     PyObject *o, cxobj *xtop)
 {
     PyObject *o1, *o2;
-    const char *xmlstr;
     int rv = -1;
     unsigned int i;
 
     if (!PyTuple_Check(o) || PyTuple_GET_SIZE(o) != 2) {
-	PyObject *t = PyObject_GetAttrString(bp->handler, "__class__");
-	PyObject *c = PyObject_GetAttrString(t, "__name__");
-	const char *classt = PyUnicode_AsUTF8(c);
-
 	clixon_err(OE_PLUGIN, 0, "pyclixon_beh:callback: method %s of "
 		   "class %s didn't return a tuple of size 2.",
-		   name, classt);
+		   name, process_state_classname(bp));
 	goto out_err;
     }
     o1 = PyTuple_GET_ITEM(o, 0);
     o2 = PyTuple_GET_ITEM(o, 1);
     if (!PyLong_Check(o1)) {
-	PyObject *t = PyObject_GetAttrString(bp->handler, "__class__");
-	PyObject *c = PyObject_GetAttrString(t, "__name__");
-	const char *classt = PyUnicode_AsUTF8(c);
-
 	clixon_err(OE_PLUGIN, 0, "pyclixon_beh:callback: method %s of "
 		   "class %s first element not an int.",
-		   name, classt);
+		   name, process_state_classname(bp));
 	goto out_err;
     }
-    if (!(PyUnicode_Check(o2) || PyTuple_Check(o2))) {
-	PyObject *t = PyObject_GetAttrString(bp->handler, "__class__");
-	PyObject *c = PyObject_GetAttrString(t, "__name__");
-	const char *classt = PyUnicode_AsUTF8(c);
-
+    if (!(PyUnicode_Check(o2) || PyTuple_Check(o2) || PyList_Check(o2) ||
+	  (o2 != Py_None &&
+	   SWIG_IsOK(SWIG_ConvertPtr(o2, NULL, SWIGTYPE_p_xmlobj, 0))))) {
 	clixon_err(OE_PLUGIN, 0, "pyclixon_beh:callback: method %s of "
-		   "class %s second element not a string or tuple of strings",
-		   name, classt);
+		   "class %s second element not a string, xmlobj, list, "
+		   "or tuple of those", name, process_state_classname(bp));
 	goto out_err;
     }
     if (PyLong_AsUnsignedLong(PyTuple_GET_ITEM(o, 0)) < 0)
@@ -302,33 +594,13 @@ process_state_return(struct plugin *bp, const char *name,
     if (PyTuple_Check(o2)) {
 	int size = PyTuple_GET_SIZE(o2);
 	for (i = 0; i < size; i++) {
-	    xmlstr = PyUnicode_AsUTF8AndSize(PyTuple_GET_ITEM(o2, i), NULL);
-	    if (!xmlstr) {
-		clixon_err(OE_PLUGIN, 0,
-			   "pyclixon_beh:callback: Could not convert string "
-			   "return %u of method %s to a string.", i, name);
-		goto out_err;
-	    }
-	    if (clixon_xml_parse_string(xmlstr, YB_NONE, NULL, &xtop, NULL) < 0){
-		clixon_err(OE_PLUGIN, 0,
-			   "pyclixon_beh:callback: Could not parse "
-			   "returned XML string %u from %s.", i, name);
+	    if (process_state_item(bp, name, PyTuple_GET_ITEM(o2, i), i,
+				   xtop) < 0)
 		goto out_err;
-	    }
 	}
     } else {
-	xmlstr = PyUnicode_AsUTF8AndSize(o2, NULL);
-	if (!xmlstr) {
-	    clixon_err(OE_PLUGIN, 0,
-		       "pyclixon_beh:callback: Could not convert string "
-		       "return of method %s to a string.", name);
+	if (process_state_item(bp, name, o2, -1, xtop) < 0)
 	    goto out_err;
-	}
-	if (clixon_xml_parse_string(xmlstr, YB_NONE, NULL, &xtop, NULL) < 0) {
-	    clixon_err(OE_PLUGIN, 0, "pyclixon_beh:callback: Could not parse "
-		       "returned XML string from %s.", name);
-	    goto out_err;
-	}
     }
     rv = 0;
  out_err:
@@ -340,23 +612,29 @@ pyclixon_beh_statedata(struct clixon_beh_plugin *p,
 		       cvec *nsc, char *xpath, cxobj *xtop)
 {
     struct plugin *bp = clixon_beh_plugin_get_cb_data(p);
-    PyObject *args = PyTuple_New(2);
-    PyObject *arg1 = PyTuple_New(cvec_len(nsc));
+    PyObject *args, *arg1;
     PyObject *o = NULL;
+    PyGILState_STATE gstate;
     unsigned int i;
-    int rv;
+    int rv = -1;
 
+    /* This may be called from another thread for parallel gets. */
+    gstate = PyGILState_Ensure();
+    args = PyTuple_New(2);
+    arg1 = PyTuple_New(cvec_len(nsc));
     for (i = 0; i < cvec_len(nsc); i++)
 	PyTuple_SET_ITEM(arg1, i, PyUnicode_FromString(cvec_i_str(nsc, i)));
     PyTuple_SET_ITEM(args, 0, arg1);
     PyTuple_SET_ITEM(args, 1, PyUnicode_FromString(xpath));
     if (pyclixon_call_rv(bp->handler, "statedata", args, true, &o) < 0)
-	return -1;
+	goto out;
     if (!o)
-	return -1;
+	goto out;
     rv = process_state_return(bp, "statedata", o, xtop);
     Py_DECREF(o);
 
+ out:
+    PyGILState_Release(gstate);
     return rv;
 }
 
@@ -365,23 +643,29 @@ pyclixon_beh_system_only(struct clixon_beh_plugin *p,
 			 cvec *nsc, char *xpath, cxobj *xtop)
 {
     struct plugin *bp = clixon_beh_plugin_get_cb_data(p);
-    PyObject *args = PyTuple_New(2);
-    PyObject *arg1 = PyTuple_New(cvec_len(nsc));
+    PyObject *args, *arg1;
     PyObject *o = NULL;
+    PyGILState_STATE gstate;
     unsigned int i;
-    int rv;
+    int rv = -1;
 
+    /* This may be called from another thread for parallel gets. */
+    gstate = PyGILState_Ensure();
+    args = PyTuple_New(2);
+    arg1 = PyTuple_New(cvec_len(nsc));
     for (i = 0; i < cvec_len(nsc); i++)
 	PyTuple_SET_ITEM(arg1, i, PyUnicode_FromString(cvec_i_str(nsc, i)));
     PyTuple_SET_ITEM(args, 0, arg1);
     PyTuple_SET_ITEM(args, 1, PyUnicode_FromString(xpath));
     if (pyclixon_call_rv(bp->handler, "system_only", args, true, &o) < 0)
-	return -1;
+	goto out;
     if (!o)
-	return -1;
+	goto out;
     rv = process_state_return(bp, "system_only", o, xtop);
     Py_DECREF(o);
 
+ out:
+    PyGILState_Release(gstate);
     return rv;
 }
 
@@ -610,6 +894,166 @@ clixon_beh_xml2str(cxobj *oxml)
     return rv;
 }
 
+/*
+ * The module used to create element trees.  lxml.etree if it is
+ * available, otherwise the standard xml.etree.ElementTree.
+ */
+static PyObject *etree_mod;
+
+static PyObject *
+clixon_beh_etree_mod(void)
+{
+    if (!etree_mod) {
+	etree_mod = PyImport_ImportModule("lxml.etree");
+	if (!etree_mod) {
+	    PyErr_Clear();
+	    etree_mod = PyImport_ImportModule("xml.etree.ElementTree");
+	}
+    }
+    return etree_mod;
+}
+
+/*
+ * Return the name in ElementTree "{namespace}name" form, or just the
+ * name if it has no namespace.
+ */
+static PyObject *
+clixon_beh_etree_name(cxobj *x, char *prefix, char *name)
+{
+    char *ns = NULL;
+
+    if (xml2ns(x, prefix, &ns) < 0) {
+	PyErr_Format(PyExc_RuntimeError, "Unable to find namespace for %s",
+		     name);
+	return NULL;
+    }
+    if (ns)
+	return PyUnicode_FromFormat("{%s}%s", ns, name);
+    return PyUnicode_FromString(name);
+}
+
+/*
+ * Create a dictionary of the attributes of xml, leaving out the
+ * namespace declarations (the element tree handles those itself) and
+ * adding the clixon flags in the "clixonflags" attribute like
+ * clixon_beh_xml2str() does.
+ */
+static PyObject *
+clixon_beh_etree_attrs(cxobj *xml)
+{
+    PyObject *attrs, *k, *v;
+    cxobj *a = NULL;
+    char attrstr[MAX_XML_ATTRSTR];
+    char *prefix;
+    int rv;
+
+    attrs = PyDict_New();
+    if (!attrs)
+	return NULL;
+    while ((a = xml_child_each(xml, a, CX_ATTR)) != NULL) {
+	prefix = xml_prefix(a);
+	if (prefix ? strcmp(prefix, "xmlns") == 0
+		   : strcmp(xml_name(a), "xmlns") == 0)
+	    continue;
+	if (prefix)
+	    k = clixon_beh_etree_name(xml, prefix, xml_name(a));
+	else
+	    k = PyUnicode_FromString(xml_name(a));
+	if (!k)
+	    goto out_err;
+	v = PyUnicode_FromString(xml_value(a) ? xml_value(a) : "");
+	if (!v) {
+	    Py_DECREF(k);
+	    goto out_err;
+	}
+	rv = PyDict_SetItem(attrs, k, v);
+	Py_DECREF(k);
+	Py_DECREF(v);
+	if (rv < 0)
+	    goto out_err;
+    }
+    if (xml_flags2str(attrstr, sizeof(attrstr), xml_flag(xml, 0xffff)) > 0) {
+	v = PyUnicode_FromString(attrstr);
+	if (!v)
+	    goto out_err;
+	rv = PyDict_SetItemString(attrs, "clixonflags", v);
+	Py_DECREF(v);
+	if (rv < 0)
+	    goto out_err;
+    }
+    return attrs;
+
+ out_err:
+    Py_DECREF(attrs);
+    return NULL;
+}
+
+/*
+ * Convert xml and everything below it into element tree elements.
+ * If parent is not NULL, the new element is added to it.
+ */
+static PyObject *
+clixon_beh_xml2etree_elem(PyObject *mod, PyObject *parent, cxobj *xml)
+{
+    PyObject *tag, *attrs, *el, *o;
+    cxobj *c = NULL;
+    char *body;
+
+    tag = clixon_beh_etree_name(xml, xml_prefix(xml), xml_name(xml));
+    if (!tag)
+	return NULL;
+    attrs = clixon_beh_etree_attrs(xml);
+    if (!attrs) {
+	Py_DECREF(tag);
+	return NULL;
+    }
+    if (parent)
+	el = PyObject_CallMethod(mod, "SubElement", "OOO", parent, tag, attrs);
+    else
+	el = PyObject_CallMethod(mod, "Element", "OO", tag, attrs);
+    Py_DECREF(tag);
+    Py_DECREF(attrs);
+    if (!el)
+	return NULL;
+
+    body = xml_body(xml);
+    if (body) {
+	o = PyUnicode_FromString(body);
+	if (!o || PyObject_SetAttrString(el, "text", o) < 0) {
+	    Py_XDECREF(o);
+	    Py_DECREF(el);
+	    return NULL;
+	}
+	Py_DECREF(o);
+    }
+
+    while ((c = xml_child_each(xml, c, CX_ELMNT)) != NULL) {
+	o = clixon_beh_xml2etree_elem(mod, el, c);
+	if (!o) {
+	    Py_DECREF(el);
+	    return NULL;
+	}
+	Py_DECREF(o);
+    }
+    return el;
+}
+
+/*
+ * Convert the xml directly into an element tree, without going
+ * through a string.  The result is the same as parsing the output of
+ * clixon_beh_xml2str().
+ */
+static PyObject *
+clixon_beh_xml2etree(cxobj *xml)
+{
+    PyObject *mod;
+
+    mod = clixon_beh_etree_mod();
+    if (!mod)
+	return NULL;
+    return clixon_beh_xml2etree_elem(mod, NULL, xml);
+}
+
 struct transaction {
     PyObject *myself;
     PyObject *userdata;
@@ -619,6 +1063,8 @@ struct transaction {
     struct xmlobj *new_xmlobj;
     PyObject *orig_str;
     PyObject *new_str;
+    PyObject *orig_etree;
+    PyObject *new_etree;
 };
 
 static int
@@ -951,6 +1397,16 @@ struct plugin *add_plugin(const char *name,
     {
 	clixon_beh_log_plugin(self->p, logtype, "%s", str);
     }
+
+    int add_state_prefix(char *prefix)
+    {
+	return clixon_beh_plugin_add_state_prefix(self->p, prefix);
+    }
+
+    void set_thread_safe(bool thread_safe)
+    {
+	clixon_beh_plugin_set_thread_safe(self->p, thread_safe);
+    }
 }
 
 %rename(add_stream) add_streamt;
@@ -1180,6 +1636,11 @@ struct xmlobj { };
 	return clixon_beh_xml2str(self->xml);
     }
 
+    PyObject *to_etree()
+    {
+	return clixon_beh_xml2etree(self->xml);
+    }
+
     char *get_name()
     {
 	return xml_name(self->xml);
@@ -1249,6 +1710,62 @@ struct xmlobj { };
 	return xmlobj_new(self->orig_ref, xml_child_i_type(self->xml, i, type));
     }
 
+    /*
+     * Return a list of all the children of the given type (-1 for
+     * all types).  This is one call instead of one per child.
+     */
+    PyObject *children(int type = -1)
+    {
+	PyObject *list, *o;
+	cxobj *c = NULL;
+
+	list = PyList_New(0);
+	if (!list)
+	    return NULL;
+	while ((c = xml_child_each(self->xml, c, type)) != NULL) {
+	    o = xmlobj_child_pyobj(self->orig_ref, c);
+	    if (!o || PyList_Append(list, o) < 0) {
+		Py_XDECREF(o);
+		Py_DECREF(list);
+		return NULL;
+	    }
+	    Py_DECREF(o);
+	}
+	return list;
+    }
+
+    /*
+     * Return a list of (name, flags, body, xmlobj) tuples for all
+     * the children of the given type, element by default.  flags is
+     * all the flags, body is None if there is no body.
+     */
+    PyObject *children_with_flags(int type = CX_ELMNT)
+    {
+	PyObject *list, *o, *t;
+	cxobj *c = NULL;
+
+	list = PyList_New(0);
+	if (!list)
+	    return NULL;
+	while ((c = xml_child_each(self->xml, c, type)) != NULL) {
+	    o = xmlobj_child_pyobj(self->orig_ref, c);
+	    if (!o) {
+		Py_DECREF(list);
+		return NULL;
+	    }
+	    /* N steals the reference to o, even on failure. */
+	    t = Py_BuildValue("(zizN)", xml_name(c), xml_flag(c, 0xffff),
+			      xml_body(c), o);
+	    if (!t || PyList_Append(list, t) < 0) {
+		Py_XDECREF(t);
+		Py_DECREF(list);
+		return NULL;
+	    }
+	    Py_DECREF(t);
+	}
+	return list;
+    }
+
     struct xmlobj *find(char *name)
     {
 	return xmlobj_new(self->orig_ref, xml_find(self->xml, name));
@@ -1274,8 +1791,169 @@ struct xmlobj { };
     {
 	return xml_find_type_value(self->xml, prefix, name, CX_ATTR);
     }
+
+    /*
+     * Add a child element, with an xmlns attribute if ns is given,
+     * and return it.  This only works on trees created by
+     * new_xml_tree().
+     */
+    PyObject *add_child(char *name, char *ns = NULL)
+    {
+	cxobj *c;
+
+	if (!self->orig_ref->writable) {
+	    PyErr_Format(PyExc_TypeError, "xmlobj is not modifiable");
+	    return NULL;
+	}
+	c = xmlobj_add_elem(self->xml, name, ns, NULL);
+	if (!c)
+	    return NULL;
+	return xmlobj_built_pyobj(self->orig_ref, c);
+    }
+
+    /*
+     * Like add_child, but the child has body as its value.
+     */
+    PyObject *add_leaf(char *name, char *body, char *ns = NULL)
+    {
+	cxobj *c;
+
+	if (!self->orig_ref->writable) {
+	    PyErr_Format(PyExc_TypeError, "xmlobj is not modifiable");
+	    return NULL;
+	}
+	c = xmlobj_add_elem(self->xml, name, ns, body);
+	if (!c)
+	    return NULL;
+	return xmlobj_built_pyobj(self->orig_ref, c);
+    }
+
+    /*
+     * Add children in the nested tuple form, a list of
+     * (name, content[, namespace]) tuples, where content is None,
+     * a string body, or a list of more tuples.
+     */
+    PyObject *add_tuples(PyObject *tuples)
+    {
+	Py_ssize_t i;
+
+	if (!self->orig_ref->writable) {
+	    PyErr_Format(PyExc_TypeError, "xmlobj is not modifiable");
+	    return NULL;
+	}
+	if (!PyList_Check(tuples)) {
+	    PyErr_Format(PyExc_TypeError, "add_tuples takes a list");
+	    return NULL;
+	}
+	for (i = 0; i < PyList_GET_SIZE(tuples); i++) {
+	    if (xmlobj_add_tuple(self->xml, PyList_GET_ITEM(tuples, i)) < 0)
+		return NULL;
+	}
+	Py_RETURN_NONE;
+    }
+
+    /*
+     * Return a list of (path, flags, xmlobj) tuples for all the
+     * elements under this one that have the add, del, or change
+     * flag set.  Only elements with the change flag are descended
+     * into, so unchanged parts of the tree are never visited.  path
+     * is the element names from this element separated by '/'.
+     */
+    PyObject *changes()
+    {
+	PyObject *list;
+
+	list = PyList_New(0);
+	if (!list)
+	    return NULL;
+	if (xmlobj_add_changes(list, self->orig_ref, self->xml, NULL) < 0) {
+	    Py_DECREF(list);
+	    return NULL;
+	}
+	return list;
+    }
 }
 
+%inline %{
+/*
+ * Create a new xml tree with a top element named name, with an
+ * xmlns attribute if ns is not None.  Unlike other xmlobjs, this can be
+ * added to with add_child(), add_leaf(), and add_tuples(), and it
+ * can be returned from statedata instead of an xml string.
+ */
+PyObject *
+new_xml_tree(char *name, char *ns)
+{
+    struct xmlobj *x;
+    cxobj *c;
+
+    c = xmlobj_add_elem(NULL, name, ns, NULL);
+    if (!c)
+	return NULL;
+    x = xmlobj_new(NULL, c);
+    if (!x) {
+	xml_free(c);
+	PyErr_Format(PyExc_RuntimeError, "Unable to allocate xmlobj");
+	return NULL;
+    }
+    x->writable = true;
+    return SWIG_NewPointerObj(SWIG_as_voidptr(x), SWIGTYPE_p_xmlobj,
+			      SWIG_POINTER_OWN);
+}
+
+/*
+ * Walk the element children of orig and new in step the same way
+ * YangElem.validate() does, but only return the ones that need
+ * handling, as a list of (op, origxmlobj, newxmlobj) tuples.  op is
+ * "del" (newxmlobj is None), "add" (origxmlobj is None), or "change".
+ * Either orig or new may be None.  Children with no flags set never
+ * get python objects created for them.
+ */
+PyObject *
+changed_children(struct xmlobj *orig, struct xmlobj *new)
+{
+    PyObject *list;
+    cxobj *oc = NULL, *nc = NULL;
+    int of, nf, rv;
+
+    list = PyList_New(0);
+    if (!list)
+	return NULL;
+    if (orig)
+	oc = xml_child_each(orig->xml, NULL, CX_ELMNT);
+    if (new)
+	nc = xml_child_each(new->xml, NULL, CX_ELMNT);
+    while (oc || nc) {
+	of = oc ? xml_flag(oc, XMLOBJ_CHANGE_FLAGS) : 0;
+	nf = nc ? xml_flag(nc, XMLOBJ_CHANGE_FLAGS) : 0;
+	if (of & XML_FLAG_DEL) {
+	    rv = xmlobj_add_changed_pair(list, "del",
+					 orig->orig_ref, oc, NULL, NULL);
+	    oc = xml_child_each(orig->xml, oc, CX_ELMNT);
+	} else if (nf & XML_FLAG_ADD) {
+	    rv = xmlobj_add_changed_pair(list, "add",
+					 NULL, NULL, new->orig_ref, nc);
+	    nc = xml_child_each(new->xml, nc, CX_ELMNT);
+	} else {
+	    rv = 0;
+	    if ((of | nf) & XML_FLAG_CHANGE)
+		rv = xmlobj_add_changed_pair(list, "change",
+					     orig ? orig->orig_ref : NULL, oc,
+					     new ? new->orig_ref : NULL, nc);
+	    if (oc)
+		oc = xml_child_each(orig->xml, oc, CX_ELMNT);
+	    if (nc)
+		nc = xml_child_each(new->xml, nc, CX_ELMNT);
+	}
+	if (rv < 0) {
+	    Py_DECREF(list);
+	    return NULL;
+	}
+    }
+    return list;
+}
+%}
+
 %nodefaultctor yangobj;
 struct yangobj { };
 
@@ -1365,6 +2043,10 @@ struct transaction { };
 	    Py_DECREF(self->orig_str);
 	if (self->new_str)
 	    Py_DECREF(self->new_str);
+	if (self->orig_etree)
+	    Py_DECREF(self->orig_etree);
+	if (self->new_etree)
+	    Py_DECREF(self->new_etree);
 	if (self->orig_xmlobj)
 	    free_xmlobj(self->orig_xmlobj);
 	if (self->new_xmlobj)
@@ -1407,6 +2089,38 @@ struct transaction { };
 	return Py_NewRef(self->new_str);
     }
 
+    /*
+     * Return the xml as an element tree (lxml if available), built
+     * directly from the clixon xml with the flags in the
+     * "clixonflags" attribute.  This is the same thing you would get
+     * by parsing orig_str()/new_str(), but without creating and
+     * parsing the string.  The tree is only built once per
+     * transaction and the same one is returned every time.
+     */
+    PyObject *orig_etree()
+    {
+	if (!self->orig_etree) {
+	    if (!self->orig_xml)
+		Py_RETURN_NONE;
+	    self->orig_etree = clixon_beh_xml2etree(self->orig_xml);
+	    if (!self->orig_etree)
+		return NULL;
+	}
+	return Py_NewRef(self->orig_etree);
+    }
+
+    PyObject *new_etree()
+    {
+	if (!self->new_etree) {
+	    if (!self->new_xml)
+		Py_RETURN_NONE;
+	    self->new_etree = clixon_beh_xml2etree(self->new_xml);
+	    if (!self->new_etree)
+		return NULL;
+	}
+	return Py_NewRef(self->new_etree);
+    }
+
     struct xmlobj *orig_xml()
     {
 	if (!self->orig_xmlobj)
@@ -0,0 +1,209 @@
+#
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright (C) 2024 MontaVista Software, LLC <source@mvista.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Alternatively, the contents of this file may be used under the terms of
+# the GNU General Public License Version 3 or later (the "GPL"),
+# in which case the provisions of the GPL are applicable instead
+# of those above. If you wish to allow use of your version of this file only
+# under the terms of the GPL, and not to allow others to
+# use your version of this file under the terms of Apache License version 2,
+# indicate your decision by deleting the provisions above and replace them with
+# the notice and other provisions required by the GPL. If you do not delete
+# the provisions above, a recipient may use your version of this file under
+# the terms of any one of the Apache License version 2 or the GPL.
+#
+# ***** END LICENSE BLOCK *****
+#
+
+"""Check that an operation that raises privileges never commits at the
+same time as other operations when commit_workers is set.
+
+transaction_framework needs the clixon_beh C module to import, so it
+is loaded from the source file with a stand-in module that only keeps
+track of the effective uid.  Run it from the source tree with:
+
+    python3 clixon_beh/test_parallel_priv.py
+
+This is not installed.
+
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+import threading
+import time
+import types
+import unittest
+
+class FakePrivs(types.ModuleType):
+    """Just enough of clixon_beh for the privilege handling."""
+    def __init__(self):
+        super().__init__("clixon_beh")
+        self.euid = 1000
+        return
+
+    def geteuid(self):
+        return self.euid
+
+    def restore_priv(self):
+        self.euid = 0
+        return 0
+
+    def drop_priv_temp(self, euid):
+        self.euid = euid
+        return 0
+
+    def set_err_handler(self, fn):
+        return
+
+    pass
+
+def load_tf():
+    fake = FakePrivs()
+    fname = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "transaction_framework.py")
+    spec = importlib.util.spec_from_file_location("tf_under_test", fname)
+    tf = importlib.util.module_from_spec(spec)
+    saved = sys.modules.get("clixon_beh")
+    sys.modules["clixon_beh"] = fake
+    try:
+        spec.loader.exec_module(tf)
+    finally:
+        if saved is None:
+            del sys.modules["clixon_beh"]
+        else:
+            sys.modules["clixon_beh"] = saved
+            pass
+        pass
+    return (tf, fake)
+
+(tf, fake) = load_tf()
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.times = {}
+        self.euids = {}
+        return
+
+    def run(self, name):
+        start = time.monotonic()
+        euids = set()
+        for i in range(5):
+            euids.add(fake.geteuid())
+            time.sleep(0.01)
+            pass
+        with self.lock:
+            self.times[name] = (start, time.monotonic())
+            self.euids[name] = euids
+            pass
+        return
+
+    def overlaps(self, a, b):
+        (sa, ea) = self.times[a]
+        (sb, eb) = self.times[b]
+        return sa < eb and sb < ea
+
+    pass
+
+class DNSLike(tf.YangElemCommitOnly):
+    """Raises privileges itself in commit, like DNSHandler did."""
+    def __init__(self, rec):
+        super().__init__("dns")
+        self.rec = rec
+        return
+
+    def commit(self, op):
+        self.do_priv(op)
+        return
+
+    def priv(self, op):
+        self.rec.run("dns")
+        return
+
+    pass
+
+class Plain(tf.YangElemCommitOnly):
+    def __init__(self, name, rec):
+        super().__init__(name)
+        self.rec = rec
+        return
+
+    def commit(self, op):
+        self.rec.run(self.name)
+        return
+
+    pass
+
+class TestParallelPriv(unittest.TestCase):
+    def make_data(self, rec, priv):
+        d = tf.Data(commit_workers=4)
+        d.add_op(Plain("ntp", rec), "ntp", None, resources=["ntp"])
+        d.add_op(DNSLike(rec), "dns", None, priv=priv, resources=["dns"])
+        d.add_op(Plain("hostname", rec), "hostname", None,
+                 resources=["hostname"])
+        return d
+
+    def check_exclusive(self, rec):
+        for name in ("ntp", "hostname"):
+            self.assertFalse(rec.overlaps("dns", name))
+            self.assertEqual(rec.euids[name], {1000})
+            pass
+        self.assertEqual(rec.euids["dns"], {0})
+        self.assertEqual(fake.geteuid(), 1000)
+        return
+
+    def test_priv_op_runs_alone(self):
+        rec = Recorder()
+        self.make_data(rec, True).commit()
+        self.check_exclusive(rec)
+        return
+
+    def test_priv_op_runs_alone_async(self):
+        rec = Recorder()
+        asyncio.run(self.make_data(rec, True).acommit())
+        self.check_exclusive(rec)
+        return
+
+    def test_do_priv_refused_in_parallel_op(self):
+        rec = Recorder()
+        with self.assertRaises(Exception):
+            self.make_data(rec, False).commit()
+            pass
+        self.assertNotIn("dns", rec.times)
+        for euids in rec.euids.values():
+            self.assertEqual(euids, {1000})
+            pass
+        self.assertEqual(fake.geteuid(), 1000)
+        return
+
+    def test_do_priv_refused_in_parallel_op_async(self):
+        rec = Recorder()
+        with self.assertRaises(Exception):
+            asyncio.run(self.make_data(rec, False).acommit())
+            pass
+        self.assertNotIn("dns", rec.times)
+        self.assertEqual(fake.geteuid(), 1000)
+        return
+
+    pass
+
+if __name__ == "__main__":
+    unittest.main()
+    pass
@@ -30,7 +30,15 @@
 #
 
 import subprocess
+import asyncio
+import concurrent.futures
+import contextvars
 import io
+import os
+import socket
+import struct
+import threading
+import time
 import traceback
 import clixon_beh
 from enum import Enum
@@ -65,6 +73,11 @@ def xmlescape(xmlstr):
     own XML generation, you will need to call this on body text.
 
     """
+    # Almost all values don't have any special characters, and
+    # checking is a lot cheaper than replacing.
+    if ("&" not in xmlstr and "<" not in xmlstr and ">" not in xmlstr and
+            "\"" not in xmlstr and "'" not in xmlstr):
+        return xmlstr
     xmlstr = xmlstr.replace("&", "&amp;")
     xmlstr = xmlstr.replace("<", "&lt;")
     xmlstr = xmlstr.replace(">", "&gt;")
@@ -72,17 +85,71 @@ def xmlescape(xmlstr):
     xmlstr = xmlstr.replace("'", "&apos;")
     return xmlstr
 
+class PrivWindow:
+    """Raise privileges for everything done inside a with statement.
+    Windows may be nested, privileges are dropped when the outermost
+    one is done.  While a window is open, do_priv() doesn't change
+    privileges, so a set of privileged operations only raise and drop
+    privileges once.
+
+    Privileges belong to the whole process, so the windows are
+    counted across threads, too.  Privileges stay raised until the
+    last window in any thread is done.
+
+    """
+    depth = 0
+    euid = None
+    lock = threading.Lock()
+
+    def __init__(self, name=""):
+        """name is put on the front of error messages."""
+        self.name = name
+        return
+
+    def __enter__(self):
+        with PrivWindow.lock:
+            if PrivWindow.depth == 0:
+                euid = clixon_beh.geteuid()
+                if clixon_beh.restore_priv() < 0:
+                    raise Exception(self.name + ": Can't restore privileges.")
+                PrivWindow.euid = euid
+                pass
+            PrivWindow.depth += 1
+            pass
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        with PrivWindow.lock:
+            PrivWindow.depth -= 1
+            if PrivWindow.depth == 0:
+                if clixon_beh.drop_priv_temp(PrivWindow.euid) < 0:
+                    raise Exception(self.name + ": Can't drop privileges.")
+                pass
+            pass
+        return False
+
+    pass
+
+# The operation being committed, if it may be running at the same
+# time as other operations.  Privileges can't be raised in it.
+parallel_op = contextvars.ContextVar("parallel_op", default=None)
+
 class PrivOp:
     def do_priv(self, op):
-        """Perform an operation at the initial privilege level."""
-        euid = clixon_beh.geteuid()
-        if clixon_beh.restore_priv() < 0:
-            raise Exception(self.name + ": Can't restore privileges.")
-        try:
+        """Perform an operation at the initial privilege level.  This
+        is not allowed in an operation that commits in parallel with
+        others, since they would run with privileges raised, too.
+        Add the operation with priv=True instead.
+
+        """
+        name = getattr(self, "name", "")
+        pop = parallel_op.get()
+        if pop is not None:
+            raise Exception(name + ": Can't raise privileges in operation " +
+                            str(pop.opname) + ", it runs in parallel with"
+                            " other operations.  Add it with priv=True.")
+        with PrivWindow(name):
             self.priv(op)
-        finally:
-            if clixon_beh.drop_priv_temp(euid) < 0:
-                raise Exception(self.name + ": Can't drop privileges.")
             pass
         return
 
@@ -90,6 +157,15 @@ class PrivOp:
         """Subclasses must override this function for privileged operations."""
         return
 
+    async def ado_priv(self, op):
+        """The asyncio version of do_priv().  Privileges belong to the
+        whole process, so nothing is awaited while they are raised,
+        other tasks would run with them.  This just calls do_priv().
+
+        """
+        self.do_priv(op)
+        return
+
     pass
 
 class Op(PrivOp):
@@ -106,13 +182,21 @@ class Op(PrivOp):
     begin with "user".
 
     """
-    def __init__(self, handler, opname, value, priv=False):
+    def __init__(self, handler, opname, value, priv=False, priv_batch=True,
+                 resources=None, after=()):
         """The handler's commit and revert methods will be called during the
         commit and revert operations.  opname is a convenience name,
         and value may be anything the user desires.
 
         If priv is True, then all the operation will be done with
-        privileges raised.
+        privileges raised.  If the Data has priv_batch set, the
+        operation shares its raised privileges with the privileged
+        operations next to it unless priv_batch is False here.
+
+        resources and after are for committing operations in
+        parallel, see Data.  resources is a list of names of the
+        things the operation changes, like files or services.  after
+        is a list of other Op objects that must be committed first.
 
         """
 
@@ -125,6 +209,12 @@ class Op(PrivOp):
         self.end = False
         self.oldvalue = None
         self.priveleged = priv
+        self.priv_batch = priv_batch
+        if resources is not None:
+            resources = frozenset(resources)
+            pass
+        self.resources = resources
+        self.after = list(after)
         return
 
     def priv(self, op):
@@ -139,6 +229,19 @@ class Op(PrivOp):
             pass
         pass
 
+    async def handler_acommit(self):
+        """Call the handler's acommit() method, or commit() if it is not
+        a YangElem and doesn't have one.
+
+        """
+        acommit = getattr(self.handler, "acommit", None)
+        if acommit is None:
+            self.handler.commit(self)
+        else:
+            await acommit(self)
+            pass
+        return
+
     def commit(self):
         """Commit the operation, basically apply it to the system.  If you
         handle revert, you should store the data to revert in the
@@ -154,6 +257,20 @@ class Op(PrivOp):
             pass
         return
 
+    async def acommit(self):
+        """The asyncio version of commit(), the handler's acommit() is
+        awaited instead of calling commit().  For a privileged
+        operation the handler's commit() is called, see ado_priv().
+
+        """
+        self.finish = True
+        if self.priveleged:
+            await self.ado_priv(self)
+        else:
+            await self.handler_acommit()
+            pass
+        return
+
     def commit_done(self):
         """Commit the operation, basically apply it to the system.  If
         you handle revert, you should store the data to revert in the
@@ -204,40 +321,449 @@ class Data:
     begin with "user".
 
     """
-    def __init__(self):
+    def __init__(self, statecache=None, priv_batch=False, commit_workers=1):
+        """If priv_batch is True, each phase raises privileges once for
+        each run of privileged operations instead of once for every
+        one.  Unprivileged operations, and operations added with
+        priv_batch=False, are done between the runs with privileges
+        dropped.
+
+        If commit_workers is more than 1, the commit phase runs
+        operations that don't depend on each other in parallel on
+        that many threads.  An operation depends on the operations
+        added before it that share one of its resources and the ones
+        in its after list.  An operation with no resources set, or a
+        privileged one, depends on everything added before it and
+        everything added after it depends on it, so it runs by
+        itself.  Operations that don't set resources are done in
+        order, like they are with one worker.
+        The other phases are always done one at a time, and revert is
+        done in the reverse of the order the commits finished.
+
+        """
         self.ops = []
+        self.statecache = statecache
+        self.priv_batch = priv_batch
+        self.commit_workers = commit_workers
+        self.commit_order = []
+        self.op_keys = {}
         return
 
-    def add_op(self, handler, opname, value, priv=False):
+    def add_op(self, handler, opname, value, priv=False, priv_batch=True,
+               resources=None, after=(), key=None, merge=None):
         """Add an operation to the operation queue.  These will be done
         in the commit and revert phases.  Returns the Op object that
-        was created, the user can add to it if they like."""
-        opdata = Op(handler, opname, value, priv=priv)
+        was created, the user can add to it if they like.  Set
+        priv_batch to False for a privileged operation that must not
+        share its raised privileges with other operations.  See Op
+        for resources and after.
+
+        If key is not None and an operation with the same handler and
+        key was already added, no new operation is added.  Instead
+        the value of the existing one is set to merge(oldvalue,
+        value), or just to value if merge is None, and the existing
+        operation is returned.  It stays where it was in the queue,
+        so after may not have operations added after it in it.  This
+        avoids doing the same work several times when a change
+        touches the same thing more than once."""
+        if key is not None:
+            opdata = self.op_keys.get((id(handler), key))
+            if opdata is not None:
+                self.merge_op(opdata, value, priv, priv_batch, resources,
+                              after, merge)
+                return opdata
+            pass
+        opdata = Op(handler, opname, value, priv=priv, priv_batch=priv_batch,
+                    resources=resources, after=after)
         self.ops.append(opdata)
+        if key is not None:
+            self.op_keys[(id(handler), key)] = opdata
+            pass
         return opdata
 
-    def commit(self):
+    def merge_op(self, opdata, value, priv, priv_batch, resources, after,
+                 merge):
+        # The operation stays where it is, so it can't wait for one
+        # added after it.  That one may already be waiting for it.
+        pos = self.op_index(opdata)
+        for a in after:
+            if a is not opdata and self.op_index(a) > pos:
+                raise Exception("Merged operation " + str(opdata.opname) +
+                                " can't be after operation " +
+                                str(a.opname) + ", which was added later")
+            pass
+        if merge is None:
+            opdata.value = value
+        else:
+            opdata.value = merge(opdata.value, value)
+            pass
+        # The merged operation has to be able to do what both would.
+        opdata.priveleged = opdata.priveleged or priv
+        opdata.priv_batch = opdata.priv_batch and priv_batch
+        if opdata.resources is None or resources is None:
+            opdata.resources = None
+        else:
+            opdata.resources = opdata.resources | frozenset(resources)
+            pass
+        opdata.after.extend(a for a in after if a is not opdata)
+        return
+
+    def op_index(self, op):
+        """Return the position of op in the operation queue."""
+        for (i, o) in enumerate(self.ops):
+            if o is op:
+                return i
+            pass
+        raise Exception("Operation " + str(op.opname) + " is not in the"
+                        " transaction")
+
+    def batched(self, op):
+        return self.priv_batch and op.priveleged and op.priv_batch
+
+    def run_ops(self, ops, fn):
+        """Call fn(op) for each op in ops.  If priv_batch is set, runs
+        of privileged operations are done in one PrivWindow.
+
+        """
+        i = 0
+        while i < len(ops):
+            if not self.batched(ops[i]):
+                fn(ops[i])
+                i += 1
+                continue
+            with PrivWindow():
+                while i < len(ops) and self.batched(ops[i]):
+                    fn(ops[i])
+                    i += 1
+                    pass
+                pass
+            pass
+        return
+
+    def invalidate_cache(self):
+        """Throw away anything in the state cache that the operations in
+        this transaction may have changed.  This is done automatically
+        after commit, commit_done, and revert.
+
+        """
+        if self.statecache is None:
+            return
         for op in self.ops:
+            path = self.op_path(op)
+            self.statecache.invalidate(path)
+            if path == "/":
+                # Everything is gone, no need to look at the rest.
+                break
+            pass
+        return
+
+    def op_path(self, op):
+        """Return the path of the configuration an operation changes, or
+        "/" if it isn't known.  YangElemCommitOnly handlers aren't in
+        the element tree, so their path doesn't say anything about
+        what they touch.
+
+        """
+        h = op.handler
+        if isinstance(h, YangElemCommitOnly):
+            return "/"
+        find_path = getattr(h, "find_path", None)
+        if find_path is None:
+            return "/"
+        try:
+            return find_path()
+        except AttributeError:
+            # Not set up as part of the element tree.
+            return "/"
+
+    def commit_op(self, op):
+        try:
             op.commit()
+        finally:
+            # Keep track of the order for revert.
+            self.commit_order.append(op)
             pass
         return
 
+    def commit_op_parallel(self, op):
+        """commit_op() for when other operations may be running.  If
+        op may run next to others, do_priv() raises an exception in
+        it.
+
+        """
+        if self.exclusive(op):
+            self.commit_op(op)
+            return
+        token = parallel_op.set(op)
+        try:
+            self.commit_op(op)
+        finally:
+            parallel_op.reset(token)
+            pass
+        return
+
+    def commit(self):
+        self.commit_order = []
+        try:
+            if self.commit_workers > 1:
+                self.commit_parallel()
+            else:
+                self.run_ops(self.ops, self.commit_op)
+                pass
+        finally:
+            self.invalidate_cache()
+            pass
+        return
+
+    def exclusive(self, op):
+        """Return True if op must not be committed at the same time as
+        any other operation.  Privileges belong to the whole process,
+        so anything running next to a privileged operation would run
+        with them raised.
+
+        """
+        return op.resources is None or op.priveleged
+
+    def op_deps(self):
+        """Return a list with the set of the indexes of the operations
+        each operation depends on.
+
+        """
+        index = {}
+        for (i, op) in enumerate(self.ops):
+            index[id(op)] = i
+            pass
+        deps = []
+        for (i, op) in enumerate(self.ops):
+            d = set()
+            for (j, prev) in enumerate(self.ops[:i]):
+                if (self.exclusive(op) or self.exclusive(prev) or
+                        not op.resources.isdisjoint(prev.resources)):
+                    d.add(j)
+                    pass
+                pass
+            for a in op.after:
+                if id(a) not in index:
+                    raise Exception("Operation " + str(op.opname) +
+                                    " is after operation " + str(a.opname) +
+                                    ", which is not in the transaction")
+                d.add(index[id(a)])
+                pass
+            deps.append(d)
+            pass
+        self.check_deps(deps)
+        return deps
+
+    def check_deps(self, deps):
+        """Raise an exception if some operations depend on each other in
+        a loop, so they could never be started.
+
+        """
+        users = [[] for d in deps]
+        for (i, d) in enumerate(deps):
+            for j in d:
+                users[j].append(i)
+                pass
+            pass
+        waiting = [len(d) for d in deps]
+        ready = [i for i in range(len(deps)) if waiting[i] == 0]
+        count = 0
+        while ready:
+            i = ready.pop()
+            count += 1
+            for u in users[i]:
+                waiting[u] -= 1
+                if waiting[u] == 0:
+                    ready.append(u)
+                    pass
+                pass
+            pass
+        if count != len(deps):
+            loop = [str(self.ops[i].opname) for i in range(len(deps))
+                    if waiting[i] > 0]
+            raise Exception("Operations depend on each other in a loop: " +
+                            ", ".join(loop))
+        return
+
+    def commit_parallel(self):
+        """Commit the operations on commit_workers threads.  An
+        operation is started when all the ones it depends on are done.
+        If one fails, no more are started and the error is raised when
+        the running ones finish.
+
+        """
+        deps = self.op_deps()
+        users = [[] for op in self.ops]
+        for (i, d) in enumerate(deps):
+            for j in d:
+                users[j].append(i)
+                pass
+            pass
+        waiting = [len(d) for d in deps]
+        ready = [i for i in range(len(self.ops)) if waiting[i] == 0]
+        running = {}
+        err = None
+        with concurrent.futures.ThreadPoolExecutor(self.commit_workers) as ex:
+            while True:
+                while ready and err is None:
+                    i = ready.pop(0)
+                    running[ex.submit(self.commit_op_parallel,
+                                      self.ops[i])] = i
+                    pass
+                if not running:
+                    break
+                (done, notdone) = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for f in done:
+                    i = running.pop(f)
+                    if f.exception() is not None:
+                        if err is None:
+                            err = f.exception()
+                            pass
+                        continue
+                    for u in users[i]:
+                        waiting[u] -= 1
+                        if waiting[u] == 0:
+                            ready.append(u)
+                            pass
+                        pass
+                    pass
+                pass
+            pass
+        if err is not None:
+            raise err
+        if len(self.commit_order) != len(self.ops):
+            # op_deps() should have caught this.
+            raise Exception("Not all operations could be committed")
+        return
+
+    async def acommit_op(self, op):
+        try:
+            await op.acommit()
+        finally:
+            self.commit_order.append(op)
+            pass
+        return
+
+    async def acommit_op_parallel(self, op):
+        """The asyncio version of commit_op_parallel()."""
+        if self.exclusive(op):
+            await self.acommit_op(op)
+            return
+        token = parallel_op.set(op)
+        try:
+            await self.acommit_op(op)
+        finally:
+            parallel_op.reset(token)
+            pass
+        return
+
+    async def acommit(self):
+        """The asyncio version of commit().  With one worker the
+        operations are done one at a time, in order.
+
+        """
+        self.commit_order = []
+        try:
+            if self.commit_workers > 1:
+                await self.acommit_parallel()
+                return
+            i = 0
+            while i < len(self.ops):
+                if not self.batched(self.ops[i]):
+                    await self.acommit_op(self.ops[i])
+                    i += 1
+                    continue
+                # Don't give up the event loop while privileges are
+                # raised.
+                with PrivWindow():
+                    while i < len(self.ops) and self.batched(self.ops[i]):
+                        self.commit_op(self.ops[i])
+                        i += 1
+                        pass
+                    pass
+                pass
+        finally:
+            self.invalidate_cache()
+            pass
+        return
+
+    async def acommit_parallel(self):
+        """The asyncio version of commit_parallel().  Operations whose
+        handler has its own acommit() are awaited, the others are
+        committed on a thread pool so they don't hold up the event
+        loop.  Privileged operations are committed on the event loop
+        thread without awaiting anything.
+
+        """
+        deps = self.op_deps()
+        loop = asyncio.get_running_loop()
+        sem = asyncio.BoundedSemaphore(self.commit_workers)
+        tasks = []
+        errs = []
+
+        async def run(i):
+            for j in deps[i]:
+                await tasks[j]
+                pass
+            async with sem:
+                if errs:
+                    raise errs[0]
+                op = self.ops[i]
+                acommit = getattr(type(op.handler), "acommit", None)
+                try:
+                    if op.priveleged:
+                        # Nothing else is running (see op_deps()), and
+                        # this keeps the event loop from running
+                        # anything while privileges are raised.
+                        self.commit_op(op)
+                    elif acommit is None or acommit is YangElem.acommit:
+                        await loop.run_in_executor(ex,
+                                                   self.commit_op_parallel,
+                                                   op)
+                    else:
+                        await self.acommit_op_parallel(op)
+                        pass
+                except Exception as e:
+                    errs.append(e)
+                    raise
+                pass
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(self.commit_workers) as ex:
+            for i in range(len(self.ops)):
+                tasks.append(asyncio.ensure_future(run(i)))
+                pass
+            await asyncio.gather(*tasks, return_exceptions=True)
+            pass
+        if errs:
+            raise errs[0]
+        return
+
     def commit_done(self):
-        for op in self.ops:
-            op.commit_done()
+        try:
+            self.run_ops(self.ops, lambda op : op.commit_done())
+        finally:
+            self.invalidate_cache()
             pass
         return
 
     def revert(self):
-        for op in reversed(self.ops):
-            op.do_revert()
+        # Revert in the reverse of the order the commits finished.
+        # Operations that were never committed are reverted first, in
+        # reverse, as they are for a normal commit.
+        order = list(self.commit_order)
+        committed = set(id(op) for op in order)
+        order += [op for op in self.ops if id(op) not in committed]
+        try:
+            self.run_ops(list(reversed(order)), lambda op : op.do_revert())
+        finally:
+            self.invalidate_cache()
             pass
         return
 
     def end(self):
-        for op in self.ops:
-            op.do_end()
-            pass
+        self.run_ops(self.ops, lambda op : op.do_end())
         return
 
     pass
@@ -246,18 +772,502 @@ class ProgOut:
     def program_output(self, args, timeout=1000,
                        decoder = lambda x : x.decode("utf-8")):
         """Call a program with the given arguments and return the stdout.
-        If it errors, generate an exception with stderr output."""
+        If it errors, generate an exception with stderr output.  If
+        the program takes longer than timeout seconds it is killed and
+        an error is raised."""
         p = subprocess.Popen(args, stdout=subprocess.PIPE,
                              stderr=subprocess.PIPE)
-        (out, err) = p.communicate(timeout)
+        try:
+            (out, err) = p.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            p.kill()
+            p.communicate()
+            raise RPCError("application", "operation-failed", "error",
+                           args[0] + " timed out")
         rc = p.wait()
         if rc != 0:
             raise RPCError("application", "operation-failed", "error",
                            args[0] + " error(" + str(rc) + "): " + err.decode("utf-8"))
         return decoder(out)
 
+    async def aprogram_output(self, args, timeout=1000,
+                              decoder = lambda x : x.decode("utf-8")):
+        """The asyncio version of program_output().  Other tasks on the
+        event loop run while the program runs.  If the program takes
+        longer than timeout seconds it is killed and an error is
+        raised.
+
+        """
+        p = await asyncio.create_subprocess_exec(*args,
+                                                 stdout=subprocess.PIPE,
+                                                 stderr=subprocess.PIPE)
+        try:
+            (out, err) = await asyncio.wait_for(p.communicate(), timeout)
+        except asyncio.TimeoutError:
+            p.kill()
+            await p.wait()
+            raise RPCError("application", "operation-failed", "error",
+                           args[0] + " timed out")
+        if p.returncode != 0:
+            raise RPCError("application", "operation-failed", "error",
+                           args[0] + " error(" + str(p.returncode) + "): " +
+                           err.decode("utf-8"))
+        return decoder(out)
+
     pass
 
+class ProgRunner(ProgOut):
+    """Run a batch of programs concurrently.  Add the programs with
+    submit(), then collect() runs them all and returns their outputs.
+    At most maxprocs of them run at the same time.  Use this for
+    programs that don't depend on each other, like a set of file
+    copies or removes, instead of calling program_output() on each
+    one in turn.
+
+    """
+
+    def __init__(self, maxprocs=8, timeout=1000):
+        """timeout is the default timeout, in seconds, for each program."""
+        self.maxprocs = maxprocs
+        self.timeout = timeout
+        self.jobs = []
+        return
+
+    def submit(self, args, timeout=None,
+               decoder = lambda x : x.decode("utf-8")):
+        """Add a program to the batch.  Returns the index of its output
+        in the list collect() returns.
+
+        """
+        if timeout is None:
+            timeout = self.timeout
+            pass
+        self.jobs.append((args, timeout, decoder))
+        return len(self.jobs) - 1
+
+    async def arun_job(self, sem, job):
+        (args, timeout, decoder) = job
+        async with sem:
+            return await self.aprogram_output(args, timeout=timeout,
+                                              decoder=decoder)
+
+    async def acollect(self):
+        """The asyncio version of collect()."""
+        jobs = self.jobs
+        self.jobs = []
+        sem = asyncio.BoundedSemaphore(self.maxprocs)
+        outs = await asyncio.gather(*[self.arun_job(sem, job)
+                                      for job in jobs],
+                                    return_exceptions=True)
+        # Let all the programs finish, then report the first error.
+        for out in outs:
+            if isinstance(out, BaseException):
+                raise out
+            pass
+        return outs
+
+    def collect(self):
+        """Run all the programs submitted since the last collect() and
+        wait for them to finish.  Returns a list of their outputs in
+        the order they were submitted.  If any of them failed, the
+        error for the first one that failed is raised after they have
+        all finished.  In a coroutine, use acollect() instead.
+
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return self.run_collect()
+        # We were called from an event loop, like a commit() called
+        # by the default acommit(), and another loop can't run in
+        # this thread.
+        with concurrent.futures.ThreadPoolExecutor(1) as ex:
+            return ex.submit(self.run_collect).result()
+
+    def run_collect(self):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.acollect())
+        finally:
+            loop.close()
+            pass
+
+    pass
+
+# The privileged helper protocol.  A message is a 4-byte length, then
+# a 4-byte count of fields, then each field as a 4-byte length and the
+# bytes.  All numbers are big-endian.  A request's first field is the
+# request name and the rest are its arguments, the reply is the code,
+# stdout, and stderr.  A "batch" request has a packed request in each
+# argument and the reply has a packed reply in each field.  The batch
+# stops at the first request that fails, so the reply may have fewer
+# fields than the request had arguments.
+
+def privhelper_pack(fields):
+    b = [struct.pack("!I", len(fields))]
+    for f in fields:
+        if isinstance(f, str):
+            f = f.encode("utf-8")
+            pass
+        b.append(struct.pack("!I", len(f)))
+        b.append(f)
+        pass
+    return b"".join(b)
+
+def privhelper_unpack(msg):
+    (count,) = struct.unpack_from("!I", msg, 0)
+    pos = 4
+    fields = []
+    for i in range(count):
+        (l,) = struct.unpack_from("!I", msg, pos)
+        pos += 4
+        fields.append(msg[pos:pos + l])
+        pos += l
+        pass
+    return fields
+
+def privhelper_send(sock, fields):
+    msg = privhelper_pack(fields)
+    sock.sendall(struct.pack("!I", len(msg)) + msg)
+    return
+
+def privhelper_recv_bytes(sock, n):
+    b = []
+    while n > 0:
+        d = sock.recv(n)
+        if not d:
+            return None
+        b.append(d)
+        n -= len(d)
+        pass
+    return b"".join(b)
+
+def privhelper_recv(sock):
+    """Return the fields of the next message, or None if the other end
+    closed the socket.
+
+    """
+    l = privhelper_recv_bytes(sock, 4)
+    if l is None:
+        return None
+    msg = privhelper_recv_bytes(sock, struct.unpack("!I", l)[0])
+    if msg is None:
+        return None
+    return privhelper_unpack(msg)
+
+def privhelper_do(req):
+    """Run one request in the helper, returning the reply fields.  Any
+    error is returned in the reply, a bad request must not kill the
+    helper.
+
+    """
+    try:
+        op = req[0]
+        args = req[1:]
+        if op == b"write-file":
+            (path, contents, mode) = args
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         int(mode))
+            try:
+                while contents:
+                    contents = contents[os.write(fd, contents):]
+                    pass
+            finally:
+                os.close(fd)
+                pass
+        elif op == b"rename":
+            os.replace(args[0], args[1])
+        elif op == b"unlink":
+            (path, missing_ok) = args
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                if missing_ok != b"1":
+                    raise
+                pass
+        elif op == b"exec-argv":
+            p = subprocess.run(args[1:], stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               timeout=float(args[0]))
+            return (str(p.returncode), p.stdout, p.stderr)
+        else:
+            return ("-1", b"", b"Unknown request " + op)
+    except subprocess.TimeoutExpired:
+        return ("-1", b"", b"timed out")
+    except OSError as e:
+        return (str(e.errno), b"", str(e.strerror).encode("utf-8"))
+    except Exception as e:
+        return ("-1", b"", ("Bad request: " + str(e)).encode("utf-8"))
+    return ("0", b"", b"")
+
+def privhelper_do_batch(reqs):
+    """Run the packed requests in reqs in order until one fails.
+    Returns the packed replies.
+
+    """
+    reps = []
+    for r in reqs:
+        try:
+            rep = privhelper_do(privhelper_unpack(r))
+        except Exception as e:
+            rep = ("-1", b"", ("Bad request: " + str(e)).encode("utf-8"))
+            pass
+        reps.append(privhelper_pack(rep))
+        if rep[0] != "0":
+            break
+        pass
+    return reps
+
+def privhelper_serve(sock):
+    while True:
+        try:
+            req = privhelper_recv(sock)
+        except struct.error as e:
+            # The length was good, so we can still find the next
+            # message.
+            privhelper_send(sock, ("-1", b"", b"Bad message: " +
+                                   str(e).encode("utf-8")))
+            continue
+        if req is None:
+            return
+        if req and req[0] == b"batch":
+            rep = privhelper_do_batch(req[1:])
+        else:
+            rep = privhelper_do(req)
+            pass
+        privhelper_send(sock, rep)
+        pass
+    return
+
+class PrivHelperError(OSError):
+    pass
+
+class PrivHelper:
+    """A process that stays at the initial privilege level and does
+    file writes, renames, unlinks, and runs programs for the backend
+    over a socket.  This avoids raising and dropping privileges
+    around each privileged operation.  Use start_priv_helper() to
+    get it.
+
+    """
+
+    def __init__(self):
+        self.sock = None
+        self.pid = None
+        self.lock = threading.Lock()
+        return
+
+    def start(self):
+        """Fork the helper.  Privileges are raised for the fork, so the
+        helper keeps them and we don't.
+
+        """
+        (psock, csock) = socket.socketpair()
+        euid = clixon_beh.geteuid()
+        if clixon_beh.restore_priv() < 0:
+            raise Exception("privhelper: Can't restore privileges.")
+        try:
+            pid = os.fork()
+            if pid == 0:
+                # Don't hold on to any of the backend's files or sockets.
+                try:
+                    psock.close()
+                    os.closerange(3, csock.fileno())
+                    os.closerange(csock.fileno() + 1,
+                                  os.sysconf("SC_OPEN_MAX"))
+                    privhelper_serve(csock)
+                finally:
+                    os._exit(0)
+                    pass
+                pass
+        finally:
+            csock.close()
+            if clixon_beh.drop_priv_temp(euid) < 0:
+                raise Exception("privhelper: Can't drop privileges.")
+            pass
+        self.sock = psock
+        self.pid = pid
+        return
+
+    def stop(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            os.waitpid(self.pid, 0)
+            self.pid = None
+            pass
+        return
+
+    def request(self, fields):
+        """Send a request and return the reply fields.  If the helper
+        has gone away, the request fails and a new helper is started
+        for the requests after it.  The request isn't sent again, it
+        may have been partly done.
+
+        """
+        with self.lock:
+            try:
+                privhelper_send(self.sock, fields)
+                rep = privhelper_recv(self.sock)
+            except OSError:
+                rep = None
+                pass
+            if rep is None:
+                self.restart()
+                raise Exception("privhelper: The helper process has exited.")
+            pass
+        return rep
+
+    def restart(self):
+        """Clean up after a helper that has exited and start a new one.
+        This needs privileges to be restorable.
+
+        """
+        try:
+            self.stop()
+        except OSError:
+            self.sock = None
+            self.pid = None
+            pass
+        try:
+            self.start()
+        except Exception as e:
+            raise Exception("privhelper: The helper process has exited"
+                            " and could not be restarted: " + str(e))
+        return
+
+    def write_file(self, path, contents, mode=0o644):
+        """Write contents (a str or bytes) to path, creating it with mode
+        if it doesn't exist.
+
+        """
+        self.batch().write_file(path, contents, mode).run()
+        return
+
+    def rename(self, src, dest):
+        self.batch().rename(src, dest).run()
+        return
+
+    def unlink(self, path, missing_ok=False):
+        self.batch().unlink(path, missing_ok).run()
+        return
+
+    def program_output(self, args, timeout=1000,
+                       decoder = lambda x : x.decode("utf-8")):
+        """Like ProgOut.program_output(), but the program runs in the
+        helper.
+
+        """
+        return self.batch().program_output(args, timeout, decoder).run()[0]
+
+    def batch(self):
+        """Return a PrivHelperBatch to send a number of requests to the
+        helper at once.
+
+        """
+        return PrivHelperBatch(self)
+
+    pass
+
+class PrivHelperBatch:
+    """A set of requests for the PrivHelper.  Add requests with the
+    methods below, each returns the batch so they can be chained.
+    run() sends them all to the helper as one message, it does them
+    in order.
+
+    """
+
+    def __init__(self, helper):
+        self.helper = helper
+        self.reqs = []
+        self.checks = []
+        return
+
+    def write_file(self, path, contents, mode=0o644):
+        self.reqs.append(("write-file", path, contents, str(mode)))
+        self.checks.append(self.check_file_reply)
+        return self
+
+    def rename(self, src, dest):
+        self.reqs.append(("rename", src, dest))
+        self.checks.append(self.check_file_reply)
+        return self
+
+    def unlink(self, path, missing_ok=False):
+        if missing_ok:
+            self.reqs.append(("unlink", path, "1"))
+        else:
+            self.reqs.append(("unlink", path, "0"))
+            pass
+        self.checks.append(self.check_file_reply)
+        return self
+
+    def program_output(self, args, timeout=1000,
+                       decoder = lambda x : x.decode("utf-8")):
+        self.reqs.append(["exec-argv", str(timeout)] + list(args))
+        self.checks.append(lambda req, rep : self.check_exec_reply(req, rep,
+                                                                   decoder))
+        return self
+
+    def check_file_reply(self, req, rep):
+        code = int(rep[0])
+        if code != 0:
+            raise PrivHelperError(code, "%s %s: %s" %
+                                  (req[0], req[1], rep[2].decode("utf-8")))
+        return None
+
+    def check_exec_reply(self, req, rep, decoder):
+        if int(rep[0]) != 0:
+            raise RPCError("application", "operation-failed", "error",
+                           req[2] + " error(" + rep[0].decode("utf-8") +
+                           "): " + rep[2].decode("utf-8"))
+        return decoder(rep[1])
+
+    def run(self):
+        """Send the requests and wait for them to be done.  Returns a
+        list with the output of each program_output() request and None
+        for the others.  The helper stops at the first request that
+        fails, the ones after it are not done, and its error is
+        raised.
+
+        """
+        reqs = self.reqs
+        checks = self.checks
+        self.reqs = []
+        self.checks = []
+        if len(reqs) == 0:
+            return []
+        reps = self.helper.request(["batch"] +
+                                   [privhelper_pack(r) for r in reqs])
+        if len(reps) == 0 or len(reps) > len(reqs):
+            raise Exception("privhelper: Invalid batch reply.")
+        rv = []
+        for (req, rep, check) in zip(reqs, reps, checks):
+            rv.append(check(req, privhelper_unpack(rep)))
+            pass
+        if len(rv) < len(reqs):
+            raise Exception("privhelper: Batch stopped without an error.")
+        return rv
+
+    pass
+
+priv_helper = None
+
+def start_priv_helper():
+    """Start the privileged helper if it isn't running and return it.
+    Call this when your module is loaded, before clixon drops
+    privileges.  It will work later, too, as long as privileges can
+    still be restored.
+
+    """
+    global priv_helper
+    if priv_helper is None:
+        h = PrivHelper()
+        h.start()
+        priv_helper = h
+        pass
+    return priv_helper
+
 class YangType(Enum):
     # Types of elements, etype in the init method
     NOTYPE = 0
@@ -273,44 +1283,225 @@ def parsepathentry(e):
     """Parse value in the form "[pfx:]name[\\[[pfx:]indexname='value'\\]]"
     Ignore the prefixes, get the name, indexname, and value.
     """
-    name = e.split(":", 1)
     indexname = None
     index = None
-    if len(name) == 1:
-        name = name[0]
-    elif "[" in name[1]:
-        (name, index) = name[1].split("[", 1)
+    if "[" in e:
+        # Split on the '[' first, the index value may have a ':' in it.
+        (name, index) = e.split("[", 1)
         index = index[:-1] # Remove the ']' at the end
-        if ':' in name:
-            name = name.split(":")[1]
-            pass
         (indexname, index) = index.split("=", 1)
         if ':' in indexname:
             indexname = indexname.split(":")[1]
             pass
         index = index[1:-1] # remove the quotes
     else:
-        name = name[1]
+        name = e
+        pass
+    if ':' in name:
+        name = name.split(":")[1]
         pass
     return (name, indexname, index)
 
-class GetData:
-    """This is the base class to pass into the getvalue, getonevalue,
-    and getxml methods below.  It contains getnonconfig, which sets
-    whether to return nonconfig data along with the config data.  You
-    may add your own data into it.  More items may be added in the
-    future.
+class GetData:
+    """This is the base class to pass into the getvalue, getonevalue,
+    and getxml methods below.  It contains getnonconfig, which sets
+    whether to return nonconfig data along with the config data.  You
+    may add your own data into it.  More items may be added in the
+    future.
+
+    It also holds a cache of values for the get operation, see fetch(),
+    and statecache, the StateCache for the handler if it has one.
+
+    """
+    def __init__(self, getnonconfig=True, statecache=None):
+        self.getnonconfig = getnonconfig
+        self.statecache = statecache
+        self.cache = {}
+        self.atasks = {}
+        return
+
+    def fetch(self, key, fetcher, paths=None):
+        """Return the value stored under key for this get operation.  The
+        first time a key is asked for, fetcher() is called to get the
+        value, after that the stored value is returned.  The values
+        go away when the get operation is done.  This is useful for
+        things that are needed by a number of elements, like the
+        output of a program that returns information about all the
+        interfaces, so it is only fetched once per get.
+
+        If paths is not None and there is a statecache, the value is
+        also kept in the statecache so other get operations in the
+        next little while can use it.  paths is a list of the
+        configuration paths that, if a commit touches them, may change
+        the value.  Use an empty list if no configuration affects the
+        value.
+
+        """
+        if key in self.cache:
+            return self.cache[key]
+        if paths is not None and self.statecache is not None:
+            v = self.statecache.fetch(key, fetcher, paths)
+        else:
+            v = fetcher()
+            pass
+        self.cache[key] = v
+        return v
+
+    async def afetch(self, key, afetcher, paths=None):
+        """The asyncio version of fetch(), afetcher() is awaited to get
+        the value.  If several tasks ask for the same key at the same
+        time, afetcher() is only called once and they all wait for it.
+        Values are shared with fetch().
+
+        """
+        if key in self.cache:
+            return self.cache[key]
+        t = self.atasks.get(key)
+        if t is None:
+            t = asyncio.ensure_future(self.afetch_value(key, afetcher, paths))
+            self.atasks[key] = t
+            pass
+        return await t
+
+    async def afetch_value(self, key, afetcher, paths):
+        try:
+            if paths is not None and self.statecache is not None:
+                v = await self.statecache.afetch(key, afetcher, paths)
+            else:
+                v = await afetcher()
+                pass
+        finally:
+            del self.atasks[key]
+            pass
+        self.cache[key] = v
+        return v
+
+    pass
+
+class StateCache:
+    """A cache of values that lasts across get operations.  If a
+    management system is polling often, this avoids fetching the same
+    data over and over.  Each value lasts for ttl seconds, and is
+    thrown away earlier if a commit changes anything under one of the
+    paths it was stored with.  A handler opts into this by passing one
+    to TopElemHandler, then values are added to it with
+    GetData.fetch().
+
+    """
+    def __init__(self, ttl=0.5):
+        self.ttl = ttl
+        self.entries = {}
+        return
+
+    def fetch(self, key, fetcher, paths=()):
+        """Return the value for key if it's in the cache and not too old.
+        Otherwise call fetcher() to get it, store it, and return it.
+
+        """
+        if key in self.entries:
+            (stamp, epaths, v) = self.entries[key]
+            if time.monotonic() - stamp < self.ttl:
+                return v
+            pass
+        v = fetcher()
+        self.entries[key] = (time.monotonic(), tuple(paths), v)
+        return v
+
+    async def afetch(self, key, afetcher, paths=()):
+        """The asyncio version of fetch(), afetcher() is awaited."""
+        if key in self.entries:
+            (stamp, epaths, v) = self.entries[key]
+            if time.monotonic() - stamp < self.ttl:
+                return v
+            pass
+        v = await afetcher()
+        self.entries[key] = (time.monotonic(), tuple(paths), v)
+        return v
+
+    def invalidate(self, path="/"):
+        """Throw away all entries with a path that is above or below the
+        given path.  "/" throws everything away.
+
+        """
+        if path == "/":
+            self.entries = {}
+            return
+        for key in list(self.entries):
+            for p in self.entries[key][1]:
+                if (p == path or path.startswith(p + "/") or
+                    p.startswith(path + "/")):
+                    del self.entries[key]
+                    break
+                pass
+            pass
+        return
+
+    pass
+
+class XMLOut:
+    """An output sink for XML generation.  Instead of each level of the
+    tree building a string and returning it to its parent (which copies
+    the data over and over again), the writexml(), writevalue() and
+    writeonevalue() methods append fragments to one of these and the
+    full string is joined once at the end with getvalue().
+
+    """
+    def __init__(self):
+        self.frags = []
+        return
+
+    def write(self, s):
+        if s:
+            self.frags.append(s)
+            pass
+        return
+
+    def open_elem(self, header):
+        """Write the opening tag for an element.  Returns a mark that
+        must be passed to close_elem().
+
+        """
+        mark = len(self.frags)
+        self.frags.append(header)
+        return mark
+
+    def close_elem(self, mark, footer):
+        """Write the closing tag for an element.  If nothing was written
+        since open_elem(), the opening tag is removed instead, the same
+        as xmlwrap() does for an empty value.
 
-    """
-    def __init__(self, getnonconfig=True):
-        self.getnonconfig = getnonconfig
+        """
+        if len(self.frags) == mark + 1:
+            del self.frags[mark:]
+        else:
+            self.frags.append(footer)
+            pass
+        return
+
+    def write_out(self, other):
+        """Append everything written into the XMLOut other."""
+        self.frags.extend(other.frags)
         return
 
+    def getvalue(self):
+        return "".join(self.frags)
+
     pass
 
-def xml_full_index(o, data, vdata):
-    xml = ""
-    for i in o.fetch_full_index(vdata):
+def xml_full_index_out(o, data, out, vdata):
+    """Write all the entries of list o into out."""
+    stream = (not o.xmlgvprocvalue and
+              type(o).getonevalue is YangElem.getonevalue)
+    for i in o.fetch_full_index_data(data, vdata):
+        if stream:
+            if o.wrapgvxml:
+                mark = out.open_elem(o.xmlheader())
+                o.writeonevalue(data, out, vdata=i)
+                out.close_elem(mark, o.xmlfooter())
+            else:
+                o.writeonevalue(data, out, vdata=i)
+                pass
+            continue
         if o.xmlgvprocvalue:
             s = xmlescape(o.getonevalue(data, vdata=i))
         else:
@@ -319,9 +1510,135 @@ def xml_full_index(o, data, vdata):
         if o.wrapgvxml:
             s = o.xmlwrap(s)
             pass
-        xml += s
+        out.write(s)
+        pass
+    return
+
+def xml_full_index(o, data, vdata):
+    out = XMLOut()
+    xml_full_index_out(o, data, out, vdata)
+    return out.getvalue()
+
+def elem_writexml(e, data, out, path, indexname=None, index=None,
+                  vdata=None):
+    """Write the XML for element e into out.  If the element's class
+    overrides the string-returning getxml(), that is called and its
+    return value is written.
+
+    """
+    if type(e).getxml is YangElem.getxml:
+        e.writexml(data, out, path, indexname=indexname, index=index,
+                   vdata=vdata)
+    else:
+        out.write(e.getxml(data, path, indexname=indexname, index=index,
+                           vdata=vdata))
+        pass
+    return
+
+def elem_writevalue(e, data, out, vdata=None):
+    """Write the value of child element e into out, escaping and
+    wrapping it as set in the element.  If the element's class
+    overrides the string-returning getvalue(), that is called and its
+    return value is written.
+
+    """
+    if (type(e).getvalue is YangElem.getvalue and
+            not e.xmlprocvalue and not e.wrapxml):
+        e.writevalue(data, out, vdata=vdata)
+        return
+    s = str(e.getvalue(data, vdata=vdata))
+    if e.xmlprocvalue:
+        s = xmlescape(s)
+        pass
+    if e.wrapxml:
+        s = e.xmlwrap(s)
+        pass
+    out.write(s)
+    return
+
+# The asyncio versions of the above.  Instead of writing into an
+# XMLOut that is passed in, the pieces that can run concurrently each
+# write into their own XMLOut, and those are put together in order
+# when they are all done.
+
+async def axml_index_entry_out(o, data, vdata):
+    """Return an XMLOut with list entry vdata of list o."""
+    out = XMLOut()
+    if not o.xmlgvprocvalue and type(o).getonevalue is YangElem.getonevalue:
+        if o.wrapgvxml:
+            mark = out.open_elem(o.xmlheader())
+            await o.awriteonevalue(data, out, vdata=vdata)
+            out.close_elem(mark, o.xmlfooter())
+        else:
+            await o.awriteonevalue(data, out, vdata=vdata)
+            pass
+        return out
+    if o.xmlgvprocvalue:
+        s = xmlescape(o.getonevalue(data, vdata=vdata))
+    else:
+        s = str(o.getonevalue(data, vdata=vdata))
+        pass
+    if o.wrapgvxml:
+        s = o.xmlwrap(s)
+        pass
+    out.write(s)
+    return out
+
+async def axml_full_index_out(o, data, out, vdata):
+    """Write all the entries of list o into out, the entries are
+    fetched concurrently.
+
+    """
+    items = await o.afetch_full_index_data(data, vdata)
+    outs = await asyncio.gather(*[axml_index_entry_out(o, data, i)
+                                  for i in items])
+    for eout in outs:
+        out.write_out(eout)
+        pass
+    return
+
+async def aelem_writexml(e, data, out, path, indexname=None, index=None,
+                         vdata=None):
+    """The asyncio version of elem_writexml()."""
+    if type(e).getxml is YangElem.getxml:
+        await e.awritexml(data, out, path, indexname=indexname, index=index,
+                          vdata=vdata)
+    else:
+        out.write(e.getxml(data, path, indexname=indexname, index=index,
+                           vdata=vdata))
+        pass
+    return
+
+async def aelem_value_out(e, data, vdata=None):
+    """The asyncio version of elem_writevalue(), but it returns a new
+    XMLOut with the value.  If the element's class overrides
+    agetvalue(), that is awaited for the value.
+
+    """
+    out = XMLOut()
+    if type(e).agetvalue is not YangElem.agetvalue:
+        s = str(await e.agetvalue(data, vdata=vdata))
+    elif (type(e).getvalue is YangElem.getvalue and
+            not e.xmlprocvalue and not e.wrapxml):
+        await e.awritevalue(data, out, vdata=vdata)
+        return out
+    else:
+        s = str(e.getvalue(data, vdata=vdata))
         pass
-    return xml
+    if e.xmlprocvalue:
+        s = xmlescape(s)
+        pass
+    if e.wrapxml:
+        s = e.xmlwrap(s)
+        pass
+    out.write(s)
+    return out
+
+async def amap_value_out(m, data, vdata=None):
+    """Return an XMLOut with the values of everything in map m."""
+    out = XMLOut()
+    await m.awriteonevalue(data, out, vdata=vdata)
+    return out
 
 class YangElem(PrivOp, ProgOut):
     """The base class for operation handler (what goes into an "Op" class
@@ -338,7 +1655,7 @@ class YangElem(PrivOp, ProgOut):
     """
     def __init__(self, name, etype, children = None, validate_all = False,
                  xmlprocvalue = None, wrapxml = None, namespace = None,
-                 isconfig = True, parent = None):
+                 isconfig = True, parent = None, indexkey = None):
         """name should be the xml tag name for this operations.  children, if
         set, should be a map of the xml elements that can occur in
         this xml element, and their handlers.  If validate_all is set,
@@ -367,6 +1684,14 @@ class YangElem(PrivOp, ProgOut):
         getxml() will not be called for the object if
         data.getnonconfig is False.
 
+        For lists, indexkey may be set to get the key value from the
+        list items that fetch_full_index() returns.  It may be a
+        function that takes the item and returns the key, otherwise
+        item[indexkey] is used.  If set, a get on a single list entry
+        looks it up in a dictionary built once per get from
+        fetch_full_index() and fetch_index() is not used.  See
+        fetch_keyed_index().
+
         """
         self.etype = etype
         self.wrapgvxml = True
@@ -374,6 +1699,7 @@ class YangElem(PrivOp, ProgOut):
         self.namespace = namespace
         self.parent = parent
         self.isconfig = isconfig
+        self.indexkey = indexkey
         if etype == YangType.CONTAINER or etype == YangType.CHOICE:
             self.indexed = False
             self.xmlprocvalue = False
@@ -410,27 +1736,39 @@ class YangElem(PrivOp, ProgOut):
             self.xmlgvprocvalue = self.xmlprocvalue
             self.xmlprocvalue = False
             pass
+        self.set_tags()
         return
 
-    def xmlheader(self):
+    def set_tags(self):
+        """Build the open and close tag strings for the element.  This
+        is done when the element is created and when it is added to a
+        map.  If you change the name or namespace after that, you must
+        call this.
+
+        """
         if self.namespace is not None:
-            return "<" + self.name + " xmlns=\"" + self.namespace + "\">"
+            self.xmlopen = "<" + self.name + " xmlns=\"" + self.namespace + "\">"
         else:
-            return "<" + self.name + ">"
+            self.xmlopen = "<" + self.name + ">"
+            pass
+        self.xmlclose = "</" + self.name + ">"
         return
 
+    def xmlheader(self):
+        return self.xmlopen
+
+    def xmlfooter(self):
+        return self.xmlclose
+
     def xmlwrap(self, xml):
         if len(xml) == 0:
             return ""
-        return self.xmlheader() + xml + "</" + self.name + ">"
+        return self.xmlheader() + xml + self.xmlfooter()
 
     def validate_add(self, data, xml):
         """Validate add of an element list.  Leaf elements should override
         this."""
-        for i in range(0, xml.nr_children_type(clixon_beh.XMLOBJ_TYPE_ELEMENT)):
-            x = xml.child_i(i)
-            if x.get_type() != clixon_beh.XMLOBJ_TYPE_ELEMENT:
-                continue
+        for x in xml.children(clixon_beh.XMLOBJ_TYPE_ELEMENT):
             self.children.validate_add(data, x)
             pass
         return
@@ -438,58 +1776,68 @@ class YangElem(PrivOp, ProgOut):
     def validate_del(self, data, xml):
         """Validate delete of an element list.  Leaf elements should override
         this."""
-        for i in range(0, xml.nr_children_type(clixon_beh.XMLOBJ_TYPE_ELEMENT)):
-            x = xml.child_i(i)
-            if x.get_type() != clixon_beh.XMLOBJ_TYPE_ELEMENT:
-                continue
+        for x in xml.children(clixon_beh.XMLOBJ_TYPE_ELEMENT):
             self.children.validate_del(data, x)
             pass
         return
 
     def validate(self, data, origxml, newxml):
         """Validate an element list.  Leaf elements should override this."""
-        oi = 0
+        if not self.validate_all:
+            # Only the changed children are needed, let the C code
+            # skip over the unchanged ones so a small change to a
+            # big list doesn't have to look at every entry.
+            for (op, oxml, nxml) in clixon_beh.changed_children(origxml,
+                                                                newxml):
+                if op == "del":
+                    self.children.validate_del(data, oxml)
+                elif op == "add":
+                    self.children.validate_add(data, nxml)
+                else:
+                    self.children.validate(data, oxml, nxml)
+                    pass
+                pass
+            return
+
+        # Everything gets validated.  Fetch all the children and
+        # their flags in one call each, this is a lot faster than
+        # fetching them one at a time.
         if origxml:
-            oxml = origxml.child_i(oi)
+            ochildren = origxml.children_with_flags()
         else:
-            oxml = None
+            ochildren = []
             pass
-        ni = 0
         if newxml:
-            nxml = newxml.child_i(ni)
+            nchildren = newxml.children_with_flags()
         else:
-            nxml = None
+            nchildren = []
             pass
-        while oxml or nxml:
+        oi = 0
+        ni = 0
+        while oi < len(ochildren) or ni < len(nchildren):
+            oxml = None
             oxmlf = 0
-            if oxml:
-                oxmlf = oxml.get_flags(clixon_beh.XMLOBJ_FLAG_FULL_MASK)
+            if oi < len(ochildren):
+                (name, oxmlf, body, oxml) = ochildren[oi]
                 pass
+            nxml = None
             nxmlf = 0
-            if nxml:
-                nxmlf = nxml.get_flags(clixon_beh.XMLOBJ_FLAG_FULL_MASK)
+            if ni < len(nchildren):
+                (name, nxmlf, body, nxml) = nchildren[ni]
                 pass
             if oxmlf & clixon_beh.XMLOBJ_FLAG_DEL:
                 self.children.validate_del(data, oxml)
                 oi += 1
-                oxml = origxml.child_i(oi)
             elif nxmlf & clixon_beh.XMLOBJ_FLAG_ADD:
                 self.children.validate_add(data, nxml)
                 ni += 1
-                nxml = newxml.child_i(ni)
             else:
-                if (self.validate_all or
-                        nxmlf & clixon_beh.XMLOBJ_FLAG_CHANGE or
-                        oxmlf & clixon_beh.XMLOBJ_FLAG_CHANGE):
-                    self.children.validate(data, oxml, nxml)
-                    pass
+                self.children.validate(data, oxml, nxml)
                 if oxml:
                     oi += 1
-                    oxml = origxml.child_i(oi)
                     pass
                 if nxml:
                     ni += 1
-                    nxml = newxml.child_i(ni)
                     pass
                 pass
             pass
@@ -507,6 +1855,14 @@ class YangElem(PrivOp, ProgOut):
     def end(self, op):
         return
 
+    async def acommit(self, op):
+        """The asyncio version of commit(), used with AsyncTopElemHandler.
+        By default it calls commit().
+
+        """
+        self.commit(op)
+        return
+
     def fetch_index(self, indexname, index, vdata):
         """Fetch the value data (vdata) for the given index.  You must
         override this method if you are a list.
@@ -521,6 +1877,97 @@ class YangElem(PrivOp, ProgOut):
         """
         raise Exception("No full index function for " + self.name)
 
+    def fetch_index_data(self, data, indexname, index, vdata):
+        """The framework calls this to fetch a list entry.  It's the
+        same as fetch_index(), but the GetData object for the operation
+        is passed in so you can use data.fetch() to share values with
+        other elements.  By default it calls fetch_index(), or looks
+        up the entry with fetch_keyed_index() if indexkey is set.
+
+        """
+        if self.indexkey is not None:
+            return self.fetch_keyed_index(data, vdata).get(index)
+        return self.fetch_index(indexname, index, vdata)
+
+    def index_key(self, item):
+        """Return the key value for a list item using indexkey."""
+        if callable(self.indexkey):
+            return self.indexkey(item)
+        return item[self.indexkey]
+
+    def fetch_keyed_index(self, data, vdata):
+        """Return a dictionary of the list items from
+        fetch_full_index_data(), keyed by index_key().  It is built
+        once per get for each vdata and kept in data.
+
+        """
+        if data is None:
+            return self.build_keyed_index(data, vdata)
+        # vdata is kept in the cache along with the index so its id
+        # can't be reused while the index is there.
+        (v, index) = data.fetch(("tf keyed index", id(self), id(vdata)),
+                                lambda : (vdata,
+                                          self.build_keyed_index(data, vdata)))
+        return index
+
+    def build_keyed_index(self, data, vdata):
+        index = {}
+        for i in self.fetch_full_index_data(data, vdata):
+            index[self.index_key(i)] = i
+            pass
+        return index
+
+    def fetch_full_index_data(self, data, vdata):
+        """The framework calls this to fetch all the list entries.  Like
+        fetch_index_data(), override this if you need the GetData
+        object.  By default it just calls fetch_full_index().
+
+        """
+        return self.fetch_full_index(vdata)
+
+    async def afetch_full_index(self, vdata):
+        """The asyncio version of fetch_full_index().  By default it calls
+        fetch_full_index().
+
+        """
+        return self.fetch_full_index(vdata)
+
+    async def afetch_full_index_data(self, data, vdata):
+        """The asyncio version of fetch_full_index_data().  If the class
+        overrides afetch_full_index(), that is awaited, otherwise
+        fetch_full_index_data() is called.
+
+        """
+        if type(self).afetch_full_index is not YangElem.afetch_full_index:
+            return await self.afetch_full_index(vdata)
+        return self.fetch_full_index_data(data, vdata)
+
+    async def afetch_index_data(self, data, indexname, index, vdata):
+        """The asyncio version of fetch_index_data()."""
+        if self.indexkey is not None:
+            return (await self.afetch_keyed_index(data, vdata)).get(index)
+        return self.fetch_index(indexname, index, vdata)
+
+    async def afetch_keyed_index(self, data, vdata):
+        """The asyncio version of fetch_keyed_index(), it shares the
+        index with fetch_keyed_index().
+
+        """
+        if data is None:
+            return await self.abuild_keyed_index(data, vdata)
+        async def afetcher():
+            return (vdata, await self.abuild_keyed_index(data, vdata))
+        (v, index) = await data.afetch(("tf keyed index", id(self), id(vdata)),
+                                       afetcher)
+        return index
+
+    async def abuild_keyed_index(self, data, vdata):
+        index = {}
+        for i in await self.afetch_full_index_data(data, vdata):
+            index[self.index_key(i)] = i
+            pass
+        return index
+
     def getxml(self, data, path, indexname=None, index=None, vdata=None):
         """Process a get operation before the path has ended.  We are
         just parsing down the path until we hit then end.  indexname
@@ -533,52 +1980,166 @@ class YangElem(PrivOp, ProgOut):
         The getnonconfig element is used to know if the requester
         wants nonconfig data in addition to config data.
 
+        This returns a string, it's a wrapper around writexml().
+
+        """
+        out = XMLOut()
+        self.writexml(data, out, path, indexname=indexname, index=index,
+                      vdata=vdata)
+        return out.getvalue()
+
+    def writexml(self, data, out, path, indexname=None, index=None,
+                 vdata=None):
+        """Like getxml(), but write the XML into the XMLOut object out
+        instead of returning it.
+
         """
         if not data.getnonconfig and not self.isconfig:
-            return ""
+            return
         if self.indexed:
             if index is None:
                 # Return the whole list.
-                return xml_full_index(self, data, vdata)
-            vdata = self.fetch_index(indexname, index, vdata)
+                xml_full_index_out(self, data, out, vdata)
+                return
+            vdata = self.fetch_index_data(data, indexname, index, vdata)
             if vdata is None:
-                return ""
+                return
             pass
         elif indexname is not None:
             raise Exception("Index is set for " + self.name +
                             " which doesn't support indexes")
 
+        if len(path) == 0 and self.children is None:
+            out.write(self.xmlwrap(self.getvalue(data, vdata=vdata)))
+            return
+        mark = out.open_elem(self.xmlheader())
         if len(path) == 0:
-            if self.children is None:
-                xml = self.getvalue(data, vdata=vdata)
+            self.children.writeonevalue(data, out, vdata=vdata)
+        else:
+            self.children.writexml(data, out, path, vdata=vdata)
+            pass
+        out.close_elem(mark, self.xmlfooter())
+        return
+
+    async def awritexml(self, data, out, path, indexname=None, index=None,
+                        vdata=None):
+        """The asyncio version of writexml()."""
+        if not data.getnonconfig and not self.isconfig:
+            return
+        if self.indexed:
+            if index is None:
+                # Return the whole list.
+                await axml_full_index_out(self, data, out, vdata)
+                return
+            vdata = await self.afetch_index_data(data, indexname, index, vdata)
+            if vdata is None:
+                return
+            pass
+        elif indexname is not None:
+            raise Exception("Index is set for " + self.name +
+                            " which doesn't support indexes")
+
+        if len(path) == 0 and self.children is None:
+            if type(self).agetvalue is not YangElem.agetvalue:
+                v = await self.agetvalue(data, vdata=vdata)
             else:
-                xml = self.children.getonevalue(data, vdata=vdata)
+                v = self.getvalue(data, vdata=vdata)
+                pass
+            out.write(self.xmlwrap(v))
+            return
+        mark = out.open_elem(self.xmlheader())
+        if len(path) == 0:
+            await self.children.awriteonevalue(data, out, vdata=vdata)
         else:
-            xml = self.children.getxml(data, path, vdata=vdata)
+            await self.children.awritexml(data, out, path, vdata=vdata)
             pass
-        xml = self.xmlwrap(xml)
-        return xml
+        out.close_elem(mark, self.xmlfooter())
+        return
 
     def getonevalue(self, data, vdata=None):
+        out = XMLOut()
+        self.writeonevalue(data, out, vdata=vdata)
+        return out.getvalue()
+
+    def writeonevalue(self, data, out, vdata=None):
         if not data.getnonconfig and not self.isconfig:
-            return ""
-        return self.children.getonevalue(data, vdata=vdata)
+            return
+        self.children.writeonevalue(data, out, vdata=vdata)
+        return
+
+    async def awriteonevalue(self, data, out, vdata=None):
+        """The asyncio version of writeonevalue()."""
+        if not data.getnonconfig and not self.isconfig:
+            return
+        await self.children.awriteonevalue(data, out, vdata=vdata)
+        return
 
     def getvalue(self, data, vdata=None):
         """Return the xml strings for this node.  Leaf nodes should
         override this and return the value.
 
+        """
+        out = XMLOut()
+        self.writevalue(data, out, vdata=vdata)
+        return out.getvalue()
+
+    def writevalue(self, data, out, vdata=None):
+        """Like getvalue(), but write the XML into the XMLOut object out
+        instead of returning it.  Leaf nodes should override getvalue(),
+        not this.
+
         """
         if not data and not self.isconfig:
-            return ""
+            return
         if self.indexed:
-            xml = xml_full_index(self, data, vdata)
+            xml_full_index_out(self, data, out, vdata)
+            return
+        if type(self).getonevalue is not YangElem.getonevalue:
+            xml = str(self.getonevalue(data, vdata=vdata))
+            if self.wrapgvxml:
+                xml = self.xmlwrap(xml)
+                pass
+            out.write(xml)
+        elif self.wrapgvxml:
+            mark = out.open_elem(self.xmlheader())
+            self.writeonevalue(data, out, vdata=vdata)
+            out.close_elem(mark, self.xmlfooter())
         else:
+            self.writeonevalue(data, out, vdata=vdata)
+            pass
+        return
+
+    async def agetvalue(self, data, vdata=None):
+        """The asyncio version of getvalue().  Leaf nodes that have to
+        wait on something, like a program or a file, can override
+        this instead of getvalue() and use await, then with
+        AsyncTopElemHandler the other leaves are fetched while this
+        waits.  By default it calls getvalue().
+
+        """
+        return self.getvalue(data, vdata=vdata)
+
+    async def awritevalue(self, data, out, vdata=None):
+        """The asyncio version of writevalue()."""
+        if not data and not self.isconfig:
+            return
+        if self.indexed:
+            await axml_full_index_out(self, data, out, vdata)
+            return
+        if type(self).getonevalue is not YangElem.getonevalue:
             xml = str(self.getonevalue(data, vdata=vdata))
             if self.wrapgvxml:
                 xml = self.xmlwrap(xml)
+                pass
+            out.write(xml)
+        elif self.wrapgvxml:
+            mark = out.open_elem(self.xmlheader())
+            await self.awriteonevalue(data, out, vdata=vdata)
+            out.close_elem(mark, self.xmlfooter())
+        else:
+            await self.awriteonevalue(data, out, vdata=vdata)
             pass
-        return xml
+        return
 
     def find_path(self):
         """Return the full path for the element by getting the parents
@@ -586,7 +2147,7 @@ class YangElem(PrivOp, ProgOut):
 
         """
         if not self.parent:
-            return ""
+            return "/" + self.name
         return self.parent.find_path() + "/" + self.name
 
     def find_namespace(self):
@@ -673,6 +2234,8 @@ class YangElemCommitOnly(YangElem):
     def __init__(self, name):
         self.name = name
         self.etype = YangType.NOTYPE
+        self.parent = None
+        self.namespace = None
         return
 
     def validate_add(self, data, xml):
@@ -736,8 +2299,20 @@ class YangElemValidateOnlyLeafList(YangElemValidateOnly):
     fetch_full_index() and validate_fetch_full_index() are simply the
     string items in the leaf list.  That's going to be the most common
     case.  If that's not the case, these methods can be overridden.
+    By default indexkey is set so the items are their own keys.
 
     """
+    def __init__(self, name, etype = YangType.LEAFLIST, children = None,
+                 validate_all = False, xmlprocvalue = None, wrapxml = None,
+                 namespace = None, isconfig = True, parent = None,
+                 indexkey = lambda x : x):
+        super().__init__(name, etype, children = children,
+                         validate_all = validate_all,
+                         xmlprocvalue = xmlprocvalue, wrapxml = wrapxml,
+                         namespace = namespace, isconfig = isconfig,
+                         parent = parent, indexkey = indexkey)
+        return
+
     def validate_add(self, data, xml):
         """We fetch the full list and add the string if it's not
         already there.
@@ -840,10 +2415,25 @@ class YangElemMap:
         self.mapv = {}
         self.parent = parent
         self.path = path
+        self.lookupv = None
         return
 
     def add(self, elem):
         self.mapv[elem.name] = elem
+        self.changed()
+        return
+
+    def changed(self):
+        """Throw away the lookup tables for this map and all the maps
+        above it, since they may have included this map's elements.
+        They are rebuilt on the next lookup.
+
+        """
+        m = self
+        while m is not None:
+            m.lookupv = None
+            m = m.parent
+            pass
         return
 
     def lookup_elem(self, path):
@@ -888,6 +2478,8 @@ class YangElemMap:
             raise Exception("Duplicate element " + elem.name + " in " + path)
         m.mapv[elem.name] = elem
         elem.parent = e
+        elem.set_tags()
+        m.changed()
         return m
 
     def add_map(self, path, elem):
@@ -907,17 +2499,32 @@ class YangElemMap:
         self.add_elem(path, elem)
         return
 
-    def find_child_in_map(self, name):
-        if name in self.mapv:
-            return self.mapv[name]
-        # Choice elements have special handling, we just skip them.
-        for c in self.mapv:
-            if c.etype == YangType.CHOICE:
-                if c.children and name in c.children.mapv:
-                    return c.children.mapv[name]
+    def get_lookupv(self):
+        """Return a map of names to elements for this map.  Choice
+        elements don't appear in the XML, so the children of choices
+        (and choices under them) are in here, too.  Elements directly
+        in this map take precedence.  This is built on the first
+        lookup after the map changes.
+
+        """
+        if self.lookupv is None:
+            lookupv = {}
+            for c in self.mapv.values():
+                if c.etype == YangType.CHOICE and c.children:
+                    for (name, e) in c.children.get_lookupv().items():
+                        if name not in lookupv:
+                            lookupv[name] = e
+                            pass
+                        pass
+                    pass
                 pass
+            lookupv.update(self.mapv)
+            self.lookupv = lookupv
             pass
-        return None
+        return self.lookupv
+
+    def find_child_in_map(self, name):
+        return self.get_lookupv().get(name)
 
     def validate_add(self, data, xml):
         name = xml.get_name()
@@ -950,46 +2557,73 @@ class YangElemMap:
         return
 
     def getxml(self, data, path, vdata=None):
+        out = XMLOut()
+        self.writexml(data, out, path, vdata=vdata)
+        return out.getvalue()
+
+    def writexml(self, data, out, path, vdata=None):
         (name, indexname, index) = parsepathentry(path[0])
         c = self.find_child_in_map(name)
         if c is None:
             raise RPCError("application", "invalid-value", "error",
                            "No element %s in %s " % (name, self.path))
-        x = self.mapv[name]
-        if data.getnonconfig or x.isconfig:
-            xml = x.getxml(data,
-                           path[1:],
-                           indexname=indexname,
-                           index=index,
-                           vdata=vdata)
-        else:
-            xml = ""
+        if data.getnonconfig or c.isconfig:
+            elem_writexml(c, data, out,
+                          path[1:],
+                          indexname=indexname,
+                          index=index,
+                          vdata=vdata)
             pass
-        return xml
+        return
 
     def getonevalue(self, data, vdata=None):
-        xml = ""
-        for name in self.mapv:
-            if self.mapv[name].etype == YangType.CHOICE:
-                s = self.mapv[name].children.getonevalue(data, vdata)
-            else:
-                x = self.mapv[name]
-                if data.getnonconfig or x.isconfig:
-                    s = str(x.getvalue(data, vdata=vdata))
-                    if x.xmlprocvalue:
-                        s = xmlescape(s)
-                        pass
-                    if x.wrapxml:
-                        s = x.xmlwrap(s)
-                        pass
-                    pass
-                else:
-                    s = ""
-                    pass
+        out = XMLOut()
+        self.writeonevalue(data, out, vdata=vdata)
+        return out.getvalue()
+
+    def writeonevalue(self, data, out, vdata=None):
+        for x in self.mapv.values():
+            if x.etype == YangType.CHOICE:
+                x.children.writeonevalue(data, out, vdata)
+            elif data.getnonconfig or x.isconfig:
+                elem_writevalue(x, data, out, vdata=vdata)
+                pass
+            pass
+        return
+
+    async def awritexml(self, data, out, path, vdata=None):
+        """The asyncio version of writexml()."""
+        (name, indexname, index) = parsepathentry(path[0])
+        c = self.find_child_in_map(name)
+        if c is None:
+            raise RPCError("application", "invalid-value", "error",
+                           "No element %s in %s " % (name, self.path))
+        if data.getnonconfig or c.isconfig:
+            await aelem_writexml(c, data, out,
+                                 path[1:],
+                                 indexname=indexname,
+                                 index=index,
+                                 vdata=vdata)
+            pass
+        return
+
+    async def awriteonevalue(self, data, out, vdata=None):
+        """The asyncio version of writeonevalue().  All the elements in
+        the map are fetched concurrently and written in order.
+
+        """
+        aws = []
+        for x in self.mapv.values():
+            if x.etype == YangType.CHOICE:
+                aws.append(amap_value_out(x.children, data, vdata))
+            elif data.getnonconfig or x.isconfig:
+                aws.append(aelem_value_out(x, data, vdata=vdata))
                 pass
-            xml += s
             pass
-        return xml
+        for eout in await asyncio.gather(*aws):
+            out.write_out(eout)
+            pass
+        return
 
     pass
 
@@ -1002,13 +2636,20 @@ class TopElemHandler:
 
     """
 
-    def __init__(self, name, children):
+    def __init__(self, name, children, statecache=None, priv_batch=False,
+                 commit_workers=1):
         """children is a map of elements that may be in the top level, see
-        YangElem for details.
+        YangElem for details.  If statecache is set to a StateCache
+        object, it is used to hold state values across get
+        operations, see GetData.fetch().  priv_batch and
+        commit_workers are passed to the Data for each transaction.
 
         """
         self.name = name
         self.children = children
+        self.statecache = statecache
+        self.priv_batch = priv_batch
+        self.commit_workers = commit_workers
         return
 
     # Not implemented, will just default to doing nothing:
@@ -1022,7 +2663,8 @@ class TopElemHandler:
     # You should provide methods for these if you need them.
 
     def begin(self, t):
-        d = Data()
+        d = Data(statecache=self.statecache, priv_batch=self.priv_batch,
+                 commit_workers=self.commit_workers)
         d.tf_username = clixon_beh.username_get()
         t.set_userdata(d)
         return 0
@@ -1071,6 +2713,10 @@ class TopElemHandler:
         #print("***Statedata: %s %s" % (xpath, str(nsc)))
         if data is None:
             data = GetData()
+            pass
+        if data.statecache is None:
+            data.statecache = self.statecache
+            pass
         if xpath == "/":
             # Get statedata for all top-level elements.
             xmlt = []
@@ -1091,14 +2737,101 @@ class TopElemHandler:
             path = path[1:] # Get rid of the empty thing before the first /
 
             # Handle the top-level name.  There can only be one, and
-            # it has to match one of the entries.
-            xmlt = self.children.getxml(data, path)
+            # it has to match one of the entries.  Everything is
+            # written into one output object and joined at the end.
+            out = XMLOut()
+            self.children.writexml(data, out, path)
+            xmlt = out.getvalue()
             pass
         return (0, xmlt)
 
     def system_only(self, nsc, xpath):
         return (0, "")
 
+    def add_state_prefixes(self):
+        """Tell the C code the top-level elements this handler has, so
+        it will only call statedata for gets that overlap them.  Call
+        this after setting self.p to the return from add_plugin().
+
+        """
+        for (name, c) in self.children.get_lookupv().items():
+            if c.etype != YangType.CHOICE:
+                self.p.add_state_prefix("/" + name)
+                pass
+            pass
+        return
+
+    pass
+
+class AsyncTopElemHandler(TopElemHandler):
+    """A TopElemHandler that runs gets and commits on an asyncio event
+    loop, for trees with elements that override the asyncio methods
+    of YangElem: agetvalue(), afetch_full_index(), and acommit().
+    Each handler has its own event loop.  On a get, the elements in a
+    container and the entries in a list are fetched concurrently, so
+    leaves that wait on programs or files don't wait on each other.
+    Elements that only have the normal methods work the same as they
+    do with TopElemHandler.
+
+    """
+
+    def __init__(self, name, children, statecache=None, priv_batch=False,
+                 commit_workers=1):
+        super().__init__(name, children, statecache=statecache,
+                         priv_batch=priv_batch, commit_workers=commit_workers)
+        self.loop = asyncio.new_event_loop()
+        return
+
+    def run(self, aw):
+        """Run aw on the handler's event loop and return its result."""
+        return self.loop.run_until_complete(aw)
+
+    def commit(self, t):
+        try:
+            data = t.get_userdata()
+            self.run(data.acommit())
+        except:
+            # See TopElemHandler.commit().
+            self.revert(t)
+            raise
+        return 0
+
+    def statedata(self, nsc, xpath, data = None):
+        return self.run(self.astatedata(nsc, xpath, data = data))
+
+    async def astatedata(self, nsc, xpath, data = None):
+        if data is None:
+            data = GetData()
+            pass
+        if data.statecache is None:
+            data.statecache = self.statecache
+            pass
+        if xpath == "/":
+            # Get statedata for all top-level elements at once.
+            outs = await asyncio.gather(*[self.apath_out(data, [name])
+                                          for name in self.children.mapv])
+            xmlt = []
+            for out in outs:
+                s = out.getvalue()
+                if len(s) > 0:
+                    xmlt.append(s)
+                    pass
+                pass
+            xmlt = tuple(xmlt)
+        else:
+            path = xpath.split("/")
+            if len(path) < 2:
+                return(-1, "")
+            path = path[1:] # Get rid of the empty thing before the first /
+            xmlt = (await self.apath_out(data, path)).getvalue()
+            pass
+        return (0, xmlt)
+
+    async def apath_out(self, data, path):
+        out = XMLOut()
+        await self.children.awritexml(data, out, path)
+        return out
+
     pass
 
 class RPC(PrivOp, ProgOut):
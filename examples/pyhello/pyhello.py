@@ -50,7 +50,7 @@ class ClixonHelloHandler:
     def __init__(self):
         self.world = None
         self.namespace = "http://clixon_beh/pyhello"
-        # Set to "True" to use an xml string from the transaction, False
+        # Set to "True" to use an lxml tree from the transaction, False
         # to use an xmlobj object.
         self.use_str = False
 
@@ -73,15 +73,19 @@ class ClixonHelloHandler:
 
     def validate_str(self, t):
         print("***validate**")
-        origxml = t.orig_str()
-        newxml = t.new_str()
+        # Get the xml directly as element trees, this avoids
+        # converting to a string and parsing it again.
+        origxml = t.orig_etree()
+        newxml = t.new_etree()
         data = t.get_userdata()
-        print(str(origxml))
-        print(str(newxml))
+        if origxml is not None:
+            print(etree.tostring(origxml).decode())
+        if newxml is not None:
+            print(etree.tostring(newxml).decode())
         val = None
         op = None
         if origxml is not None:
-            xn = etree.fromstring(origxml)
+            xn = origxml
             flags = xn.get("clixonflags")
             if flags:
                 flags = flags.split(",");
@@ -95,7 +99,7 @@ class ClixonHelloHandler:
                         val = xn.text
 
         if newxml is not None:
-            xn = etree.fromstring(newxml)
+            xn = newxml
             flags = xn.get("clixonflags")
             if flags:
                 flags = flags.split(",");
@@ -61,6 +61,9 @@ if sysbase is None:
     pass
 
 chronyccmd = "/usr/bin/chronyc"
+# For testing without chronyd, this can be set to a file holding
+# "chronyc tracking" output to use instead of running chronyc.
+chronyc_tracking_file = os.getenv("CHRONYD_SERVER_TRACKING_FILE")
 chronydir = sysbase + "/etc/chrony"
 chronyd_server_file = chronydir + "/conf.d/server.conf"
 
@@ -350,18 +353,72 @@ s.add_leaf("/server", NTSPort("ntsport", tf.YangType.LEAF))
 s.add_leaf("/server", ServerKey("serverkey", tf.YangType.LEAF))
 s.add_leaf("/server", ServerCert("servercert", tf.YangType.LEAF))
 
-# Both of these classes for statistics call chronyc.  You could create
-# a class for the statistics node instead of directly using YangElem
-# that fetch the data for tracking and passed it in vdata.  If you add
-# more of these; that's probably a good idea.
+# The statistics all come from "chronyc tracking".  It is run once for
+# the statistics node, parsed, and passed to the leaves in vdata.  It
+# is also kept in the state cache so frequent polls don't run chronyc
+# every time.
+
+class Tracking(tf.ProgOut):
+    """Fetch "chronyc tracking" output and parse it into a map of the
+    field name (the part before the ':') to the value.
+
+    """
+    def get_output(self):
+        return self.program_output([chronyccmd, "tracking"])
+
+    def fetch(self):
+        t = {}
+        for i in self.get_output().split("\n"):
+            i = i.split(":", 1)
+            if len(i) == 2:
+                t[i[0].strip()] = i[1].strip()
+                pass
+            pass
+        return t
+
+    pass
+
+class FakeTracking(Tracking):
+    """A stand-in for Tracking that reads the output from a file instead
+    of running chronyc, for testing without chronyd.
+
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        return
+
+    def get_output(self):
+        with open(self.filename, "r", encoding="utf-8") as f:
+            return f.read()
+        pass
+
+    pass
+
+if chronyc_tracking_file is None:
+    tracking = Tracking()
+else:
+    tracking = FakeTracking(chronyc_tracking_file)
+    pass
+
+class Statistics(tf.YangElem):
+    def fetch_tracking(self, data):
+        # The server config doesn't affect the tracking data.
+        return data.fetch("chronyc tracking", tracking.fetch, paths = [])
+
+    def getxml(self, data, path, indexname=None, index=None, vdata=None):
+        vdata = self.fetch_tracking(data)
+        return super().getxml(data, path, indexname, index, vdata=vdata)
+
+    def getvalue(self, data, vdata=None):
+        vdata = self.fetch_tracking(data)
+        return super().getvalue(data, vdata=vdata)
+
+    pass
 
 class Stratum(tf.YangElemValueOnly):
     def getvalue(self, data, vdata):
-        s = self.program_output([chronyccmd, "tracking"])
-        for i in s.split("\n"):
-            if i.startswith("Stratum"):
-                return i.split()[2]
-            pass
+        if "Stratum" in vdata:
+            return vdata["Stratum"].split()[0]
         return None
 
     pass
@@ -383,10 +440,9 @@ month_to_num = {
 
 class Time(tf.YangElemValueOnly):
     def getvalue(self, data, vdata):
-        s = self.program_output([chronyccmd, "tracking"])
-        for i in s.split("\n"):
+        for i in vdata:
             if i.startswith("Ref time"):
-                j = i.split(":", 1)[1].split()
+                j = vdata[i].split()
                 # Convert from wierd chronyd format into YANG type, which
                 # is mostly ISO 8601.  The format from chronyd is:
                 #   <dayofweek> <monthname> <day> <time> <year>
@@ -398,9 +454,9 @@ class Time(tf.YangElemValueOnly):
 
     pass
 
-s.add_map("/", tf.YangElem("statistics", tf.YangType.CONTAINER,
-                           namespace=MY_NAMESPACE,
-                           isconfig=False))
+s.add_map("/", Statistics("statistics", tf.YangType.CONTAINER,
+                          namespace=MY_NAMESPACE,
+                          isconfig=False))
 
 s.add_leaf("/statistics", Stratum("stratum", tf.YangType.LEAF))
 s.add_leaf("/statistics", Time("time", tf.YangType.LEAF))
@@ -425,5 +481,10 @@ class Handler(tf.TopElemHandler, tf.ProgOut):
 
     pass
 
-handler = Handler("chronyd-server", chronydserver)
+handler = Handler("chronyd-server", chronydserver,
+                  statecache=tf.StateCache())
 handler.p = clixon_beh.add_plugin(handler.name, MY_NAMESPACE, handler)
+handler.add_state_prefixes()
+# Our state data only reads from the system, it can run in parallel
+# with other plugins.
+handler.p.set_thread_safe(True)
@@ -35,6 +35,8 @@ import os
 import os.path
 import shlex
 import json
+import socket
+import struct
 import clixon_beh
 import clixon_beh.transaction_framework as tf
 
@@ -45,8 +47,447 @@ for i in ipcmds:
         ipcmd = i
         break
     pass
-if ipcmd is None:
-    raise Exception("ip command is not present")
+
+# Interface, address, and neighbor information comes from one of two
+# places.  If netlink is available, it's fetched directly from the
+# kernel with rtnetlink dumps.  Otherwise it's fetched by running the
+# ip command and parsing its JSON output.  Both return the same
+# dictionary layout as "ip -s -s -j addr" and "ip -j neigh", which is
+# what the element classes below expect.
+
+class Neighbors:
+    """The neighbor table for all interfaces and families.  Lists are
+    indexed by (ifname, family) and single entries by (ifname, family,
+    dst), family being "inet" or "inet6".
+
+    """
+    def __init__(self):
+        self.lists = {}
+        self.entries = {}
+        return
+
+    def add(self, ifname, family, n):
+        key = (ifname, family)
+        if key not in self.lists:
+            self.lists[key] = []
+            pass
+        self.lists[key].append(n)
+        self.entries[(ifname, family, n["dst"])] = n
+        return
+
+    def get_list(self, ifname, family):
+        return self.lists.get((ifname, family), [])
+
+    def lookup(self, ifname, family, dst):
+        return self.entries.get((ifname, family, dst))
+
+    pass
+
+class IPCmdData(tf.ProgOut):
+    """Get interface data by running the ip command."""
+    def get_interfaces(self):
+        return self.program_output([ipcmd, "-p", "-s", "-s", "-j", "addr"],
+                                   decoder = lambda x : json.loads(x))
+
+    def get_neighs(self):
+        """Return a Neighbors object with all the neighbors."""
+        neighs = Neighbors()
+        for n in self.program_output([ipcmd, "-j", "neigh", "show"],
+                                     decoder = lambda x : json.loads(x)):
+            if "dst" not in n or "dev" not in n:
+                continue
+            if ":" in n["dst"]:
+                family = "inet6"
+            else:
+                family = "inet"
+                pass
+            neighs.add(n["dev"], family, n)
+            pass
+        return neighs
+
+    pass
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+
+IFLA_ADDRESS = 1
+IFLA_BROADCAST = 2
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_OPERSTATE = 16
+IFLA_STATS64 = 23
+IFLA_CARRIER_CHANGES = 35
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+IFA_CACHEINFO = 6
+IFA_FLAGS = 8
+
+NDA_DST = 1
+NDA_LLADDR = 2
+NTF_ROUTER = 0x80
+
+# These are in the order ip prints them.
+link_flag_names = (
+    (0x8, "LOOPBACK"), (0x2, "BROADCAST"), (0x10, "POINTOPOINT"),
+    (0x1000, "MULTICAST"), (0x80, "NOARP"), (0x200, "ALLMULTI"),
+    (0x100, "PROMISC"), (0x20, "NOTRAILERS"), (0x4, "DEBUG"),
+    (0x8000, "DYNAMIC"), (0x4000, "AUTOMEDIA"), (0x2000, "PORTSEL"),
+    (0x400, "MASTER"), (0x800, "SLAVE"), (0x1, "UP"), (0x10000, "LOWER_UP"),
+    (0x20000, "DORMANT"), (0x40000, "ECHO"),
+)
+IFF_UP = 0x1
+IFF_RUNNING = 0x40
+
+link_operstates = ("UNKNOWN", "NOTPRESENT", "DOWN", "LOWERLAYERDOWN",
+                   "TESTING", "DORMANT", "UP")
+
+arphrd_names = {
+    1: "ether", 24: "ieee1394", 32: "infiniband", 512: "ppp",
+    768: "ipip", 769: "tunnel6", 772: "loopback", 776: "sit",
+    778: "gre", 823: "ip6gre", 65534: "none", 65535: "void",
+}
+
+# Address flags.  If a flag is set, ip adds the name as true.
+# Permanent is the other way around, if it is not set the address is
+# dynamic.
+addr_flag_names = (
+    (0x02, "nodad"), (0x04, "optimistic"), (0x08, "dadfailed"),
+    (0x10, "home"), (0x20, "deprecated"), (0x40, "tentative"),
+    (0x100, "mngtmpaddr"), (0x200, "noprefixroute"),
+    (0x400, "autojoin"), (0x800, "stable-privacy"),
+)
+IFA_F_SECONDARY = 0x01
+IFA_F_PERMANENT = 0x80
+
+addr_scopes = { 0: "global", 200: "site", 253: "link", 254: "host",
+                255: "nowhere" }
+
+neigh_state_names = (
+    (0x01, "INCOMPLETE"), (0x02, "REACHABLE"), (0x04, "STALE"),
+    (0x08, "DELAY"), (0x10, "PROBE"), (0x20, "FAILED"), (0x40, "NOARP"),
+    (0x80, "PERMANENT"),
+)
+NUD_SHOWN = 0xff & ~0x40
+
+# struct rtnl_link_stats64, in kernel order.  Only the first 23 are
+# always there, newer kernels add more.
+link_stats64_fields = (
+    "rx_packets", "tx_packets", "rx_bytes", "tx_bytes", "rx_errors",
+    "tx_errors", "rx_dropped", "tx_dropped", "multicast", "collisions",
+    "rx_length_errors", "rx_over_errors", "rx_crc_errors",
+    "rx_frame_errors", "rx_fifo_errors", "rx_missed_errors",
+    "tx_aborted_errors", "tx_carrier_errors", "tx_fifo_errors",
+    "tx_heartbeat_errors", "tx_window_errors", "rx_compressed",
+    "tx_compressed", "rx_nohandler",
+)
+
+def nl_hwaddr(b):
+    return ":".join("%02x" % i for i in b)
+
+def nl_cstr(b):
+    return b.split(b"\0", 1)[0].decode("utf-8")
+
+def nl_attrs(buf, offset):
+    """Parse the rtattrs in buf starting at offset into a map of
+    attribute type to the raw bytes.
+
+    """
+    attrs = {}
+    while offset + 4 <= len(buf):
+        (alen, atype) = struct.unpack_from("=HH", buf, offset)
+        if alen < 4:
+            break
+        attrs[atype & 0x3fff] = buf[offset + 4:offset + alen]
+        offset += (alen + 3) & ~3
+        pass
+    return attrs
+
+class NetlinkData:
+    """Get interface data directly from the kernel with rtnetlink.
+    Each request is a single dump on a netlink socket.
+
+    """
+    def __init__(self):
+        self.seq = 0
+        return
+
+    def dump(self, msgtype, payload):
+        """Do a dump request and return a list of (type, message body)
+        for all the messages returned.
+
+        """
+        self.seq += 1
+        seq = self.seq
+        msg = struct.pack("=IHHII", 16 + len(payload), msgtype,
+                          NLM_F_REQUEST | NLM_F_DUMP, seq, 0) + payload
+        rv = []
+        with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                           socket.NETLINK_ROUTE) as s:
+            s.bind((0, 0))
+            s.sendto(msg, (0, 0))
+            done = False
+            while not done:
+                buf = s.recv(65536)
+                offset = 0
+                while offset + 16 <= len(buf):
+                    (mlen, mtype, mflags, mseq, mpid) = struct.unpack_from(
+                        "=IHHII", buf, offset)
+                    if mlen < 16:
+                        raise Exception("Invalid netlink message length")
+                    body = buf[offset + 16:offset + mlen]
+                    offset += (mlen + 3) & ~3
+                    if mseq != seq:
+                        continue
+                    if mtype == NLMSG_DONE:
+                        done = True
+                        break
+                    if mtype == NLMSG_ERROR:
+                        err = struct.unpack_from("=i", body)[0]
+                        if err == 0:
+                            continue
+                        raise OSError(-err, os.strerror(-err))
+                    rv.append((mtype, body))
+                    pass
+                pass
+            pass
+        return rv
+
+    def get_links(self):
+        """Return a map of ifindex to the link data."""
+        links = {}
+        payload = struct.pack("=BxHiII", socket.AF_UNSPEC, 0, 0, 0, 0)
+        for (mtype, body) in self.dump(RTM_GETLINK, payload):
+            if mtype != RTM_NEWLINK:
+                continue
+            (family, itype, index, flags, change) = struct.unpack_from(
+                "=BxHiII", body)
+            attrs = nl_attrs(body, 16)
+            l = { "ifindex": index }
+            if IFLA_IFNAME in attrs:
+                l["ifname"] = nl_cstr(attrs[IFLA_IFNAME])
+                pass
+            lflags = []
+            if flags & IFF_UP and not flags & IFF_RUNNING:
+                lflags.append("NO-CARRIER")
+                pass
+            for (f, name) in link_flag_names:
+                if flags & f:
+                    lflags.append(name)
+                    pass
+                pass
+            l["flags"] = lflags
+            if IFLA_MTU in attrs:
+                l["mtu"] = struct.unpack("=I", attrs[IFLA_MTU])[0]
+                pass
+            if IFLA_OPERSTATE in attrs:
+                state = attrs[IFLA_OPERSTATE][0]
+                if state < len(link_operstates):
+                    l["operstate"] = link_operstates[state]
+                    pass
+                pass
+            if itype in arphrd_names:
+                l["link_type"] = arphrd_names[itype]
+            else:
+                l["link_type"] = "[" + str(itype) + "]"
+                pass
+            if IFLA_ADDRESS in attrs:
+                l["address"] = nl_hwaddr(attrs[IFLA_ADDRESS])
+                pass
+            if IFLA_BROADCAST in attrs:
+                l["broadcast"] = nl_hwaddr(attrs[IFLA_BROADCAST])
+                pass
+            l["addr_info"] = []
+            if IFLA_STATS64 in attrs:
+                l["stats64"] = self.conv_stats64(attrs)
+                pass
+            links[index] = l
+            pass
+        return links
+
+    def conv_stats64(self, attrs):
+        b = attrs[IFLA_STATS64]
+        n = min(len(b) // 8, len(link_stats64_fields))
+        v = dict(zip(link_stats64_fields,
+                     struct.unpack_from("=" + str(n) + "Q", b)))
+        rx = { "bytes": v["rx_bytes"],
+               "packets": v["rx_packets"],
+               "errors": v["rx_errors"],
+               "dropped": v["rx_dropped"],
+               "over_errors": v["rx_over_errors"],
+               "multicast": v["multicast"] }
+        if v.get("rx_compressed", 0):
+            rx["compressed"] = v["rx_compressed"]
+            pass
+        rx["length_errors"] = v["rx_length_errors"]
+        rx["crc_errors"] = v["rx_crc_errors"]
+        rx["frame_errors"] = v["rx_frame_errors"]
+        rx["fifo_errors"] = v["rx_fifo_errors"]
+        rx["missed_errors"] = v["rx_missed_errors"]
+        if v.get("rx_nohandler", 0):
+            rx["nohandler"] = v["rx_nohandler"]
+            pass
+        tx = { "bytes": v["tx_bytes"],
+               "packets": v["tx_packets"],
+               "errors": v["tx_errors"],
+               "dropped": v["tx_dropped"],
+               "carrier_errors": v["tx_carrier_errors"],
+               "collisions": v["collisions"] }
+        if v.get("tx_compressed", 0):
+            tx["compressed"] = v["tx_compressed"]
+            pass
+        tx["aborted_errors"] = v["tx_aborted_errors"]
+        tx["fifo_errors"] = v["tx_fifo_errors"]
+        tx["window_errors"] = v["tx_window_errors"]
+        tx["heartbeat_errors"] = v["tx_heartbeat_errors"]
+        if IFLA_CARRIER_CHANGES in attrs:
+            tx["carrier_changes"] = struct.unpack(
+                "=I", attrs[IFLA_CARRIER_CHANGES])[0]
+            pass
+        return { "rx": rx, "tx": tx }
+
+    def get_interfaces(self):
+        links = self.get_links()
+        payload = struct.pack("=BBBBI", socket.AF_UNSPEC, 0, 0, 0, 0)
+        for (mtype, body) in self.dump(RTM_GETADDR, payload):
+            if mtype != RTM_NEWADDR:
+                continue
+            (family, prefixlen, flags, scope, index) = struct.unpack_from(
+                "=BBBBI", body)
+            if index not in links:
+                continue
+            if family == socket.AF_INET:
+                fname = "inet"
+            elif family == socket.AF_INET6:
+                fname = "inet6"
+            else:
+                continue
+            attrs = nl_attrs(body, 8)
+            if IFA_FLAGS in attrs:
+                flags = struct.unpack("=I", attrs[IFA_FLAGS])[0]
+                pass
+            a = { "family": fname }
+            if IFA_LOCAL in attrs:
+                a["local"] = socket.inet_ntop(family, attrs[IFA_LOCAL])
+                if (IFA_ADDRESS in attrs and
+                        attrs[IFA_ADDRESS] != attrs[IFA_LOCAL]):
+                    a["address"] = socket.inet_ntop(family,
+                                                    attrs[IFA_ADDRESS])
+                    pass
+            elif IFA_ADDRESS in attrs:
+                a["local"] = socket.inet_ntop(family, attrs[IFA_ADDRESS])
+            else:
+                continue
+            a["prefixlen"] = prefixlen
+            if IFA_BROADCAST in attrs:
+                a["broadcast"] = socket.inet_ntop(family,
+                                                  attrs[IFA_BROADCAST])
+                pass
+            if scope in addr_scopes:
+                a["scope"] = addr_scopes[scope]
+            else:
+                a["scope"] = str(scope)
+                pass
+            if flags & IFA_F_SECONDARY:
+                if family == socket.AF_INET6:
+                    a["temporary"] = True
+                else:
+                    a["secondary"] = True
+                    pass
+                pass
+            if not flags & IFA_F_PERMANENT:
+                a["dynamic"] = True
+                pass
+            for (f, name) in addr_flag_names:
+                if flags & f:
+                    a[name] = True
+                    pass
+                pass
+            if IFA_LABEL in attrs:
+                a["label"] = nl_cstr(attrs[IFA_LABEL])
+                pass
+            if IFA_CACHEINFO in attrs:
+                (prefered, valid) = struct.unpack_from("=II",
+                                                       attrs[IFA_CACHEINFO])
+                a["valid_life_time"] = valid
+                a["preferred_life_time"] = prefered
+                pass
+            links[index]["addr_info"].append(a)
+            pass
+        return list(links.values())
+
+    def get_neighs(self):
+        """Return a Neighbors object with all the neighbors."""
+        ifnames = dict(socket.if_nameindex())
+        neighs = Neighbors()
+        payload = struct.pack("=BxxxiHBB", socket.AF_UNSPEC, 0, 0, 0, 0)
+        for (mtype, body) in self.dump(RTM_GETNEIGH, payload):
+            if mtype != RTM_NEWNEIGH:
+                continue
+            (af, nindex, state, flags, ntype) = struct.unpack_from(
+                "=BxxxiHBB", body)
+            if af == socket.AF_INET:
+                family = "inet"
+            elif af == socket.AF_INET6:
+                family = "inet6"
+            else:
+                continue
+            if nindex not in ifnames:
+                continue
+            if not state & NUD_SHOWN:
+                # Like ip, don't show noarp or state-less entries.
+                continue
+            attrs = nl_attrs(body, 12)
+            if NDA_DST not in attrs:
+                continue
+            n = { "dst": socket.inet_ntop(af, attrs[NDA_DST]) }
+            if NDA_LLADDR in attrs:
+                n["lladdr"] = nl_hwaddr(attrs[NDA_LLADDR])
+                pass
+            if flags & NTF_ROUTER:
+                n["router"] = None
+                pass
+            nstate = []
+            for (f, name) in neigh_state_names:
+                if state & f:
+                    nstate.append(name)
+                    pass
+                pass
+            n["state"] = nstate
+            neighs.add(ifnames[nindex], family, n)
+            pass
+        return neighs
+
+    pass
+
+def netlink_works():
+    try:
+        NetlinkData().dump(RTM_GETLINK,
+                           struct.pack("=BxHiII", socket.AF_UNSPEC,
+                                       0, 0, 0, 0))
+    except Exception:
+        return False
+    return True
+
+# Setting IETF_IP_USE_IPCMD in the environment forces use of the ip
+# command instead of netlink.
+if os.getenv("IETF_IP_USE_IPCMD") is None and netlink_works():
+    ipdata = NetlinkData()
+else:
+    if ipcmd is None:
+        raise Exception("ip command is not present")
+    ipdata = IPCmdData()
+    pass
 
 is_if_mib = clixon_beh.is_feature_set("ietf-interfaces", "if-mib")
 
@@ -222,23 +663,29 @@ class IPV6NeighRouter(tf.YangElemValueOnly):
 
     pass
 
+# /interfaces/interface/ipv4/neighbor
 # /interfaces/interface/ipv6/neighbor
-class IPV6Neigh(tf.YangElemValueOnly):
-    def get_neighs(self, vdata):
-        return self.program_output([ipcmd, "-6", "-j", "neigh", "show", "dev",
-                                    vdata["ifname"]],
-                                   decoder = lambda x : json.loads(x))
+class Neigh(tf.YangElemValueOnly):
+    """The neighbor table is fetched once per get for all interfaces,
+    then each interface looks up its entries in it.  family is "inet"
+    or "inet6".
+
+    """
+    def __init__(self, name, family, isconfig=True):
+        self.family = family
+        super().__init__(name, tf.YangType.LIST, isconfig=isconfig)
+        return
 
-    def fetch_index(self, indexname, index, vdata):
-        neighs = self.get_neighs(vdata)
-        for i in neighs:
-            if i["dst"] == index:
-                return i
-            pass
-        return None
+    def get_neighs(self, data):
+        return data.fetch("neighbors", ipdata.get_neighs,
+                          paths = ["/interfaces"])
 
-    def fetch_full_index(self, vdata):
-        return self.get_neighs(vdata)
+    def fetch_index_data(self, data, indexname, index, vdata):
+        return self.get_neighs(data).lookup(vdata["ifname"], self.family,
+                                            index)
+
+    def fetch_full_index_data(self, data, vdata):
+        return self.get_neighs(data).get_list(vdata["ifname"], self.family)
 
     pass
 
@@ -276,13 +723,6 @@ class IPV6Status(tf.YangElemValueOnly):
 
 # /interfaces/interface/ipv6/address
 class IPV6Address(tf.YangElemValueOnly):
-    def fetch_index(self, indexname, index, vdata):
-        for i in vdata["addr_info"]:
-            if i["ip"] == index:
-                return i
-            pass
-        return None
-
     def fetch_full_index(self, vdata):
         rv = []
         for i in vdata["addr_info"]:
@@ -339,13 +779,6 @@ class IPV4Origin(tf.YangElemValueOnly):
 
 # /interfaces/interface/ipv4/address
 class IPV4Address(tf.YangElemValueOnly):
-    def fetch_index(self, indexname, index, vdata):
-        for i in vdata["addr_info"]:
-            if i["ip"] == index:
-                return i
-            pass
-        return None
-
     def fetch_full_index(self, vdata):
         rv = []
         for i in vdata["addr_info"]:
@@ -357,25 +790,6 @@ class IPV4Address(tf.YangElemValueOnly):
 
     pass
 
-class IPV4Neigh(tf.YangElemValueOnly):
-    def get_neighs(self, vdata):
-        return self.program_output([ipcmd, "-4", "-j", "neigh", "show", "dev",
-                                    vdata["ifname"]],
-                                   decoder = lambda x : json.loads(x))
-
-    def fetch_index(self, indexname, index, vdata):
-        neighs = self.get_neighs(vdata)
-        for i in neighs:
-            if i["dst"] == index:
-                return i
-            pass
-        return None
-
-    def fetch_full_index(self, vdata):
-        return self.get_neighs(vdata)
-
-    pass
-
 # Convert beteen linux ip values and iana-if-type
 link_types = {
     "loopback": "softwareLoopback",
@@ -451,20 +865,15 @@ class InterfaceEnabled(tf.YangElemValueOnly):
 
 # /interfaces/interface
 class Interface(tf.YangElemValueOnly):
-    def getinterfaces(self):
-        return self.program_output([ipcmd, "-p", "-s", "-s", "-j", "addr"],
-                                   decoder = lambda x : json.loads(x))
-
-    def fetch_index(self, indexname, index, vdata):
-        ifs = self.getinterfaces()
-        for i in ifs:
-            if i["ifname"] == index:
-                return i
-            pass
-        return None
+    def getinterfaces(self, data):
+        # /interfaces and /interfaces-state both use this, only fetch
+        # it once per get, and keep it in the state cache for polls
+        # until /interfaces is changed.
+        return data.fetch("interfaces", ipdata.get_interfaces,
+                          paths = ["/interfaces"])
 
-    def fetch_full_index(self, vdata):
-        return self.getinterfaces()
+    def fetch_full_index_data(self, data, vdata):
+        return self.getinterfaces(data)
 
     pass
 
@@ -502,22 +911,7 @@ class InterfaceStateAdminStatus(tf.YangElemValueOnly):
     pass
 
 # /interfaces[-state]/interface
-class StateInterface(tf.YangElemValueOnly):
-    def getinterfaces(self):
-        return self.program_output([ipcmd, "-p", "-s", "-s", "-j", "addr"],
-                                   decoder = lambda x : json.loads(x))
-
-    def fetch_index(self, indexname, index, vdata):
-        ifs = self.getinterfaces()
-        for i in ifs:
-            if i["ifname"] == index:
-                return i
-            pass
-        return None
-
-    def fetch_full_index(self, vdata):
-        return self.getinterfaces()
-
+class StateInterface(Interface):
     pass
 
 # Create the maps for /interfaces
@@ -525,7 +919,8 @@ s = ietfip
 s.add_map("/", tf.YangElem("interfaces", tf.YangType.CONTAINER,
                            namespace=IETF_INTERFACES_NAMESPACE))
 s.add_map("/interfaces",
-          StateInterface("interface", tf.YangType.LIST))
+          StateInterface("interface", tf.YangType.LIST,
+                         indexkey="ifname"))
 
 s.add_map("/interfaces/interface",
           tf.YangElem("ipv4", tf.YangType.CONTAINER,
@@ -537,7 +932,7 @@ s.add_leaf("/interfaces/interface/ipv4",
 s.add_leaf("/interfaces/interface/ipv4",
            MapValue("mtu", "mtu", maxint=65535))
 s.add_map("/interfaces/interface/ipv4",
-          IPV4Address("address", tf.YangType.LIST))
+          IPV4Address("address", tf.YangType.LIST, indexkey="local"))
 s.add_leaf("/interfaces/interface/ipv4/address",
            MapValue("ip", "local"))
 s.add_map("/interfaces/interface/ipv4/address",
@@ -547,7 +942,7 @@ s.add_leaf("/interfaces/interface/ipv4/address/subnet",
 s.add_leaf("/interfaces/interface/ipv4/address",
            IPV4Origin("origin", tf.YangType.LEAF, isconfig=False))
 s.add_map("/interfaces/interface/ipv4",
-          IPV4Neigh("neighbor", tf.YangType.LIST))
+          Neigh("neighbor", "inet"))
 s.add_leaf("/interfaces/interface/ipv4/neighbor",
            MapValue("ip", "dst"))
 s.add_leaf("/interfaces/interface/ipv4/neighbor",
@@ -566,7 +961,7 @@ s.add_leaf("/interfaces/interface/ipv6",
 s.add_leaf("/interfaces/interface/ipv6",
            MapValue("mtu", "mtu", maxint=65535))
 s.add_map("/interfaces/interface/ipv6",
-          IPV6Address("address", tf.YangType.LIST))
+          IPV6Address("address", tf.YangType.LIST, indexkey="local"))
 s.add_leaf("/interfaces/interface/ipv6/address",
            MapValue("ip", "local"))
 s.add_leaf("/interfaces/interface/ipv6/address",
@@ -580,7 +975,7 @@ s.add_leaf("/interfaces/interface/ipv6",
            InterfaceIPv6DADT("dup-addr-detect-transmits", tf.YangType.LEAF))
 
 s.add_map("/interfaces/interface/ipv6",
-          IPV6Neigh("neighbor", tf.YangType.LIST))
+          Neigh("neighbor", "inet6"))
 s.add_leaf("/interfaces/interface/ipv6/neighbor",
            MapValue("ip", "dst"))
 s.add_leaf("/interfaces/interface/ipv6/neighbor",
@@ -604,6 +999,10 @@ s.add_leaf("/interfaces/interface/ipv6/autoconf",
 class DiscontinuityTime(tf.YangElemValueOnly):
     # FIXME - This just returns boot time, not sure what else to do.
     def getvalue(self, data, vdata=None):
+        # This is the same for every interface, only fetch it once.
+        return data.fetch("boot datetime", self.getboottime, paths = [])
+
+    def getboottime(self):
         date = self.program_output(["/bin/date", "--rfc-3339=seconds"]).strip()
         date = date.split(" ")
         if len(date) < 2:
@@ -698,7 +1097,8 @@ s.add_map("/",
                       namespace=IETF_INTERFACES_NAMESPACE,
                       isconfig=False))
 s.add_map("/interfaces-state",
-          StateInterface("interface", tf.YangType.LIST))
+          StateInterface("interface", tf.YangType.LIST,
+                         indexkey="ifname"))
 s.add_leaf("/interfaces-state/interface",
            MapValue("name", "ifname"))
 s.add_leaf("/interfaces-state/interface",
@@ -733,7 +1133,7 @@ s.add_leaf("/interfaces-state/interface/ipv4",
 s.add_leaf("/interfaces-state/interface/ipv4",
            MapValue("mtu", "mtu", maxint=65535))
 s.add_map("/interfaces-state/interface/ipv4",
-          IPV4Neigh("neighbor", tf.YangType.LIST))
+          Neigh("neighbor", "inet"))
 s.add_leaf("/interfaces-state/interface/ipv4/neighbor",
            MapValue("ip", "dst"))
 s.add_leaf("/interfaces-state/interface/ipv4/neighbor",
@@ -742,7 +1142,7 @@ s.add_leaf("/interfaces-state/interface/ipv4/neighbor",
 s.add_leaf("/interfaces-state/interface/ipv4/neighbor",
            NeighOrigin("origin", tf.YangType.LEAF))
 s.add_map("/interfaces-state/interface/ipv4",
-          IPV4Address("address", tf.YangType.LIST))
+          IPV4Address("address", tf.YangType.LIST, indexkey="local"))
 s.add_leaf("/interfaces-state/interface/ipv4/address",
            MapValue("ip", "local"))
 s.add_map("/interfaces-state/interface/ipv4/address",
@@ -760,7 +1160,7 @@ s.add_leaf("/interfaces-state/interface/ipv6",
 s.add_leaf("/interfaces-state/interface/ipv6",
            MapValue("mtu", "mtu", maxint=65535))
 s.add_map("/interfaces-state/interface/ipv6",
-          IPV6Neigh("neighbor", tf.YangType.LIST))
+          Neigh("neighbor", "inet6"))
 s.add_leaf("/interfaces-state/interface/ipv6/neighbor",
            MapValue("ip", "dst"))
 s.add_leaf("/interfaces-state/interface/ipv6/neighbor",
@@ -774,7 +1174,7 @@ s.add_leaf("/interfaces-state/interface/ipv6/neighbor",
 s.add_leaf("/interfaces-state/interface/ipv6/neighbor",
            IPV6NeighState("state", tf.YangType.LEAF))
 s.add_map("/interfaces-state/interface/ipv6",
-          IPV6Address("address", tf.YangType.LIST))
+          IPV6Address("address", tf.YangType.LIST, indexkey="local"))
 s.add_leaf("/interfaces-state/interface/ipv6/address",
            MapValue("ip", "local"))
 s.add_leaf("/interfaces-state/interface/ipv6/address",
@@ -853,5 +1253,9 @@ class Handler(tf.TopElemHandler, tf.ProgOut):
 
     pass
 
-handler = Handler("ietf-interfaces", ietfip)
+handler = Handler("ietf-interfaces", ietfip, statecache=tf.StateCache())
 handler.p = clixon_beh.add_plugin("ietf-ip", IETF_INTERFACES_NAMESPACE, handler)
+handler.add_state_prefixes()
+# Our state data only reads from the system, it can run in parallel
+# with other plugins.
+handler.p.set_thread_safe(True)
@@ -33,7 +33,12 @@
 # Linux
 
 import os
+import fcntl
+import re
 import shlex
+import shutil
+import stat
+import time
 import clixon_beh
 import clixon_beh.transaction_framework as tf
 
@@ -55,25 +60,25 @@ allow_user_add_del = True      # Add/delete users allowed?
 allow_user_pw_change = True    # User password changes allowed?
 allow_user_key_change = True   # SSH authorized key changes allowed?
 enable_user_update = True      # Allow the password files to be chagned at all.
-useradd = "/sbin/useradd"
-userdel = "/sbin/userdel"
-usermod = "/sbin/usermod"
 have_shadow = True
 passwdfile = sysbase + "/etc/passwd"
 shadowfile = sysbase + "/etc/shadow"
+groupfile = sysbase + "/etc/group"
+gshadowfile = sysbase + "/etc/gshadow"
+pwlockfile = sysbase + "/etc/.pwd.lock"
+logindefsfile = sysbase + "/etc/login.defs"
+useradddefsfile = sysbase + "/etc/default/useradd"
 
 # Various commands
 cpcmd = "/bin/cp"
-touchcmd = "/bin/touch"
 lscmd = "/bin/ls"
 lncmd = "/bin/ln"
 mvcmd = "/bin/mv"
-mkdircmd = "/bin/mkdir"
 rmcmd = "/bin/rm"
 catcmd = "/bin/cat"
 datecmd = "/bin/date"
-sedcmd = "/bin/sed"
 systemctlcmd = "/bin/systemctl"
+nscdcmd = "/usr/sbin/nscd"
 
 # Hostname management
 hostnamecmd = "/bin/hostname"
@@ -122,6 +127,9 @@ chrony_ntp = clixon_beh.is_feature_set("linux-system", "chrony-ntp")
 # need its own control interface.
 do_dns = old_dns_supported or dnsproxy_supported
 
+# Start the privileged helper now, while we still have privileges.
+privhelper = tf.start_priv_helper()
+
 # /system/hostname
 class Hostname(tf.YangElem):
     def validate_add(self, data, xml):
@@ -137,37 +145,38 @@ class Hostname(tf.YangElem):
         if len(value) > 64: # Linux only allows 64 characters
             raise tf.RPCError("application", "invalid-value", "error",
                               "Host name too long, 64-character max.")
-        data.add_op(self, None, value)
+        # If the hostname is set more than once, only the last one
+        # needs to be done.
+        data.add_op(self, None, value, resources=["hostname"], key="value")
         return
 
     def commit(self, op):
         op.oldvalue = self.getvalue(None)
-        self.do_priv(op)
+        self.setvalue(op.value)
         return
 
     def revert(self, op):
-        self.do_priv(op)
-        return
-
-    def priv(self, op):
-        if op.revert:
-            if op.oldvalue is None:
-                return # We didn't set it, nothing to do
-            try:
-                self.setvalue(op.oldvalue)
-            except:
-                pass
-        else:
-            self.setvalue(op.value)
+        if op.oldvalue is None:
+            return # We didn't set it, nothing to do
+        try:
+            self.setvalue(op.oldvalue)
+        except:
+            pass
         return
 
     def setvalue(self, value):
+        # The privileged helper does the work, no need to raise
+        # privileges here.  It stops at the first failure, so the
+        # file isn't changed if the hostname command fails, and the
+        # file is replaced with a rename so it's never half written.
+        b = privhelper.batch()
         if sysbase == "":
-            self.program_output([hostnamecmd, value])
-            pass
-        with open(hostnamefile, "w") as f:
-            f.write(value + "\n")
+            b.program_output([hostnamecmd, value])
             pass
+        tmpfile = hostnamefile + ".tmp"
+        b.write_file(tmpfile, value + "\n")
+        b.rename(tmpfile, hostnamefile)
+        b.run()
         return
 
     def getvalue(self, data, vdata=None):
@@ -200,7 +209,7 @@ class TimeZone(tf.YangElem):
         if not os.path.exists(zoneinfodir + value):
             raise tf.RPCError("application", "invalid-value", "error",
                               value + " not a valid timezone")
-        data.add_op(self, None, value)
+        data.add_op(self, None, value, resources=["timezone"], key="value")
         return
 
     def commit(self, op):
@@ -213,42 +222,35 @@ class TimeZone(tf.YangElem):
         except:
             pass
         op.oldvalue = [oldlocaltime, self.getvalue(None)]
-        self.do_priv(op)
+        self.setvalue(op.value)
         return
 
     def revert(self, op):
-        self.do_priv(op)
-        return
-
-    def priv(self, op):
-        if op.revert:
-            if op.oldvalue is None:
-                return # We didn't set it, nothing to do
-            try:
-                if op.oldvalue[0] is None:
-                    # timedatectl will not add /etc/localtime if it
-                    # does not exist or is not already a symlink.
-                    # Make sure it points to something.
-                    self.program_output([lncmd, "-sf", zoneinfodir + "GMT",
-                                         localtimefile])
-                    pass
-                self.setvalue(op.oldvalue[1])
-            except:
+        if op.oldvalue is None:
+            return # We didn't set it, nothing to do
+        try:
+            if op.oldvalue[0] is None:
+                # timedatectl will not add /etc/localtime if it
+                # does not exist or is not already a symlink.
+                # Make sure it points to something.
+                privhelper.program_output([lncmd, "-sf", zoneinfodir + "GMT",
+                                           localtimefile])
                 pass
-        else:
-            self.setvalue(op.value)
+            self.setvalue(op.oldvalue[1])
+        except:
+            pass
         return
 
     def setvalue(self, value):
         if sysbase == "":
-            self.program_output(["/bin/timedatectl", "set-timezone",
-                                 "--", value])
+            privhelper.program_output(["/bin/timedatectl", "set-timezone",
+                                       "--", value])
         else:
-            with open(timezonefile, "w") as f:
-                f.write(value + "\n")
-                pass
-            self.program_output([lncmd, "-sf", zoneinfodir + value,
-                                 localtimefile])
+            (privhelper.batch()
+             .write_file(timezonefile, value + "\n")
+             .program_output([lncmd, "-sf", zoneinfodir + value,
+                              localtimefile])
+             .run())
             pass
         return
 
@@ -275,14 +277,17 @@ class TimeZone(tf.YangElem):
 # yang file and handle it in the IP address handling.
 
 class DNSHandler(tf.YangElemCommitOnly):
-    """This handles the full commit operation for DNS updates.
+    """This handles the full commit operation for DNS updates.  The
+    operation is added with priv=True, so privileges are already
+    raised when these are called, and it never runs next to other
+    operations.
     """
     def commit(self, op):
-        self.do_priv(op)
+        self.priv(op)
         return
 
     def commit_done(self, op):
-        self.do_priv(op)
+        self.priv(op)
         return
 
     def priv_old_dns(self, op):
@@ -396,7 +401,7 @@ class DNSHandler(tf.YangElemCommitOnly):
         return
 
     def revert(self, op):
-        self.do_priv(op)
+        self.priv(op)
         return
 
     pass
@@ -434,7 +439,8 @@ def dns_get_opdata(data):
 
     """
     if data.userDNSOp is None:
-        data.userDNSOp = data.add_op(DNSHandler("dns"), "dns", DNSData())
+        data.userDNSOp = data.add_op(DNSHandler("dns"), "dns", DNSData(),
+                                     priv=True, resources=["dns"])
     return data.userDNSOp.value
 
 # /system/dns-resolver/search
@@ -448,13 +454,6 @@ class DNSSearch(tf.YangElemValidateOnly):
         self.validate_add(data, newxml)
         return
 
-    def fetch_index(self, indexname, index, vdata):
-        for i in vdata["search"]:
-            if i == index:
-                return i
-            pass
-        return None
-
     def getonevalue(self, data, vdata):
         return vdata
 
@@ -528,13 +527,6 @@ class DNSServer(tf.YangElemValidateOnly):
         self.validate_add(data, newxml)
         return
 
-    def fetch_index(self, indexname, index, vdata):
-        for i in vdata["nameservers"]:
-            if i["name"] == index:
-                return i
-            pass
-        return None
-
     def fetch_full_index(self, vdata):
         return vdata["nameservers"]
 
@@ -742,10 +734,432 @@ def getpwentryall():
         pass
     return plist
 
-if sysbase == "":
-    useropts = []
-else:
-    useropts = ["-P", sysbase]
+# The user handling edits the password files directly instead of
+# running useradd, usermod, and userdel for each user.  Each file is
+# read once when the users are committed, all the changes are done in
+# memory, and then each changed file is written once.
+
+def getlogindefs():
+    """Return the UID and GID ranges, the password aging values, and
+    the mode for new home directories from login.defs, with the
+    same defaults useradd uses.  An aging value of -1 means the
+    field is left empty.
+
+    """
+    defs = { "UID_MIN": 1000, "UID_MAX": 60000,
+             "GID_MIN": 1000, "GID_MAX": 60000,
+             "PASS_MIN_DAYS": -1, "PASS_MAX_DAYS": -1, "PASS_WARN_AGE": -1,
+             "UMASK": 0o022, "HOME_MODE": None }
+    octal = ("UMASK", "HOME_MODE")
+    try:
+        with open(logindefsfile, "r") as f:
+            for i in f:
+                i = i.split()
+                if len(i) >= 2 and i[0] in defs:
+                    try:
+                        if i[0] in octal:
+                            defs[i[0]] = int(i[1], 8)
+                        else:
+                            defs[i[0]] = int(i[1])
+                            pass
+                    except ValueError:
+                        pass
+                    pass
+                pass
+            pass
+        pass
+    except OSError:
+        pass
+    if defs["HOME_MODE"] is None:
+        defs["HOME_MODE"] = 0o777 & ~defs["UMASK"]
+        pass
+    return defs
+
+def nscd_invalidate():
+    """Tell nscd, if it's there, to drop its cached users and groups
+    after the files change, like the shadow tools do.  It's fine if
+    it isn't running.
+
+    """
+    if sysbase != "" or not os.path.exists(nscdcmd):
+        return
+    try:
+        tf.ProgOut().program_output([nscdcmd, "-i", "passwd", "-i", "group"],
+                                    timeout=10)
+    except Exception:
+        pass
+    return
+
+def getuseradddefs():
+    """Return the default home directory base and shell for new users."""
+    defs = { "HOME": "/home", "SHELL": "/bin/sh" }
+    try:
+        with open(useradddefsfile, "r") as f:
+            for i in f:
+                i = i.strip().split("=", 1)
+                if len(i) == 2 and i[0] in defs and i[1]:
+                    defs[i[0]] = i[1]
+                    pass
+                pass
+            pass
+        pass
+    except OSError:
+        pass
+    return defs
+
+# The same rules useradd uses by default.
+user_name_re = re.compile(r"[a-z_][a-z0-9_-]*[$]?")
+
+def check_user_name(name):
+    """The name goes straight into the password files, so it must not
+    have anything in it that would change their format.
+
+    """
+    if len(name) > 32 or not user_name_re.fullmatch(name):
+        raise tf.RPCError("application", "invalid-value", "error",
+                          "Invalid user name: " + repr(name))
+    return
+
+def check_password(password):
+    """Like usermod -p, don't allow anything that would end the field
+    or the entry.
+
+    """
+    if ":" in password or "\n" in password:
+        raise tf.RPCError("application", "invalid-value", "error",
+                          "Password may not contain ':' or a newline")
+    return
+
+class PwLock:
+    """Hold the lock that lckpwdf() takes, which passwd, useradd, and
+    the rest take before they change the password files, for a with
+    statement.
+
+    """
+    def __init__(self, timeout=15):
+        self.timeout = timeout
+        self.fd = None
+        return
+
+    def __enter__(self):
+        self.fd = os.open(pwlockfile, os.O_WRONLY | os.O_CREAT | os.O_CLOEXEC,
+                          0o600)
+        endtime = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() >= endtime:
+                    os.close(self.fd)
+                    self.fd = None
+                    raise tf.RPCError("application", "operation-failed",
+                                      "error",
+                                      "Password files are locked")
+                time.sleep(0.1)
+                pass
+            pass
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        # Closing the file drops the lock.
+        os.close(self.fd)
+        self.fd = None
+        return False
+
+    pass
+
+def open_dir(path, dir_fd=None):
+    """Open a directory to use as a dir_fd.  A symlink is not
+    followed.
+
+    """
+    return os.open(path, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW,
+                   dir_fd=dir_fd)
+
+def create_temp(fname, dir_fd):
+    """Create a new file with a random name starting with fname in the
+    directory.  Returns the open fd and the name.  Like mkstemp(),
+    but in a directory given by an fd.
+
+    """
+    while True:
+        tmpname = "." + fname + "." + os.urandom(6).hex()
+        try:
+            fd = os.open(tmpname, (os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                                   os.O_NOFOLLOW | os.O_CLOEXEC),
+                         0o600, dir_fd=dir_fd)
+        except FileExistsError:
+            continue
+        return (fd, tmpname)
+
+def write_file_atomic(fname, contents, mode=None, owner=None, dir_fd=None):
+    """Write contents into a new temporary file next to fname and rename
+    it over fname, so nothing ever sees a partial file.  If fname
+    exists and mode or owner is None, its mode and owner are kept.
+
+    If dir_fd is set, fname is a name in that directory.  Symlinks
+    are never followed and the mode and owner are set on the open
+    file, so this is safe in a directory a user can write to.
+
+    """
+    if dir_fd is None:
+        dir_fd = open_dir(os.path.dirname(fname) or ".")
+        try:
+            write_file_atomic(os.path.basename(fname), contents, mode, owner,
+                              dir_fd)
+        finally:
+            os.close(dir_fd)
+            pass
+        return
+    try:
+        st = os.stat(fname, dir_fd=dir_fd, follow_symlinks=False)
+        if mode is None:
+            mode = stat.S_IMODE(st.st_mode)
+            pass
+        if owner is None:
+            owner = (st.st_uid, st.st_gid)
+            pass
+    except FileNotFoundError:
+        if mode is None:
+            mode = 0o644
+            pass
+        pass
+    (fd, tmpname) = create_temp(fname, dir_fd)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(contents)
+            f.flush()
+            os.fchmod(f.fileno(), mode)
+            if owner is not None:
+                os.fchown(f.fileno(), owner[0], owner[1])
+                pass
+            os.fsync(f.fileno())
+            pass
+        os.replace(tmpname, fname, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+    except:
+        try:
+            os.unlink(tmpname, dir_fd=dir_fd)
+        except OSError:
+            pass
+        raise
+    return
+
+class PwFile:
+    """One of the colon separated password files, loaded into memory.
+    Entries are kept in file order as lists of fields and are looked
+    up by name through an index.  Lines that aren't entries, like
+    comments, are kept as they are.
+
+    """
+    def __init__(self, fname, nfields):
+        self.fname = fname
+        self.nfields = nfields
+        self.orig = None
+        self.lines = []
+        self.index = {}
+        self.changed = False
+        return
+
+    def load(self):
+        with open(self.fname, "r") as f:
+            self.orig = f.read()
+            pass
+        for i in self.orig.splitlines():
+            p = i.split(":")
+            if len(p) == self.nfields and p[0] != "":
+                self.index[p[0]] = len(self.lines)
+                self.lines.append(p)
+            else:
+                self.lines.append(i)
+                pass
+            pass
+        return
+
+    def get(self, name):
+        i = self.index.get(name)
+        if i is None:
+            return None
+        return self.lines[i]
+
+    def entries(self):
+        for i in self.lines:
+            if isinstance(i, list):
+                yield i
+                pass
+            pass
+        return
+
+    def add(self, fields):
+        self.index[fields[0]] = len(self.lines)
+        self.lines.append(fields)
+        self.changed = True
+        return
+
+    def remove(self, name):
+        i = self.index.pop(name, None)
+        if i is not None:
+            self.lines[i] = None
+            self.changed = True
+            pass
+        return
+
+    def set_field(self, name, field, value):
+        self.get(name)[field] = value
+        self.changed = True
+        return
+
+    def remove_member(self, name, field):
+        """Remove name from the comma separated list in the given field
+        of all entries.
+
+        """
+        for p in self.entries():
+            members = p[field].split(",")
+            if name in members:
+                members.remove(name)
+                p[field] = ",".join(members)
+                self.changed = True
+                pass
+            pass
+        return
+
+    def write(self):
+        if not self.changed:
+            return
+        s = []
+        for i in self.lines:
+            if isinstance(i, list):
+                s.append(":".join(i) + "\n")
+            elif i is not None:
+                s.append(i + "\n")
+                pass
+            pass
+        write_file_atomic(self.fname, "".join(s))
+        return
+
+    def restore(self):
+        if self.changed:
+            write_file_atomic(self.fname, self.orig)
+            pass
+        return
+
+    pass
+
+class AuthKeys:
+    """A user's authorized_keys file, loaded into memory.  The user
+    owns the directories it is in, so everything is done through a
+    file descriptor for ~/.ssh and symlinks are not followed.
+    Otherwise the user could point them at other files and have us
+    read or replace those.
+
+    """
+    def __init__(self, home, uid, gid):
+        self.home = home
+        self.fname = "authorized_keys"
+        self.owner = (uid, gid)
+        self.orig = None
+        self.lines = []
+        self.changed = False
+        return
+
+    def open_sshdir(self, create=False):
+        """Return an fd for the user's .ssh directory, or None if it
+        doesn't exist and create is False.
+
+        """
+        homefd = open_dir(self.home)
+        try:
+            try:
+                return open_dir(".ssh", dir_fd=homefd)
+            except FileNotFoundError:
+                if not create:
+                    return None
+                pass
+            os.mkdir(".ssh", 0o700, dir_fd=homefd)
+            fd = open_dir(".ssh", dir_fd=homefd)
+            os.fchown(fd, self.owner[0], self.owner[1])
+            return fd
+        finally:
+            os.close(homefd)
+            pass
+        return
+
+    def load(self):
+        dirfd = self.open_sshdir()
+        if dirfd is None:
+            return
+        try:
+            fd = os.open(self.fname, os.O_RDONLY | os.O_NOFOLLOW,
+                         dir_fd=dirfd)
+            with os.fdopen(fd, "r") as f:
+                self.orig = f.read()
+                pass
+            self.lines = self.orig.splitlines()
+        except FileNotFoundError:
+            pass
+        finally:
+            os.close(dirfd)
+            pass
+        return
+
+    def remove(self, name):
+        lines = [i for i in self.lines
+                 if len(i.split()) < 3 or i.split()[2] != name]
+        if len(lines) != len(self.lines):
+            self.lines = lines
+            self.changed = True
+            pass
+        return
+
+    def add(self, algorithm, keydata, name):
+        # Each key is one line of three fields, and remove() finds it
+        # by the third one.
+        for i in (algorithm, keydata, name):
+            if not i or len(i.split()) != 1:
+                raise tf.RPCError("application", "invalid-value", "error",
+                                  "Authorized key fields must not be empty"
+                                  " or have whitespace in them")
+            pass
+        self.remove(name)
+        self.lines.append(algorithm + " " + keydata + " " + name)
+        self.changed = True
+        return
+
+    def write(self):
+        if not self.changed:
+            return
+        dirfd = self.open_sshdir(create=True)
+        try:
+            s = "".join(i + "\n" for i in self.lines)
+            write_file_atomic(self.fname, s, mode=0o600, owner=self.owner,
+                              dir_fd=dirfd)
+        finally:
+            os.close(dirfd)
+            pass
+        return
+
+    def restore(self):
+        if not self.changed:
+            return
+        dirfd = self.open_sshdir()
+        if dirfd is None:
+            return
+        try:
+            if self.orig is None:
+                try:
+                    os.unlink(self.fname, dir_fd=dirfd)
+                except OSError:
+                    pass
+            else:
+                write_file_atomic(self.fname, self.orig, mode=0o600,
+                                  owner=self.owner, dir_fd=dirfd)
+                pass
+        finally:
+            os.close(dirfd)
+            pass
+        return
+
     pass
 
 class UserKey:
@@ -758,120 +1172,292 @@ class UserKey:
         self.keydata = None
         return
 
-class UserData(tf.YangElemCommitOnly):
-    """This handles the user operation."""
-    def __init__(self, name, data):
-        super().__init__(name)
-        self.data = data
+class UserData:
+    """Information about the changes to a single user."""
+    def __init__(self):
         self.user_op = None
         self.user_name = None
         self.user_password_op = None
         self.user_password = None
         self.user_curr_key = None
         self.user_keys = []
-        self.oldkeyfile = False
-        self.oldkeyempty = False
-        return
-
-    def savepwfile(self):
-        if not self.data.oldpwfile:
-            if enable_user_update:
-                self.data.oldpwfile = True
-                self.program_output([cpcmd, passwdfile,
-                                     passwdfile + ".keep"])
-                if have_shadow:
-                    self.program_output([cpcmd, shadowfile,
-                                         shadowfile + ".keep"])
-                    pass
-                pass
+        return
+
+    def user_exists(self):
+        try:
+            getpwentry(self.user_name)
+        except:
+            return False
+        return True
+
+    pass
+
+class UserCommit:
+    """The state of a commit of the users, kept for revert."""
+    def __init__(self):
+        self.passwd = PwFile(passwdfile, 7)
+        self.files = [self.passwd]
+        if have_shadow:
+            self.shadow = PwFile(shadowfile, 9)
+            self.files.append(self.shadow)
+        else:
+            self.shadow = None
+            pass
+        self.group = PwFile(groupfile, 4)
+        self.files.append(self.group)
+        if os.path.exists(gshadowfile):
+            self.gshadow = PwFile(gshadowfile, 4)
+            self.files.append(self.gshadow)
+        else:
+            self.gshadow = None
+            pass
+        self.keyfiles = []
+        self.newhomes = []
+        return
+
+    def load(self):
+        for f in self.files:
+            f.load()
             pass
         return
 
-    def savekeyfile(self):
-        if not self.oldkeyfile:
-            self.home = getpwentry(self.user_name)[5]
-            self.keyfile = self.home + "/.ssh/authorized_keys";
-            self.program_output([mkdircmd, "-p", self.home + "/.ssh"])
+    def next_id(self, pwfile, field, idmin, idmax):
+        """Return one more than the highest id in the range, like
+        useradd does.
+
+        """
+        ids = set()
+        for p in pwfile.entries():
             try:
-                self.program_output([cpcmd, self.keyfile,
-                                     self.keyfile + ".keep"])
-                self.oldkeyfile = True
-            except:
-                self.oldkeyempty = True
-                self.program_output([touchcmd, self.keyfile])
+                ids.add(int(p[field]))
+            except ValueError:
+                pass
+            pass
+        inrange = [i for i in ids if idmin <= i <= idmax]
+        if inrange:
+            newid = max(inrange) + 1
+        else:
+            newid = idmin
+            pass
+        if newid > idmax:
+            raise tf.RPCError("application", "operation-failed", "error",
+                              "No free ids for a new user")
+        return (newid, ids)
+
+    def add_user(self, name):
+        check_user_name(name)
+        if self.passwd.get(name) is not None:
+            raise tf.RPCError("application", "invalid-value", "error",
+                              "User " + name + " already exists")
+        if self.group.get(name) is not None:
+            raise tf.RPCError("application", "invalid-value", "error",
+                              "Group " + name + " already exists")
+        defs = getlogindefs()
+        (uid, uids) = self.next_id(self.passwd, 2,
+                                   defs["UID_MIN"], defs["UID_MAX"])
+        (gid, gids) = self.next_id(self.group, 2,
+                                   defs["GID_MIN"], defs["GID_MAX"])
+        if uid not in gids and defs["GID_MIN"] <= uid <= defs["GID_MAX"]:
+            # Use the same number for the group if we can.
+            gid = uid
+            pass
+        udefs = getuseradddefs()
+        home = udefs["HOME"] + "/" + name
+        today = str(int(time.time() // 86400))
+        self.passwd.add([name, "x", str(uid), str(gid), "", home,
+                         udefs["SHELL"]])
+        if self.shadow is not None:
+            aging = []
+            for i in ("PASS_MIN_DAYS", "PASS_MAX_DAYS", "PASS_WARN_AGE"):
+                if defs[i] < 0:
+                    aging.append("")
+                else:
+                    aging.append(str(defs[i]))
+                    pass
                 pass
+            self.shadow.add([name, "!", today] + aging + ["", "", ""])
             pass
+        self.group.add([name, "x", str(gid), ""])
+        if self.gshadow is not None:
+            self.gshadow.add([name, "!", "", ""])
+            pass
+        self.make_home(sysbase + home, uid, gid, defs["HOME_MODE"])
         return
 
-    def commit(self, op):
-        if self.user_name is None:
-            raise Exception("User name not set") # Shouldn't be possible
-        self.savepwfile()
-        if self.user_op == "del":
-            self.program_output([userdel, self.user_name])
+    def make_home(self, home, uid, gid, mode):
+        if os.path.exists(home):
+            return
+        skel = sysbase + "/etc/skel"
+        if os.path.isdir(skel):
+            shutil.copytree(skel, home, symlinks=True)
         else:
-            if self.user_op == "add":
-                self.program_output([useradd, "-m"] + useropts +
-                                    [self.user_name])
+            os.makedirs(home)
+            pass
+        self.newhomes.append(home)
+        for (root, dirs, files) in os.walk(home):
+            os.lchown(root, uid, gid)
+            for i in dirs + files:
+                os.lchown(os.path.join(root, i), uid, gid)
                 pass
-            if self.user_password_op == "add":
-                self.program_output([usermod, "-p", self.user_password]
-                                    + useropts + [self.user_name])
+            pass
+        os.chmod(home, mode)
+        return
+
+    def get_user(self, name):
+        p = self.passwd.get(name)
+        if p is None:
+            raise tf.RPCError("application", "invalid-value", "error",
+                              "User " + name + " not present")
+        return p
+
+    def del_user(self, name):
+        p = self.get_user(name)
+        self.passwd.remove(name)
+        if self.shadow is not None:
+            self.shadow.remove(name)
+            pass
+        g = self.group.get(name)
+        if g is not None and g[2] == p[3] and g[3] == "":
+            # The user's own group, nobody else is in it.
+            self.group.remove(name)
+            if self.gshadow is not None:
+                self.gshadow.remove(name)
                 pass
-            for i in self.user_keys:
-                self.savekeyfile()
-                if i.op == "del":
-                    self.program_output([sedcmd, "-i", "/" + i.name + "/d",
-                                         self.keyfile])
-                elif i.op == "add":
-                    # keydata will be none on a change that's not
-                    # changing anything.
-                    if i.keydata is not None:
-                        # First delete the old one.
-                        self.program_output([sedcmd, "-i", "/" + i.name + "/d",
-                                             self.keyfile])
-                        with open(self.keyfile, "a") as f:
-                            f.write(str(i.algorithm) + " "
-                                    + str(i.keydata) + " "
-                                    + str(i.name) + "\n")
-                            pass
-                        pass
+            pass
+        self.group.remove_member(name, 3)
+        if self.gshadow is not None:
+            self.gshadow.remove_member(name, 2)
+            self.gshadow.remove_member(name, 3)
+            pass
+        return
+
+    def set_password(self, name, password):
+        check_password(password)
+        self.get_user(name)
+        if self.shadow is not None and self.shadow.get(name) is not None:
+            self.shadow.set_field(name, 1, password)
+            self.shadow.set_field(name, 2, str(int(time.time() // 86400)))
+        else:
+            self.passwd.set_field(name, 1, password)
+            pass
+        return
+
+    def set_keys(self, name, keys):
+        p = self.get_user(name)
+        k = AuthKeys(sysbase + p[5], int(p[2]), int(p[3]))
+        k.load()
+        for i in keys:
+            if i.op == "del":
+                k.remove(i.name)
+            elif i.op == "add":
+                # keydata will be none on a change that's not
+                # changing anything.
+                if i.keydata is not None:
+                    k.add(str(i.algorithm), str(i.keydata), str(i.name))
                     pass
                 pass
             pass
+        self.keyfiles.append(k)
         return
 
-    def commit_done(self, op):
-        if self.oldkeyfile:
-            self.program_output([rmcmd, "-f", self.keyfile + ".keep"])
+    def apply(self, u):
+        if u.user_name is None:
+            raise Exception("User name not set") # Shouldn't be possible
+        if u.user_op == "del":
+            self.del_user(u.user_name)
+            return
+        if u.user_op == "add":
+            self.add_user(u.user_name)
+            pass
+        if u.user_password_op == "add":
+            self.set_password(u.user_name, u.user_password)
+            pass
+        if u.user_keys:
+            self.set_keys(u.user_name, u.user_keys)
+            pass
+        return
+
+    def write(self):
+        for k in self.keyfiles:
+            k.write()
+            pass
+        if enable_user_update:
+            for f in self.files:
+                f.write()
+                pass
+            self.files_changed()
+            pass
+        return
+
+    def files_changed(self):
+        if self.passwd.changed or self.group.changed:
+            nscd_invalidate()
+            pass
+        return
+
+    def restore(self):
+        for k in reversed(self.keyfiles):
+            try:
+                k.restore()
+            except:
+                pass
+            pass
+        for f in self.files:
+            try:
+                f.restore()
+            except:
+                pass
+            pass
+        self.files_changed()
+        for h in self.newhomes:
+            shutil.rmtree(h, ignore_errors=True)
+            pass
+        return
+
+    pass
+
+class UsersHandler(tf.YangElemCommitOnly):
+    """Handles the commit for all the users in the transaction.  The
+    op value is a list of UserData objects.
+
+    """
+    def commit(self, op):
+        c = UserCommit()
+        # Keep anything else from changing the files between reading
+        # and writing them.
+        with PwLock():
+            op.oldvalue = c
+            c.load()
+            for u in op.value:
+                c.apply(u)
+                pass
+            c.write()
+            pass
         return
 
     def revert(self, op):
-        if self.oldkeyfile:
-            if self.oldkeyempty:
-                self.program_output([rmcmd, self.keyfile])
-            else:
-                self.program_output([mvcmd, "-f", self.keyfile + ".keep",
-                                     self.keyfile])
+        if op.oldvalue is not None:
+            with PwLock():
+                op.oldvalue.restore()
                 pass
             pass
         return
 
-    def user_exists(self):
-        try:
-            getpwentry(self.user_name)
-        except:
-            return False
-        return True
+    pass
+
+usershandler = UsersHandler("users")
 
 # /system/authentication/user/name
 class UserName(tf.YangElemValidateOnly):
     def validate_add(self, data, xml):
         data.userCurrU.user_name = xml.get_body()
-        if data.userCurrU.user_op == "add" and data.userCurrU.user_exists():
-            raise tf.RPCError("application", "invalid-value", "error",
-                              "User " + data.userCurrU.user_name +
-                              " already exists")
+        if data.userCurrU.user_op == "add":
+            check_user_name(data.userCurrU.user_name)
+            if data.userCurrU.user_exists():
+                raise tf.RPCError("application", "invalid-value", "error",
+                                  "User " + data.userCurrU.user_name +
+                                  " already exists")
+            pass
         return
 
     def validate_del(self, data, xml):
@@ -903,6 +1489,7 @@ class UserPassword(tf.YangElemValidateOnly):
         v = xml.get_body()
         if v == "x":
             return
+        check_password(v)
         data.userCurrU.user_password = v
         return
 
@@ -1009,13 +1596,6 @@ class UserAuthkey(tf.YangElem):
         self.validate_add(data, newxml)
         return
 
-    def fetch_index(self, indexname, index, vdata):
-        for i in self.fetch_full_index(vdata):
-            if i[2] == index:
-                return i
-            pass
-        return None
-
     def fetch_full_index(self, vdata):
         try:
             with open(vdata[5] + "/.ssh/authorized_keys", "r") as f:
@@ -1037,9 +1617,13 @@ class UserAuthkey(tf.YangElem):
 # /system/authentication/user
 class User(tf.YangElem):
     def start(self, data, op):
-        data.userCurrU = UserData("user", data)
+        data.userCurrU = UserData()
         data.userCurrU.user_op = op
-        data.add_op(data.userCurrU, "user", data.userCurrU, priv=True)
+        # All the users are done in one operation, so the password
+        # files are only read and written once.
+        data.add_op(usershandler, "users", [data.userCurrU], priv=True,
+                    resources=["passwd"], key="users",
+                    merge=lambda old, new : old + new)
         return
 
     def validate_add(self, data, xml):
@@ -1063,9 +1647,6 @@ class User(tf.YangElem):
         super().validate(data, origxml, newxml)
         return
 
-    def fetch_index(self, indexname, index, vdata):
-        return getpwentry(index)
-
     def fetch_full_index(self, vdata):
         return getpwentryall()
 
@@ -1131,6 +1712,8 @@ class NTPData(tf.YangElemCommitOnly):
                 print("    prefer: " + str(i.prefer))
                 pass
             pass
+        # The removes don't depend on each other, run them all at once.
+        runner = tf.ProgRunner()
         for i in self.servers:
             if i.op == "add" or i.op == "change":
                 with open(chronydir + "/sources.d/" + i.name + ".sources", "w") as f:
@@ -1146,9 +1729,9 @@ class NTPData(tf.YangElemCommitOnly):
                     pass
                 if i.certificate is None:
                     # No certificate, delete it.
-                    self.program_output([rmcmd, "-f",
-                                         (chronydir + "/ntstrustedcerts/" +
-                                          i.name + ".crt")])
+                    runner.submit([rmcmd, "-f",
+                                   (chronydir + "/ntstrustedcerts/" +
+                                    i.name + ".crt")])
                 elif i.certificate != "x":
                     # A certificate with contents "x" is invalid, we use that
                     # to mark that the certificate was just fetched and then
@@ -1159,14 +1742,15 @@ class NTPData(tf.YangElemCommitOnly):
                     pass
                 pass
             else:
-                self.program_output([rmcmd, "-f",
-                                     (chronydir + "/sources.d/" + i.name +
-                                      ".sources")])
-                self.program_output([rmcmd, "-f",
-                                     (chronydir + "/ntstrustedcerts/" +
-                                      i.name + ".crt")])
+                runner.submit([rmcmd, "-f",
+                               (chronydir + "/sources.d/" + i.name +
+                                ".sources")])
+                runner.submit([rmcmd, "-f",
+                               (chronydir + "/ntstrustedcerts/" +
+                                i.name + ".crt")])
                 pass
             pass
+        runner.collect()
         return
 
     def revert(self, op):
@@ -1478,14 +2062,6 @@ class NTPServer(tf.YangElem):
             pass
         return servers
 
-    def fetch_index(self, indexname, index, vdata):
-        servers = self.read_chrony_data()
-        for i in servers:
-            if i.name == index:
-                return i
-            pass
-        return None
-
     def fetch_full_index(self, vdata):
         return self.read_chrony_data()
 
@@ -1500,7 +2076,7 @@ class NTP(tf.YangElem):
         self.program_output([rmcmd, "-rf", chronydir + ".old"])
         self.program_output([cpcmd, "-a", chronydir, chronydir + ".old"])
         v = NTPData("ntp")
-        new_op = data.add_op(v, "ntp", v)
+        new_op = data.add_op(v, "ntp", v, resources=["ntp"])
         data.userNTP = v
         return
 
@@ -1526,8 +2102,10 @@ class NTP(tf.YangElem):
     pass
 
 # /system-state/platform/*
+# The system-state leaves each run a program, they use the asyncio
+# methods so the programs run at the same time.
 class SystemStatePlatform(tf.YangElemValueOnly):
-    def getvalue(self, data, vdata=None):
+    async def agetvalue(self, data, vdata=None):
         if self.name == "os-name":
             opt = "-s"
         elif self.name == "os-release":
@@ -1538,21 +2116,28 @@ class SystemStatePlatform(tf.YangElemValueOnly):
             opt = "-m"
         else:
             raise Exception("Internal error getting uname")
-        return self.program_output(["/bin/uname", opt]).strip()
+        return (await data.afetch("uname " + opt,
+                lambda : self.aprogram_output(["/bin/uname", opt]),
+                paths = [])).strip()
 
     pass
 
 # /system-state/clock/*
 class SystemStateClock(tf.YangElemValueOnly):
-    def getvalue(self, data, vdata=None):
-        date = self.program_output([datecmd, "--rfc-3339=seconds"]).strip()
+    async def agetvalue(self, data, vdata=None):
+        # Both clock values need the current date, only fetch it once.
+        # The timezone affects the output.
+        date = (await data.afetch("date", lambda : self.aprogram_output(
+            [datecmd, "--rfc-3339=seconds"]), paths = ["/system/clock"])).strip()
         date = date.split(" ")
         if len(date) < 2:
             raise Exception("Invalid date output: " + str(date))
         date = date[0] + "T" + date[1]
 
         if self.name == "boot-datetime":
-            bdate = shlex.split(self.program_output(["uptime","-s"]))
+            bdate = shlex.split(await data.afetch("uptime -s",
+                lambda : self.aprogram_output(["uptime","-s"]),
+                paths = ["/system/clock"]))
             if len(bdate) < 2:
                 raise Exception("Invalid uptime -s output: " + str(bdate))
             # Steal the time zone from the main date.
@@ -1584,7 +2169,8 @@ s.add_map("/system", NTP("ntp", tf.YangType.CONTAINER))
 s.add_leaf("/system/ntp",
            NTPEnabled("enabled", tf.YangType.LEAF))
 s.add_map("/system/ntp",
-          NTPServer("server", tf.YangType.LIST, validate_all = True))
+          NTPServer("server", tf.YangType.LIST, validate_all = True,
+                    indexkey = lambda x : x.name))
 
 s.add_leaf("/system/ntp/server",
            NTPServerName("name", tf.YangType.LEAF))
@@ -1621,13 +2207,14 @@ s.add_leaf("/system/authentication",
            tf.YangElemConfigOnly("user-authentication-order",
                                  etype = tf.YangType.LEAFLIST))
 s.add_map("/system/authentication",
-          User("user", tf.YangType.LIST, validate_all=True))
+          User("user", tf.YangType.LIST, validate_all=True, indexkey=0))
 s.add_leaf("/system/authentication/user",
            UserName("name", tf.YangType.LEAF))
 s.add_leaf("/system/authentication/user",
            UserPassword("password", tf.YangType.LEAF))
 s.add_map("/system/authentication/user",
-           UserAuthkey("authorized-key", tf.YangType.LIST, validate_all=True))
+           UserAuthkey("authorized-key", tf.YangType.LIST, validate_all=True,
+                       indexkey=2))
 s.add_leaf("/system/authentication/user/authorized-key",
            UserAuthkeyName("name", tf.YangType.LEAF))
 s.add_leaf("/system/authentication/user/authorized-key",
@@ -1639,7 +2226,8 @@ s.add_map("/system",
           DNSResolver("dns-resolver", tf.YangType.CONTAINER,
                       validate_all = True))
 s.add_leaf("/system/dns-resolver",
-           DNSSearch("search", tf.YangType.LEAFLIST, validate_all=True))
+           DNSSearch("search", tf.YangType.LEAFLIST, validate_all=True,
+                     indexkey=lambda x : x))
 s.add_leaf("/system/dns-resolver",
            DNSServerCertificate("certificate", tf.YangType.LEAF,
                                 namespace=MY_NAMESPACE))
@@ -1654,7 +2242,8 @@ s.add_leaf("/system/dns-resolver/options",
            DNSUseVC("use-vc", tf.YangType.LEAF, namespace=MY_NAMESPACE))
 
 s.add_map("/system/dns-resolver",
-          DNSServer("server", tf.YangType.LIST, validate_all=True))
+          DNSServer("server", tf.YangType.LIST, validate_all=True,
+                    indexkey="name"))
 s.add_leaf("/system/dns-resolver/server",
            DNSServerName("name", tf.YangType.LEAF))
 s.add_map("/system/dns-resolver/server",
@@ -1697,7 +2286,7 @@ s.add_leaf("/system-state/clock",
            SystemStateClock("boot-datetime", tf.YangType.LEAF))
 del s
 
-class Handler(tf.TopElemHandler, tf.ProgOut):
+class Handler(tf.AsyncTopElemHandler, tf.ProgOut):
     def exit(self):
         self.p = None # Break circular dependency
         return 0;
@@ -1709,32 +2298,9 @@ class Handler(tf.TopElemHandler, tf.ProgOut):
         data = t.get_userdata()
         data.userDNSOp = None # Replaced when DNS operations are done.
         data.userCurrU = None # Replaced by user operations
-        data.oldpwfile = False # Are the old pw/shadow files set
         data.userNTP = None # Replaced by NTP operations
         return 0
 
-    # The password file is saved if a user modification is done.  This is
-    # done once for all users, so we have to wait until the very end to
-    # delete the backup password file.
-    def end(self, t):
-        data = t.get_userdata()
-        if data.oldpwfile:
-            self.program_output([rmcmd, "-f", passwdfile + ".keep"])
-            if have_shadow:
-                self.program_output([rmcmd, "-f", shadowfile + ".keep"])
-        return 0
-
-    # If we failed, revert the password file from the backup.
-    def abort(self, t):
-        data = t.get_userdata()
-        if data.oldpwfile:
-            self.program_output([mvcmd, "-f", passwdfile + ".keep",
-                                 passwdfile])
-            if have_shadow:
-                self.program_output([mvcmd, "-f", shadowfile + ".keep",
-                                     shadowfile])
-        return 0
-
     def system_only(self, nsc, xpath):
         #print("***System_only: %s %s" % (xpath, str(nsc)))
         if xpath == "/":
@@ -1754,8 +2320,15 @@ class Handler(tf.TopElemHandler, tf.ProgOut):
 
     pass
 
-handler = Handler("ietf-system", ietfsystem)
+# The hostname, timezone, DNS, NTP, and user operations don't touch
+# the same things, they can be committed in parallel.
+handler = Handler("ietf-system", ietfsystem, statecache=tf.StateCache(),
+                  priv_batch=True, commit_workers=4)
 handler.p = clixon_beh.add_plugin(handler.name, IETF_SYSTEM_NAMESPACE, handler)
+handler.add_state_prefixes()
+# Our state data only reads from the system, it can run in parallel
+# with other plugins.
+handler.p.set_thread_safe(True)
 
 class SetTimeHandler(tf.RPC):
     def rpc(self, x, username):
@@ -1771,6 +2344,8 @@ class SetTimeHandler(tf.RPC):
             if d is None:
                 raise Exception("current-datetime not in set time rpc")
             self.do_priv(d.get_body())
+            # The cached clock values are now wrong.
+            handler.statecache.invalidate("/system/clock")
             pass
         s += '</rpc-reply>'
         return (0, s)